@@ -1,7 +1,18 @@
-from flask import Flask, jsonify, render_template, request
-from hr_agent_real import run_agent_process, get_list_of_emails, get_sheet_data
+from flask import Flask, Response, jsonify, render_template, request
+from hr_agent_real import run_agent_process, get_list_of_emails, get_sheet_data, get_prometheus_metrics
+from hr_agent_real import process_gmail_notifications, register_gmail_watch, run_all_tenants
+from gmail_push import NotificationDebouncer, decode_pubsub_envelope
+from run_events import RunEventLog
+from run_lock import RunLock
+import profiling
+from tenants import find_tenant_by_email, get_current_tenant, get_tenant, use_tenant
+import hr_agent_real
 import json
 import logging
+import os
+import threading
+import time
+from urllib.parse import urlparse
 
 # Inisialisasi aplikasi Flask
 app = Flask(__name__)
@@ -14,13 +25,105 @@ def home():
     """Endpoint untuk menampilkan halaman HTML."""
     return render_template('index.html')
 
+def _resolve_tenant():
+    """Tenant dari query string `?tenant=<id>`; tenant pertama jika tidak diisi, None jika tidak dikenal."""
+    tenant_id = request.args.get('tenant')
+    return get_tenant(tenant_id) if tenant_id else get_current_tenant()
+
+def _unknown_tenant_response():
+    return jsonify({
+        "status": "error",
+        "message": f"Tenant '{request.args.get('tenant')}' tidak ditemukan."
+    }), 404
+
+# Hanya satu run agen yang boleh aktif sekaligus, juga antar-worker gunicorn (lihat run_lock.py).
+agent_run_lock = RunLock()
+
+def _agent_busy_response():
+    return jsonify({
+        "status": "error",
+        "message": "Agen HRD sedang berjalan. Coba lagi setelah run saat ini selesai."
+    }), 409
+
+# Origin tambahan (dipisahkan koma) yang boleh memulai run, misalnya dashboard di domain lain.
+ALLOWED_ORIGINS = {origin.strip().rstrip('/') for origin in os.getenv("HR_AGENT_ALLOWED_ORIGINS", "").split(',') if origin.strip()}
+
+def _cross_origin_response():
+    """
+    Menolak (403) POST yang memulai run dari halaman situs lain (CSRF). Browser selalu mengirim
+    header Origin pada POST; klien non-browser seperti curl atau cron tidak mengirimnya dan tetap diizinkan.
+    """
+    origin = request.headers.get('Origin')
+    if not origin or origin.rstrip('/') in ALLOWED_ORIGINS or urlparse(origin).netloc == request.host:
+        return None
+    app.logger.warning("Menolak permintaan run dari origin lain: %s", origin)
+    return jsonify({
+        "status": "error",
+        "message": "Permintaan dari origin lain ditolak."
+    }), 403
+
+# Cache singkat untuk /get-emails dan /get-sheet-data agar dashboard yang dibuka banyak orang
+# tidak memanggil Gmail/Sheets API di setiap request. 0 mematikan cache. Setiap entri dikaitkan
+# dengan generasi run (lihat RunLock.generation), sehingga run di worker mana pun membuatnya basi.
+READ_CACHE_TTL_SECONDS = float(os.getenv("READ_CACHE_TTL_SECONDS", 30))
+_read_cache = {}
+_read_cache_lock = threading.Lock()
+
+def _cached_read(name: str, tenant: dict, loader):
+    if READ_CACHE_TTL_SECONDS <= 0:
+        with use_tenant(tenant):
+            return loader()
+    key = (name, tenant['id'])
+    now = time.monotonic()
+    generation = agent_run_lock.generation()
+    with _read_cache_lock:
+        cached = _read_cache.get(key)
+        if cached is not None and cached[1] == generation and now - cached[0] < READ_CACHE_TTL_SECONDS:
+            return cached[2]
+    with use_tenant(tenant):
+        data = loader()
+    if not (isinstance(data, dict) and "error" in data):
+        with _read_cache_lock:
+            _read_cache[key] = (now, generation, data)
+    return data
+
+def _invalidate_read_cache():
+    """
+    Dipanggil setelah run agen, sebelum kunci run dilepas, karena status email dan isi sheet berubah.
+    Generasi run dinaikkan sehingga cache di semua worker gunicorn ikut basi, bukan hanya di worker ini.
+    """
+    agent_run_lock.bump_generation()
+    with _read_cache_lock:
+        _read_cache.clear()
+
 @app.route('/run-hr-agent', methods=['POST'])
 def run_hr_agent_endpoint():
-    """Endpoint API untuk menjalankan agen HRD."""
+    """
+    Endpoint API untuk menjalankan agen HRD.
+    `?tenant=<id>` memilih tenant; `?tenant=all` menjalankan semua tenant secara paralel.
+    `?profile=1` (atau HR_AGENT_PROFILE=true) memprofil run dan menambahkan ringkasan hotspot ke respons.
+    """
+    rejected = _cross_origin_response()
+    if rejected is not None:
+        return rejected
+    if not agent_run_lock.acquire():
+        return _agent_busy_response()
     try:
         app.logger.info("Menerima permintaan untuk menjalankan agen HRD.")
-        output_from_agent_json_string = run_agent_process()
-        
+        profile_run = profiling.is_requested(request.args.get('profile'))
+        if request.args.get('tenant') == 'all':
+            # Setiap tenant diprofil di thread-nya sendiri (lihat _run_agent_for_tenant).
+            output_from_agent_json_string = run_all_tenants(profile=profile_run)
+        else:
+            tenant = _resolve_tenant()
+            if tenant is None:
+                return _unknown_tenant_response()
+            with use_tenant(tenant):
+                if profile_run:
+                    output_from_agent_json_string = profiling.profile_json_call(run_agent_process, label=tenant['id'])
+                else:
+                    output_from_agent_json_string = run_agent_process()
+
         # Mengembalikan respons dengan string JSON dari agen
         return app.response_class(
             response=output_from_agent_json_string,
@@ -34,12 +137,189 @@ def run_hr_agent_endpoint():
             "message": "Terjadi kesalahan saat menjalankan agen.",
             "error_detail": str(e)
         }), 500
+    finally:
+        _invalidate_read_cache()
+        agent_run_lock.release()
+
+# Interval komentar keep-alive SSE agar proxy tidak menutup koneksi saat satu kandidat lama diproses.
+SSE_KEEPALIVE_SECONDS = 15
+
+# Event setiap run stream disimpan per run_id (lihat run_events.py) agar bisa dibaca dari worker mana pun.
+run_event_log = RunEventLog()
+
+def _format_sse(event_type: str, data: dict, event_id: int = None) -> str:
+    event_id_line = f"id: {event_id}\n" if event_id is not None else ""
+    return f"{event_id_line}event: {event_type}\ndata: {json.dumps(data)}\n\n"
+
+@app.route('/run-hr-agent/stream', methods=['POST'])
+def start_hr_agent_stream_endpoint():
+    """
+    Memulai run agen HRD di latar belakang dan langsung mengembalikan 202 berisi `run_id` dan
+    `stream_url`. Progresnya dibaca lewat GET `stream_url` (Server-Sent Events).
+    """
+    rejected = _cross_origin_response()
+    if rejected is not None:
+        return rejected
+    app.logger.info("Menerima permintaan stream untuk menjalankan agen HRD.")
+    profile_run = profiling.is_requested(request.args.get('profile'))
+    tenant = _resolve_tenant()
+    if tenant is None:
+        return _unknown_tenant_response()
+    if not agent_run_lock.acquire():
+        return _agent_busy_response()
+    try:
+        run_id = run_event_log.create()
+    except OSError as e:
+        agent_run_lock.release()
+        app.logger.error("Gagal membuat log event run: %s", str(e), exc_info=True)
+        return jsonify({
+            "status": "error",
+            "message": "Gagal menyiapkan log event run.",
+            "error_detail": str(e)
+        }), 500
+
+    def worker():
+        try:
+            on_event = lambda event_type, data: run_event_log.append(run_id, event_type, data)
+            with use_tenant(tenant):
+                if profile_run:
+                    output = profiling.profile_json_call(run_agent_process, on_event=on_event, label=tenant['id'])
+                else:
+                    output = run_agent_process(on_event=on_event)
+            summary = json.loads(output)
+        except Exception as e:
+            app.logger.error("Error saat menjalankan agen: %s", str(e), exc_info=True)
+            summary = {
+                "status": "error",
+                "message": "Terjadi kesalahan saat menjalankan agen.",
+                "error_detail": str(e)
+            }
+        finally:
+            _invalidate_read_cache()
+            agent_run_lock.release()
+        run_event_log.append(run_id, 'summary', summary)
+
+    # Agen tetap berjalan sampai selesai walaupun tidak ada klien yang membaca stream,
+    # supaya email tidak tertinggal setengah diproses.
+    threading.Thread(target=worker, name="hr-agent-stream", daemon=True).start()
+    return jsonify({
+        "status": "started",
+        "run_id": run_id,
+        "stream_url": f"/run-hr-agent/stream/{run_id}"
+    }), 202
+
+@app.route('/run-hr-agent/stream/<run_id>', methods=['GET'])
+def run_hr_agent_stream_endpoint(run_id):
+    """
+    Endpoint Server-Sent Events untuk run yang dimulai lewat POST /run-hr-agent/stream: mengirim event
+    per kandidat (started, screened, scheduled, rejected, manual_review, error, deferred) segera setelah
+    terjadi, diakhiri event 'summary' berisi JSON yang sama dengan /run-hr-agent (termasuk `profile`
+    jika `?profile=1`). Hanya membaca progres; tidak pernah memulai run. Klien yang tersambung ulang
+    (header Last-Event-ID) melanjutkan dari event berikutnya.
+    """
+    if not run_event_log.exists(run_id):
+        return jsonify({
+            "status": "error",
+            "message": f"Run '{run_id}' tidak ditemukan."
+        }), 404
+    try:
+        after = int(request.headers.get('Last-Event-ID', 0))
+    except ValueError:
+        after = 0
+
+    def generate():
+        for item in run_event_log.follow(run_id, after=after, idle_seconds=SSE_KEEPALIVE_SECONDS):
+            if item is None:
+                yield ": keep-alive\n\n"
+                continue
+            event_id, event_type, data = item
+            yield _format_sse(event_type, data, event_id)
+
+    return Response(generate(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+
+# Token rahasia yang ditambahkan ke URL push subscription (?token=...) agar hanya Pub/Sub yang bisa memicu agen.
+PUBSUB_VERIFICATION_TOKEN = os.getenv("PUBSUB_VERIFICATION_TOKEN")
+
+# Satu debouncer per tenant agar notifikasi dari kotak surat berbeda tidak tercampur dalam satu batch.
+gmail_debouncers = {}
+_gmail_debouncers_lock = threading.Lock()
+
+def _get_gmail_debouncer(tenant: dict) -> NotificationDebouncer:
+    def process_batch(history_id, count):
+        # Menunggu run lain selesai (bukan ditolak) agar notifikasi tidak hilang.
+        agent_run_lock.acquire(blocking=True)
+        try:
+            with use_tenant(tenant):
+                if profiling.is_requested(None):
+                    profiling.profile_call(process_gmail_notifications, history_id, label=f"push_{tenant['id']}")
+                else:
+                    process_gmail_notifications(history_id)
+        finally:
+            _invalidate_read_cache()
+            agent_run_lock.release()
+
+    with _gmail_debouncers_lock:
+        if tenant['id'] not in gmail_debouncers:
+            gmail_debouncers[tenant['id']] = NotificationDebouncer(process_batch)
+        return gmail_debouncers[tenant['id']]
+
+@app.route('/gmail/watch', methods=['POST'])
+def gmail_watch_endpoint():
+    """Mendaftarkan (atau memperbarui) Gmail watch tenant (`?tenant=<id>`) ke topik Pub/Sub."""
+    rejected = _cross_origin_response()
+    if rejected is not None:
+        return rejected
+    tenant = _resolve_tenant()
+    if tenant is None:
+        return _unknown_tenant_response()
+    payload = request.get_json(silent=True) or {}
+    topic_name = payload.get('topic') or os.getenv("GMAIL_PUBSUB_TOPIC")
+    if not topic_name:
+        return jsonify({
+            "status": "error",
+            "message": "Topik Pub/Sub belum diatur. Isi GMAIL_PUBSUB_TOPIC atau kirim {\"topic\": ...}."
+        }), 400
+    with use_tenant(tenant):
+        result = register_gmail_watch(topic_name)
+    if "error" in result:
+        return jsonify(result), 500
+    return jsonify({"status": "success", **result})
+
+@app.route('/gmail/push', methods=['POST'])
+def gmail_push_endpoint():
+    """
+    Endpoint push Pub/Sub untuk notifikasi Gmail. Notifikasi hanya dicatat ke micro-batch lalu
+    langsung dibalas 204 agar Pub/Sub tidak mengirim ulang; pemrosesan berjalan di latar belakang.
+    """
+    if PUBSUB_VERIFICATION_TOKEN and request.args.get('token') != PUBSUB_VERIFICATION_TOKEN:
+        app.logger.warning("Notifikasi Gmail ditolak: token verifikasi tidak cocok.")
+        return jsonify({"status": "error", "message": "Token verifikasi tidak valid."}), 403
+    try:
+        notification = decode_pubsub_envelope(request.get_json(silent=True))
+    except ValueError as e:
+        app.logger.warning("Notifikasi Gmail tidak valid: %s", str(e))
+        return jsonify({"status": "error", "message": str(e)}), 400
+
+    tenant = find_tenant_by_email(notification['email_address'])
+    if tenant is None:
+        # Dibalas 2xx agar Pub/Sub tidak terus mengirim ulang notifikasi yang tidak bisa diproses.
+        app.logger.warning("Notifikasi Gmail untuk kotak surat tak dikenal diabaikan: %s", notification['email_address'])
+        return '', 204
+
+    _get_gmail_debouncer(tenant).add(notification['history_id'], notification['message_id'])
+    return '', 204
 
 @app.route('/get-emails', methods=['GET'])
 def get_emails_endpoint():
     """Endpoint untuk menampilkan daftar email lamaran."""
+    tenant = _resolve_tenant()
+    if tenant is None:
+        return _unknown_tenant_response()
     try:
-        emails = get_list_of_emails()
+        emails = _cached_read('emails', tenant, get_list_of_emails)
         if isinstance(emails, dict) and "error" in emails:
             return jsonify(emails), 500
         return jsonify({
@@ -57,8 +337,11 @@ def get_emails_endpoint():
 @app.route('/get-sheet-data', methods=['GET'])
 def get_sheet_data_endpoint():
     """Endpoint baru untuk menampilkan data dari Google Sheets."""
+    tenant = _resolve_tenant()
+    if tenant is None:
+        return _unknown_tenant_response()
     try:
-        data = get_sheet_data()
+        data = _cached_read('sheet_data', tenant, get_sheet_data)
         if isinstance(data, dict) and "error" in data:
             return jsonify(data), 500
         return jsonify({
@@ -73,6 +356,29 @@ def get_sheet_data_endpoint():
             "error_detail": str(e)
         }), 500
 
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    """Endpoint metrik latensi per tahap dalam format Prometheus."""
+    return app.response_class(
+        response=get_prometheus_metrics(),
+        status=200,
+        mimetype='text/plain; version=0.0.4'
+    )
+
+def reset_worker_state():
+    """
+    Dipanggil di setiap worker setelah fork (gunicorn.conf.py): state yang berisi thread, timer,
+    kunci, atau koneksi dari proses master dibuat ulang agar tidak dibagi antar-worker.
+    """
+    global agent_run_lock, run_event_log, gmail_debouncers, _gmail_debouncers_lock, _read_cache, _read_cache_lock
+    hr_agent_real.reset_worker_state()
+    agent_run_lock = RunLock()
+    run_event_log = RunEventLog()
+    gmail_debouncers = {}
+    _gmail_debouncers_lock = threading.Lock()
+    _read_cache = {}
+    _read_cache_lock = threading.Lock()
+
 # Custom error handler untuk error 500 (Internal Server Error)
 @app.errorhandler(500)
 def internal_server_error(e):
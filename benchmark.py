@@ -0,0 +1,294 @@
+"""
+Benchmark offline untuk pipeline agen HRD.
+
+Menjalankan `run_agent_process` dari awal sampai akhir terhadap Gmail/Calendar/Sheets/Gemini
+palsu (lihat fakes.py) dengan kotak surat sintetis berisi PDF yang dibuat saat itu juga.
+Melaporkan throughput, latensi per tahap (p50/p95/p99), dan jumlah panggilan API, sehingga
+regresi performa bisa terdeteksi tanpa akses jaringan.
+
+Contoh:
+    python benchmark.py                          # 10, 1.000, dan 10.000 lamaran
+    python benchmark.py --sizes 10 100 --api-latency-ms 20 --llm-latency-ms 300
+    python benchmark.py --sizes 1000 --error-rate 0.05 --json hasil_benchmark.json
+    python benchmark.py --sizes 1000 --api-latency-ms 50 --async-prefetch
+    python benchmark.py --sizes 200 --ocr        # resume 'image' di-OCR (butuh Tesseract)
+    python benchmark.py --replay cassette.jsonl --replay-speed 1
+    python benchmark.py --sizes 200 --profile    # artefak pyinstrument/cProfile di profiles/
+    python benchmark.py --check-outbox-workers   # regresi: dua worker berbagi outbox_store.json
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import sys
+import tempfile
+import time
+
+# hr_agent_real mewajibkan API key saat import; benchmark tidak pernah memanggil Gemini sungguhan.
+os.environ.setdefault("GOOGLE_API_KEY", "benchmark-offline")
+
+import cassette
+import fakes
+import hr_agent_real
+import metrics
+import profiling
+import rate_limiter
+from email_progress import EmailProgress
+from outbox import Outbox, render_message
+from tenants import get_current_tenant
+
+
+def _unlimited_rate_limits(backoff_base_seconds: float):
+    """Benchmark mengukur pipeline, bukan kuota Google; limiter dibuka dan backoff dipercepat."""
+    for api, bucket in list(rate_limiter.DEFAULT_LIMITS):
+        rate_limiter.configure_limit(api, bucket, 1e9, 10 ** 9)
+    rate_limiter.BACKOFF_BASE_SECONDS = backoff_base_seconds
+    rate_limiter.BACKOFF_MAX_SECONDS = max(backoff_base_seconds * 8, 0.001)
+
+
+def run_benchmark(size: int, api_latency_ms: float = 0.0, llm_latency_ms: float = 0.0,
+                  error_rate: float = 0.0, llm_error_rate: float = 0.0, seed: int = 0,
+                  backoff_base_seconds: float = 0.001, verbose: bool = False, async_prefetch: bool = False,
+                  ocr_enabled: bool = False, record_path: str = None, profile: bool = False) -> dict:
+    """Menjalankan satu skenario benchmark dan mengembalikan hasilnya sebagai dict."""
+    backend = fakes.FakeGoogleBackend(latency_ms=api_latency_ms, jitter_ms=api_latency_ms / 4,
+                                      error_rate=error_rate, seed=seed)
+    llm = fakes.FakeLLM(latency_ms=llm_latency_ms, jitter_ms=llm_latency_ms / 4,
+                        error_rate=llm_error_rate, seed=seed)
+
+    generation_start = time.perf_counter()
+    fakes.generate_mailbox(backend, size, seed=seed)
+    generation_seconds = time.perf_counter() - generation_start
+
+    _unlimited_rate_limits(backoff_base_seconds)
+    restore = fakes.install(backend, llm)
+    # Lalu lintas palsu bisa direkam ke cassette lalu diputar ulang dengan --replay.
+    restore_cassette = cassette.install('record', record_path) if record_path else None
+    original_prefetch = hr_agent_real.ASYNC_PREFETCH_ENABLED
+    hr_agent_real.ASYNC_PREFETCH_ENABLED = async_prefetch
+    original_ocr = hr_agent_real.OCR_ENABLED
+    hr_agent_real.OCR_ENABLED = ocr_enabled
+    # Outbox dan catatan progres terpisah per skenario: kunci idempotensi dari run sebelumnya
+    # tidak boleh melewatkan email.
+    original_outbox, original_progress = hr_agent_real.outbox, hr_agent_real.progress
+    outbox_dir = tempfile.TemporaryDirectory()
+    hr_agent_real.outbox = Outbox(lambda: hr_agent_real.get_google_services(),
+                                  store_path=os.path.join(outbox_dir.name, "outbox_store.json"))
+    hr_agent_real.progress = EmailProgress(os.path.join(outbox_dir.name, "email_progress.json"))
+    output = io.StringIO()
+    profile_report = None
+    try:
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(sys.stdout if verbose else output):
+            if profile:
+                summary, profile_report = profiling.profile_call(hr_agent_real.run_agent_process,
+                                                                 label=f"benchmark_{size}")
+            else:
+                summary = hr_agent_real.run_agent_process()
+        elapsed = time.perf_counter() - start
+        summary = json.loads(summary)
+    finally:
+        hr_agent_real.ASYNC_PREFETCH_ENABLED = original_prefetch
+        hr_agent_real.OCR_ENABLED = original_ocr
+        hr_agent_real.outbox, hr_agent_real.progress = original_outbox, original_progress
+        outbox_dir.cleanup()
+        if restore_cassette is not None:
+            restore_cassette()
+        restore()
+
+    return {
+        "applications": size,
+        "async_prefetch": async_prefetch,
+        "ocr_enabled": ocr_enabled,
+        "mailbox_generation_seconds": round(generation_seconds, 3),
+        "run_seconds": round(elapsed, 3),
+        "throughput_per_second": round(size / elapsed, 2) if elapsed else None,
+        "summary": {key: summary.get(key) for key in
+                    ("processed_count", "scheduled_count", "rejected_count", "deferred_count", "manual_review_count",
+                     "prescreen",
+                     "outbox")},
+        "stage_metrics": summary.get("stage_metrics"),
+        "api_calls": dict(sorted(backend.api_calls.items())),
+        "injected_errors": dict(backend.injected_errors),
+        "llm_calls": llm.calls,
+        "llm_injected_errors": llm.injected_errors,
+        "emails_sent": len(backend.sent_messages),
+        "events_created": len(backend.calendar_events),
+        "sheet_rows_added": len(backend.sheet_rows) - 1,
+        "profile": profile_report,
+    }
+
+
+def run_replay(path: str, speed: float = 0.0, verbose: bool = False, profile: bool = False) -> dict:
+    """
+    Memutar ulang cassette hasil HR_AGENT_CASSETTE_MODE=record (atau --record) tanpa akses jaringan,
+    sehingga versi pipeline bisa dibandingkan dengan lalu lintas nyata. `speed` 0 berarti tanpa jeda.
+    """
+    _unlimited_rate_limits(0.001)
+    restore = cassette.install('replay', path, speed)
+    output = io.StringIO()
+    started = {"total": 0}
+    on_event = lambda event_type, data: started.update(data) if event_type == 'started' else None
+    profile_report = None
+    try:
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(sys.stdout if verbose else output):
+            if profile:
+                summary, profile_report = profiling.profile_call(hr_agent_real.run_agent_process,
+                                                                 on_event=on_event, label="replay")
+            else:
+                summary = hr_agent_real.run_agent_process(on_event=on_event)
+        elapsed = time.perf_counter() - start
+        summary = json.loads(summary)
+        stats = cassette.get_active().stats()
+    finally:
+        restore()
+
+    return {
+        "applications": started["total"],
+        "replay": path,
+        "replay_speed": speed,
+        "mailbox_generation_seconds": 0.0,
+        "run_seconds": round(elapsed, 3),
+        "throughput_per_second": round(started["total"] / elapsed, 2) if elapsed else None,
+        "summary": {key: summary.get(key) for key in
+                    ("processed_count", "scheduled_count", "rejected_count", "deferred_count", "manual_review_count",
+                     "prescreen",
+                     "outbox")},
+        "stage_metrics": summary.get("stage_metrics"),
+        "api_calls": dict(sorted((endpoint, count) for endpoint, count in stats["calls"].items() if endpoint != 'gemini')),
+        "cassette_misses": stats["misses"],
+        "injected_errors": {},
+        "llm_calls": stats["calls"].get('gemini', 0),
+        "llm_injected_errors": 0,
+        "profile": profile_report,
+    }
+
+
+def check_outbox_workers() -> dict:
+    """
+    Regresi untuk dua worker gunicorn yang memuat outbox_store.json yang sama setelah fork, dengan satu
+    email 'queued' sisa run sebelumnya: worker A melanjutkan dan mengirimnya, lalu worker B melanjutkan.
+    Email itu harus terkirim tepat sekali dan status 'sent' tidak boleh ditimpa salinan basi milik B.
+    """
+    backend = fakes.FakeGoogleBackend()
+    tenant_id = get_current_tenant()['id']
+    key = f"{tenant_id}:leftover-1:rejection"
+    subject, raw = render_message('rejection', 'kandidat@example.com', name='Kandidat')
+    with tempfile.TemporaryDirectory() as store_dir:
+        store_path = os.path.join(store_dir, "outbox_store.json")
+        with open(store_path, 'w', encoding='utf-8') as f:
+            json.dump({key: {"status": "queued", "tenant": tenant_id, "recipient": "kandidat@example.com",
+                             "subject": subject, "raw": raw, "updated_at": "2000-01-01T00:00:00+00:00"}}, f)
+
+        workers = [Outbox(backend.services, store_path=store_path, batch_wait_seconds=0) for _ in range(2)]
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            for worker in workers:
+                worker.resume()
+                worker.flush(timeout=30)
+        with open(store_path, 'r', encoding='utf-8') as f:
+            final_status = json.load(f)[key]['status']
+
+    result = {"emails_sent": len(backend.sent_messages), "final_status": final_status,
+              "ok": len(backend.sent_messages) == 1 and final_status == 'sent'}
+    print(f"\n=== Regresi outbox dua worker: {'OK' if result['ok'] else 'GAGAL'} ===")
+    print(f"Email terkirim      : {result['emails_sent']} (harus 1)")
+    print(f"Status akhir di file: {result['final_status']} (harus sent)")
+    return result
+
+
+def _print_report(result: dict):
+    mode = " (prefetch async)" if result.get('async_prefetch') else ""
+    mode += " (OCR)" if result.get('ocr_enabled') else ""
+    mode += f" (replay {result['replay']})" if result.get('replay') else ""
+    print(f"\n=== {result['applications']} lamaran{mode} ===")
+    print(f"Waktu run           : {result['run_seconds']} detik "
+          f"(pembuatan mailbox {result['mailbox_generation_seconds']} detik)")
+    print(f"Throughput          : {result['throughput_per_second']} lamaran/detik")
+    print(f"Ringkasan           : {result['summary']}")
+    print(f"Panggilan LLM       : {result['llm_calls']} (error disuntikkan: {result['llm_injected_errors']})")
+    if result.get('cassette_misses'):
+        print(f"Tidak ada di cassette: {result['cassette_misses']}")
+    print("Panggilan API       :")
+    for endpoint, count in result['api_calls'].items():
+        print(f"  {endpoint:<28} {count}")
+
+    stage_metrics = result.get("stage_metrics") or {}
+    stages = stage_metrics.get("stages", {})
+    if stages:
+        print(f"Latensi per tahap (ms), tahap dominan: {stage_metrics.get('dominant_stage')}")
+        print(f"  {'tahap':<20} {'count':>7} {'err%':>6} {'p50':>9} {'p95':>9} {'p99':>9} {'total':>10}")
+        for name, data in sorted(stages.items(), key=lambda item: -item[1]["total_seconds"]):
+            print(f"  {name:<20} {data['count']:>7} {data['error_rate'] * 100:>6.1f} "
+                  f"{data['p50'] * 1000:>9.2f} {data['p95'] * 1000:>9.2f} {data['p99'] * 1000:>9.2f} "
+                  f"{data['total_seconds'] * 1000:>10.1f}")
+
+    profile_report = result.get("profile")
+    if profile_report:
+        print(f"Profil ({profile_report['profiler']}): {profile_report['html']}")
+        print(f"  {'fungsi':<70} {'panggilan':>9} {'sendiri s':>10} {'kumulatif s':>12}")
+        for hotspot in profile_report["hotspots"]:
+            print(f"  {hotspot['function'][-70:]:<70} {str(hotspot['calls'] or '-'):>9} "
+                  f"{hotspot['self_seconds']:>10.4f} {hotspot['cumulative_seconds']:>12.4f}")
+        print(f"  Waktu sendiri per pustaka: {profile_report['self_seconds_by_library']}")
+
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(description="Benchmark offline pipeline agen HRD.")
+    arg_parser.add_argument("--sizes", type=int, nargs="+", default=[10, 1000, 10000],
+                            help="Jumlah lamaran per skenario (default: 10 1000 10000).")
+    arg_parser.add_argument("--api-latency-ms", type=float, default=0.0, help="Latensi buatan per panggilan Google API.")
+    arg_parser.add_argument("--llm-latency-ms", type=float, default=0.0, help="Latensi buatan per panggilan LLM.")
+    arg_parser.add_argument("--error-rate", type=float, default=0.0, help="Peluang panggilan Google API gagal (429/503).")
+    arg_parser.add_argument("--llm-error-rate", type=float, default=0.0, help="Peluang panggilan LLM gagal (429).")
+    arg_parser.add_argument("--async-prefetch", action="store_true",
+                            help="Unduh email dan lampiran lewat klien asyncio (google_async.py) sebelum diproses.")
+    arg_parser.add_argument("--ocr", action="store_true",
+                            help="Jalankan OCR (Tesseract) untuk resume 'image' tanpa lapisan teks (lihat ocr.py).")
+    arg_parser.add_argument("--record", dest="record_path",
+                            help="Rekam lalu lintas skenario (palsu) ke file cassette, misalnya untuk menguji --replay.")
+    arg_parser.add_argument("--replay", dest="replay_path",
+                            help="Putar ulang file cassette (HR_AGENT_CASSETTE_MODE=record) alih-alih kotak surat sintetis.")
+    arg_parser.add_argument("--replay-speed", type=float, default=0.0,
+                            help="Pembagi latensi rekaman saat replay: 1 = latensi asli, 0 = tanpa jeda (default).")
+    arg_parser.add_argument("--profile", action="store_true",
+                            help="Profil run (pyinstrument, atau cProfile jika tidak terpasang); artefak ditulis ke profiles/.")
+    arg_parser.add_argument("--check-outbox-workers", action="store_true",
+                            help="Hanya jalankan regresi outbox dua worker (email tertunda tidak boleh terkirim ganda).")
+    arg_parser.add_argument("--seed", type=int, default=0)
+    arg_parser.add_argument("--json", dest="json_path", help="Simpan hasil lengkap ke file JSON.")
+    arg_parser.add_argument("--verbose", action="store_true", help="Tampilkan log pipeline.")
+    args = arg_parser.parse_args(argv)
+
+    if args.check_outbox_workers:
+        result = check_outbox_workers()
+        if not result["ok"]:
+            sys.exit(1)
+        return [result]
+
+    results = []
+    if args.replay_path:
+        metrics.registry.reset()
+        result = run_replay(args.replay_path, args.replay_speed, verbose=args.verbose, profile=args.profile)
+        _print_report(result)
+        results.append(result)
+    for size in ([] if args.replay_path else args.sizes):
+        metrics.registry.reset()
+        result = run_benchmark(size, args.api_latency_ms, args.llm_latency_ms, args.error_rate,
+                               args.llm_error_rate, args.seed, verbose=args.verbose,
+                               async_prefetch=args.async_prefetch, ocr_enabled=args.ocr,
+                               record_path=args.record_path, profile=args.profile)
+        _print_report(result)
+        results.append(result)
+
+    if args.json_path:
+        with open(args.json_path, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+        print(f"\nHasil disimpan ke {args.json_path}")
+    return results
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,453 @@
+"""
+Mode rekam/putar ulang (record/replay) lalu lintas API agen HRD.
+
+- record: setiap request Gmail/Calendar/Sheets (googleapiclient dan klien async httpx) serta setiap
+  panggilan Gemini dijalankan seperti biasa, lalu respons (atau error-nya) dan latensinya ditulis
+  ke file cassette JSON Lines.
+- replay: tidak ada request sungguhan. Respons diambil dari cassette secara deterministik: per
+  endpoint dan sidik jari argumen (FIFO), atau FIFO per endpoint jika argumennya berbeda (misalnya
+  timeMin kalender). Latensi asli ditiru, dibagi HR_AGENT_REPLAY_SPEED (0 = tanpa jeda). Tidak ada
+  efek samping: email tidak terkirim, kalender dan sheet tidak berubah, status outbox, catatan
+  progres email, dan historyId Gmail tidak disimpan.
+
+Diaktifkan lewat environment:
+    HR_AGENT_CASSETTE_MODE=record|replay
+    HR_AGENT_CASSETTE=cassette.jsonl
+    HR_AGENT_REPLAY_SPEED=1.0
+
+Cassette berisi isi email dan resume kandidat; simpan dan bagikan seperti data produksi.
+"""
+import asyncio
+import collections
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+
+import httplib2
+from googleapiclient.errors import HttpError
+from langchain_core.messages import AIMessage
+from langchain_core.runnables import RunnableLambda
+
+from tenants import get_current_tenant
+
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+
+CASSETTE_MODE = os.getenv("HR_AGENT_CASSETTE_MODE", "off").lower()
+CASSETTE_FILE = os.getenv("HR_AGENT_CASSETTE", "cassette.jsonl")
+REPLAY_SPEED = float(os.getenv("HR_AGENT_REPLAY_SPEED", 1.0))
+
+
+class CassetteMissError(RuntimeError):
+    """Request saat replay yang tidak ada (atau sudah habis) di cassette."""
+
+
+def _fingerprint(*parts) -> str:
+    data = json.dumps(parts, sort_keys=True, default=str, ensure_ascii=False)
+    return hashlib.sha1(data.encode('utf-8')).hexdigest()[:16]
+
+
+def _serialize_error(error: Exception) -> dict:
+    if isinstance(error, HttpError):
+        content = error.content.decode('utf-8', 'replace') if isinstance(error.content, bytes) else str(error.content)
+        retry_after = error.resp.get('retry-after') if hasattr(error.resp, 'get') else None
+        return {"type": "HttpError", "status": int(getattr(error.resp, 'status', 0) or 0),
+                "content": content, "retry_after": retry_after}
+    return {"type": type(error).__name__, "message": str(error)}
+
+
+def _deserialize_error(data: dict) -> Exception:
+    if data.get("type") == "HttpError":
+        headers = {"status": str(data["status"])}
+        if data.get("retry_after"):
+            headers["retry-after"] = data["retry_after"]
+        return HttpError(httplib2.Response(headers), data["content"].encode('utf-8'))
+    # Error lain (timeout, kuota Gemini, dll.) dikenali rate_limiter dari tipe atau pesannya.
+    error_type = {"TimeoutError": TimeoutError, "ConnectionError": ConnectionError}.get(data.get("type"), RuntimeError)
+    return error_type(data.get("message", ""))
+
+
+class Cassette:
+    """File cassette JSON Lines: satu baris per request, {tenant, endpoint, fingerprint, latency, response|error}."""
+
+    def __init__(self, path: str, mode: str, speed: float = 1.0):
+        if mode not in ('record', 'replay'):
+            raise ValueError(f"Mode cassette tidak dikenal: {mode}")
+        self.path = path
+        self.mode = mode
+        self.speed = speed
+        self._lock = threading.Lock()
+        self.calls = collections.Counter()
+        self.misses = collections.Counter()
+        if mode == 'record':
+            self._file = open(path, 'w', encoding='utf-8')
+        else:
+            self._load()
+
+    def _load(self):
+        self._by_fingerprint = collections.defaultdict(collections.deque)
+        self._by_endpoint = collections.defaultdict(collections.deque)
+        self.endpoints = set()
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                entry = json.loads(line)
+                entry["used"] = False
+                self._by_fingerprint[(entry["tenant"], entry["endpoint"], entry["fingerprint"])].append(entry)
+                self._by_endpoint[(entry["tenant"], entry["endpoint"])].append(entry)
+                self.endpoints.add(entry["endpoint"])
+
+    def record(self, endpoint: str, fingerprint: str, latency: float, response=None, error: Exception = None):
+        entry = {"tenant": get_current_tenant()['id'], "endpoint": endpoint, "fingerprint": fingerprint,
+                 "latency": round(latency, 6)}
+        if error is not None:
+            entry["error"] = _serialize_error(error)
+        else:
+            entry["response"] = response
+        line = json.dumps(entry, ensure_ascii=False, default=str)
+        with self._lock:
+            self.calls[endpoint] += 1
+            self._file.write(line + "\n")
+            self._file.flush()
+
+    def _take(self, endpoint: str, fingerprint: str) -> dict:
+        tenant = get_current_tenant()['id']
+        with self._lock:
+            self.calls[endpoint] += 1
+            for queue in (self._by_fingerprint.get((tenant, endpoint, fingerprint)),
+                          self._by_endpoint.get((tenant, endpoint))):
+                while queue:
+                    entry = queue.popleft()
+                    if not entry["used"]:
+                        entry["used"] = True
+                        return entry
+            self.misses[endpoint] += 1
+        raise CassetteMissError(f"Tidak ada rekaman tersisa untuk {endpoint} (tenant {tenant}) di {self.path}.")
+
+    def _delay(self, entry: dict) -> float:
+        return entry.get("latency", 0.0) / self.speed if self.speed > 0 else 0.0
+
+    def play(self, endpoint: str, fingerprint: str):
+        """Mengembalikan respons rekaman (setelah meniru latensinya) atau melempar error rekamannya."""
+        entry = self._take(endpoint, fingerprint)
+        delay = self._delay(entry)
+        if delay:
+            time.sleep(delay)
+        if "error" in entry:
+            raise _deserialize_error(entry["error"])
+        return entry.get("response")
+
+    async def play_async(self, endpoint: str, fingerprint: str) -> dict:
+        entry = self._take(endpoint, fingerprint)
+        delay = self._delay(entry)
+        if delay:
+            await asyncio.sleep(delay)
+        return entry
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"mode": self.mode, "path": self.path, "calls": dict(self.calls), "misses": dict(self.misses)}
+
+    def close(self):
+        if self.mode == 'record' and not self._file.closed:
+            self._file.close()
+
+    # --- Google API (googleapiclient) ---
+
+    def wrap_services(self, services: dict) -> dict:
+        """Membungkus dict layanan dari get_google_services agar setiap request direkam."""
+        return {name: _RecordingResource(service, name, self) for name, service in services.items()}
+
+    def replay_services(self) -> dict:
+        return {name: _ReplayResource(name, self) for name in ('gmail', 'calendar', 'sheets')}
+
+    # --- Klien async (httpx) ---
+
+    def transport(self, inner=None):
+        """Transport httpx untuk AsyncGoogleClient; saat merekam, request diteruskan ke `inner` (default: jaringan)."""
+        if httpx is None:
+            raise RuntimeError("Paket httpx belum terpasang. Jalankan: pip install httpx")
+        return _RecordingTransport(self, inner) if self.mode == 'record' else _ReplayTransport(self)
+
+    # --- Gemini ---
+
+    def wrap_llm(self, llm):
+        def invoke(prompt_value):
+            fingerprint = _fingerprint(_prompt_text(prompt_value))
+            start = time.perf_counter()
+            try:
+                result = llm.invoke(prompt_value)
+            except Exception as e:
+                self.record('gemini', fingerprint, time.perf_counter() - start, error=e)
+                raise
+            self.record('gemini', fingerprint, time.perf_counter() - start,
+                        response={"content": result.content, "usage_metadata": getattr(result, 'usage_metadata', None)})
+            return result
+        return RunnableLambda(invoke)
+
+    def replay_llm(self):
+        def invoke(prompt_value):
+            response = self.play('gemini', _fingerprint(_prompt_text(prompt_value)))
+            return AIMessage(content=response["content"], usage_metadata=response.get("usage_metadata"))
+        return RunnableLambda(invoke)
+
+
+def _prompt_text(prompt_value) -> str:
+    return prompt_value.to_string() if hasattr(prompt_value, 'to_string') else str(prompt_value)
+
+
+class _RecordingRequest:
+    def __init__(self, request, endpoint: str, fingerprint: str, cassette: Cassette):
+        self._request = request
+        self.endpoint = endpoint
+        self.fingerprint = fingerprint
+        self._cassette = cassette
+
+    def execute(self, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            response = self._request.execute(*args, **kwargs)
+        except Exception as e:
+            self._cassette.record(self.endpoint, self.fingerprint, time.perf_counter() - start, error=e)
+            raise
+        self._cassette.record(self.endpoint, self.fingerprint, time.perf_counter() - start, response=response)
+        return response
+
+
+class _RecordingBatch:
+    """Batch request yang merekam waktu batch dan respons setiap sub-request."""
+
+    def __init__(self, batch_factory, endpoint: str, callback, cassette: Cassette):
+        self._callback = callback
+        self._cassette = cassette
+        self._endpoint = endpoint
+        self._requests = {}
+        self._batch = batch_factory(callback=self._on_response)
+
+    def add(self, request, callback=None, request_id=None):
+        request_id = str(len(self._requests) + 1) if request_id is None else request_id
+        self._requests[request_id] = (request, callback or self._callback)
+        self._batch.add(request._request, request_id=request_id)
+
+    def _on_response(self, request_id, response, exception):
+        request, callback = self._requests[request_id]
+        self._cassette.record(request.endpoint, request.fingerprint, 0.0, response=response, error=exception)
+        if callback is not None:
+            callback(request_id, response, exception)
+
+    def execute(self, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return self._batch.execute(*args, **kwargs)
+        finally:
+            self._cassette.record(self._endpoint, _fingerprint(len(self._requests)), time.perf_counter() - start)
+
+
+class _RecordingResource:
+    """Proxy untuk resource googleapiclient (service.users().messages() ...)."""
+
+    def __init__(self, target, name: str, cassette: Cassette):
+        self._target = target
+        self._name = name
+        self._cassette = cassette
+
+    def __getattr__(self, attr):
+        member = getattr(self._target, attr)
+        if not callable(member):
+            return member
+        endpoint = f"{self._name}.{attr}"
+
+        def call(*args, **kwargs):
+            if attr == 'new_batch_http_request':
+                return _RecordingBatch(member, f"{self._name}.batch", kwargs.get('callback', args[0] if args else None),
+                                       self._cassette)
+            result = member(*args, **kwargs)
+            if hasattr(result, 'execute'):
+                return _RecordingRequest(result, endpoint, _fingerprint(args, kwargs), self._cassette)
+            return _RecordingResource(result, endpoint, self._cassette)
+        return call
+
+
+class _ReplayRequest:
+    def __init__(self, endpoint: str, fingerprint: str, cassette: Cassette):
+        self.endpoint = endpoint
+        self.fingerprint = fingerprint
+        self._cassette = cassette
+
+    def execute(self, *args, **kwargs):
+        return self._cassette.play(self.endpoint, self.fingerprint)
+
+
+class _ReplayBatch:
+    def __init__(self, endpoint: str, callback, cassette: Cassette):
+        self._endpoint = endpoint
+        self._callback = callback
+        self._cassette = cassette
+        self._requests = []
+
+    def add(self, request, callback=None, request_id=None):
+        request_id = str(len(self._requests) + 1) if request_id is None else request_id
+        self._requests.append((request_id, request, callback or self._callback))
+
+    def execute(self, *args, **kwargs):
+        self._cassette.play(self._endpoint, _fingerprint(len(self._requests)))
+        for request_id, request, callback in self._requests:
+            try:
+                response, error = request.execute(), None
+            except Exception as e:
+                response, error = None, e
+            if callback is not None:
+                callback(request_id, response, error)
+
+
+class _ReplayResource:
+    """
+    Resource tiruan: rantai pemanggilan yang berakhir di endpoint yang pernah direkam sebagai request
+    mengembalikan request replay; selebihnya dianggap resource perantara (users(), messages(), ...).
+    """
+
+    def __init__(self, name: str, cassette: Cassette):
+        self._name = name
+        self._cassette = cassette
+
+    def __getattr__(self, attr):
+        if attr.startswith('__'):
+            raise AttributeError(attr)
+        endpoint = f"{self._name}.{attr}"
+        if attr == 'execute':
+            raise CassetteMissError(f"Tidak ada rekaman untuk {self._name} di {self._cassette.path}.")
+
+        def call(*args, **kwargs):
+            if attr == 'new_batch_http_request':
+                return _ReplayBatch(f"{self._name}.batch", kwargs.get('callback', args[0] if args else None), self._cassette)
+            if endpoint in self._cassette.endpoints:
+                return _ReplayRequest(endpoint, _fingerprint(args, kwargs), self._cassette)
+            return _ReplayResource(endpoint, self._cassette)
+        return call
+
+
+# Segmen path setelah nama-nama ini adalah ID (email, lampiran, kalender, sheet, range) dan
+# dipindahkan ke sidik jari, sehingga endpoint tetap berupa pola seperti ".../messages/*".
+_HTTP_ID_PARENTS = {'messages', 'attachments', 'calendars', 'spreadsheets', 'values'}
+
+
+def _http_endpoint(request) -> str:
+    segments = request.url.path.split('/')
+    pattern = [('*' if index and segments[index - 1] in _HTTP_ID_PARENTS else segment)
+               for index, segment in enumerate(segments)]
+    return f"http.{request.method} {request.url.host}{'/'.join(pattern)}"
+
+
+def _http_fingerprint(request) -> str:
+    return _fingerprint(request.url.path, request.url.query.decode('utf-8', 'replace'),
+                        request.content.decode('utf-8', 'replace'))
+
+
+if httpx is not None:
+    class _RecordingTransport(httpx.AsyncBaseTransport):
+        """Transport httpx yang meneruskan request ke jaringan lalu merekam responsnya (tanpa header Authorization)."""
+
+        def __init__(self, cassette: Cassette, inner=None):
+            self._cassette = cassette
+            self._inner = inner or httpx.AsyncHTTPTransport()
+
+        async def handle_async_request(self, request):
+            start = time.perf_counter()
+            response = await self._inner.handle_async_request(request)
+            content = await response.aread()
+            await response.aclose()
+            headers = {key: value for key, value in response.headers.items()
+                       if key.lower() in ('content-type', 'retry-after')}
+            self._cassette.record(_http_endpoint(request), _http_fingerprint(request), time.perf_counter() - start,
+                                  response={"status": response.status_code, "headers": headers,
+                                            "body": content.decode('utf-8', 'replace')})
+            return httpx.Response(response.status_code, headers=headers, content=content)
+
+        async def aclose(self):
+            await self._inner.aclose()
+
+    class _ReplayTransport(httpx.AsyncBaseTransport):
+        def __init__(self, cassette: Cassette):
+            self._cassette = cassette
+
+        async def handle_async_request(self, request):
+            try:
+                entry = await self._cassette.play_async(_http_endpoint(request), _http_fingerprint(request))
+            except CassetteMissError as e:
+                return httpx.Response(404, json={"error": {"code": 404, "message": str(e)}})
+            response = entry["response"]
+            return httpx.Response(response["status"], headers=response.get("headers"),
+                                  content=response["body"].encode('utf-8'))
+
+
+def _recording_async_client(client, cassette: Cassette):
+    client.transport = cassette.transport(client.transport)
+    return client
+
+
+class ReplayCredentials:
+    """Kredensial tiruan untuk replay; tidak ada token OAuth yang dibutuhkan."""
+    valid = True
+    expired = False
+    token = "replay"
+
+    def refresh(self, request):
+        pass
+
+
+_active = None
+
+
+def get_active() -> Cassette:
+    """Cassette yang sedang terpasang (None jika mode rekam/putar ulang tidak aktif)."""
+    return _active
+
+
+def install(mode: str = None, path: str = None, speed: float = None):
+    """
+    Memasang cassette ke hr_agent_real (seperti fakes.install). Mengembalikan fungsi untuk memulihkan
+    implementasi aslinya. Dalam mode replay, outbox dan catatan progres email memakai penyimpanan
+    sementara dan historyId Gmail tidak disimpan, sehingga replay tidak mengubah status agen sungguhan.
+    """
+    global _active
+    import google_async
+    import hr_agent_real
+    from email_progress import EmailProgress
+    from outbox import Outbox
+
+    cassette = Cassette(path or CASSETTE_FILE, mode or CASSETTE_MODE, REPLAY_SPEED if speed is None else speed)
+    originals = {name: getattr(hr_agent_real, name) for name in
+                 ('get_google_services', '_get_llm', '_get_async_client', 'outbox', 'progress',
+                  '_save_gmail_watch_state')}
+
+    if cassette.mode == 'record':
+        hr_agent_real.get_google_services = lambda: cassette.wrap_services(originals['get_google_services']())
+        hr_agent_real._get_llm = lambda temperature=0.2: cassette.wrap_llm(originals['_get_llm'](temperature))
+        hr_agent_real._get_async_client = lambda: _recording_async_client(originals['_get_async_client'](), cassette)
+    else:
+        outbox_dir = tempfile.mkdtemp(prefix="hr_agent_replay_")
+        hr_agent_real.get_google_services = cassette.replay_services
+        hr_agent_real._get_llm = lambda temperature=0.2: cassette.replay_llm()
+        hr_agent_real._get_async_client = lambda: google_async.AsyncGoogleClient(
+            ReplayCredentials(), max_concurrency=hr_agent_real.ASYNC_MAX_CONCURRENCY, transport=cassette.transport())
+        hr_agent_real.outbox = Outbox(lambda: hr_agent_real.get_google_services(),
+                                      store_path=os.path.join(outbox_dir, "outbox_store.json"))
+        hr_agent_real.progress = EmailProgress(os.path.join(outbox_dir, "email_progress.json"))
+        hr_agent_real._save_gmail_watch_state = lambda state: None
+    _active = cassette
+    print(f"Mode cassette '{cassette.mode}' aktif: {cassette.path}")
+
+    def restore():
+        global _active
+        for name, value in originals.items():
+            setattr(hr_agent_real, name, value)
+        cassette.close()
+        _active = None
+    return restore
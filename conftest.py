@@ -0,0 +1,7 @@
+"""
+Konfigurasi pytest. hr_agent_real membaca GOOGLE_API_KEY saat diimpor, sehingga nilai palsu diisi
+di sini; pengujian tidak pernah memanggil Gemini atau Google API sungguhan.
+"""
+import os
+
+os.environ["GOOGLE_API_KEY"] = os.environ.get("GOOGLE_API_KEY") or "test-key"
@@ -0,0 +1,79 @@
+"""
+Catatan progres per email lamaran yang belum selesai diproses.
+
+Satu lamaran memicu beberapa efek samping berurutan: event Google Calendar, baris Google Sheets,
+email ke kandidat (lewat outbox yang sudah idempoten), lalu email ditandai sudah dibaca. Jika run
+berhenti di tengah (misalnya kuota Sheets habis dan email ditunda), run berikutnya memproses email yang
+sama lagi. Langkah yang sudah selesai dicatat di file JSON (seperti penyimpanan idempotensi outbox)
+dengan kunci "<tenant>:<email_id>", sehingga run ulang memakai hasil screening dan jadwal yang sama
+dan tidak membuat event atau baris sheet ganda. Catatan dihapus setelah email ditandai sudah dibaca.
+"""
+import datetime
+import json
+import os
+import threading
+
+from tenants import get_current_tenant
+
+
+EMAIL_PROGRESS_FILE = os.getenv("EMAIL_PROGRESS_FILE", "email_progress.json")
+EMAIL_PROGRESS_RETENTION_DAYS = float(os.getenv("EMAIL_PROGRESS_RETENTION_DAYS", 30))
+
+
+class EmailProgress:
+    """
+    Penyimpanan progres per email untuk tenant aktif. Setiap perubahan langsung ditulis ke file
+    (dibaca ulang lebih dulu), sehingga worker gunicorn lain melihat catatan yang sama.
+    """
+
+    def __init__(self, store_path: str = None):
+        self.store_path = store_path or EMAIL_PROGRESS_FILE
+        self._lock = threading.Lock()
+
+    def _load_store(self) -> dict:
+        try:
+            with open(self.store_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except (OSError, json.JSONDecodeError) as e:
+            print(f"Gagal membaca {self.store_path}: {e}")
+            return {}
+
+    def _save_store(self, store: dict):
+        cutoff = (datetime.datetime.now(datetime.timezone.utc)
+                  - datetime.timedelta(days=EMAIL_PROGRESS_RETENTION_DAYS)).isoformat()
+        # Email yang dihapus dari kotak masuk tidak pernah diselesaikan; catatannya dibuang setelah masa simpan.
+        for key in [key for key, entry in store.items() if entry.get('updated_at', '') < cutoff]:
+            del store[key]
+        temp_path = f"{self.store_path}.{os.getpid()}.tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(store, f, indent=2)
+        os.replace(temp_path, self.store_path)
+
+    @staticmethod
+    def _key(email_id: str) -> str:
+        return f"{get_current_tenant()['id']}:{email_id}"
+
+    def get(self, email_id: str) -> dict:
+        """Progres email ini dari run sebelumnya, atau dict kosong."""
+        with self._lock:
+            return dict(self._load_store().get(self._key(email_id)) or {})
+
+    def update(self, email_id: str, **fields) -> dict:
+        """Mencatat langkah yang sudah selesai (misalnya `event=True`) dan langsung menyimpannya."""
+        key = self._key(email_id)
+        with self._lock:
+            store = self._load_store()
+            entry = store.setdefault(key, {})
+            entry.update(fields, updated_at=datetime.datetime.now(datetime.timezone.utc).isoformat())
+            self._save_store(store)
+            return dict(entry)
+
+    def clear(self, email_id: str):
+        """Menghapus catatan email yang sudah selesai (sudah ditandai dibaca)."""
+        key = self._key(email_id)
+        with self._lock:
+            store = self._load_store()
+            if store.pop(key, None) is not None:
+                self._save_store(store)
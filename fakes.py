@@ -0,0 +1,632 @@
+"""
+Pengganti lokal (in-process) untuk Gmail, Google Calendar, Google Sheets, dan Gemini.
+
+Dipakai oleh benchmark.py untuk menjalankan `run_agent_process` dari awal sampai akhir tanpa
+jaringan. Setiap layanan palsu meniru rantai pemanggilan googleapiclient
+(`service.users().messages().list(...).execute()`), bisa diberi latensi buatan dan injeksi
+error (HTTP 429/503 untuk Google, ResourceExhausted untuk Gemini), serta menghitung
+jumlah panggilan per endpoint. `FakePubSubPublisher` mengirim notifikasi push Gmail ke
+endpoint /gmail/push sehingga jalur ingesti berbasis push juga bisa diuji offline.
+"""
+import asyncio
+import base64
+import collections
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+from email import message_from_bytes
+
+import fitz
+import httplib2
+import httpx
+from dateutil import parser
+from googleapiclient.errors import HttpError
+from google.api_core import exceptions as google_exceptions
+from langchain_core.messages import AIMessage
+from langchain_core.runnables import RunnableLambda
+
+
+class FakeRequest:
+    """Request yang baru dijalankan saat `.execute()` dipanggil, seperti googleapiclient.HttpRequest."""
+
+    def __init__(self, backend, endpoint: str, func):
+        self.backend = backend
+        self.endpoint = endpoint
+        self.func = func
+
+    def execute(self, num_retries=0):
+        return self.backend.call(self.endpoint, self.func)
+
+
+class FakeBatchRequest:
+    """
+    Seperti googleapiclient.http.BatchHttpRequest: satu panggilan HTTP untuk banyak request.
+    Setiap sub-request tetap bisa gagal sendiri (429/503) dan hasilnya dikirim ke callback.
+    """
+
+    def __init__(self, backend, callback=None):
+        self.backend = backend
+        self.callback = callback
+        self.requests = []
+
+    def add(self, request, callback=None, request_id=None):
+        request_id = str(len(self.requests) + 1) if request_id is None else request_id
+        self.requests.append((request_id, request, callback or self.callback))
+
+    def execute(self):
+        def run():
+            results = []
+            for request_id, request, callback in self.requests:
+                _, status = self.backend._plan_call(request.endpoint)
+                if status:
+                    resp = httplib2.Response({'status': status, 'retry-after': '0'})
+                    error = HttpError(resp, f'{{"error": {{"code": {status}, "message": "injected"}}}}'.encode('utf-8'))
+                    results.append((callback, request_id, None, error))
+                else:
+                    results.append((callback, request_id, request.func(), None))
+            return results
+
+        for callback, request_id, response, error in self.backend.call('gmail.batch', run):
+            if callback is not None:
+                callback(request_id, response, error)
+
+
+class FakeGoogleBackend:
+    """
+    Status bersama semua layanan Google palsu: kotak surat, kalender, dan isi sheet.
+    `latency_ms` dan `jitter_ms` menambah jeda per panggilan; `error_rate` adalah peluang
+    sebuah panggilan gagal dengan HTTP 429 atau 503.
+    """
+
+    def __init__(self, latency_ms: float = 0.0, jitter_ms: float = 0.0, error_rate: float = 0.0, seed: int = 0):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.lock = threading.RLock()
+        self.api_calls = collections.Counter()
+        self.injected_errors = collections.Counter()
+
+        self.messages = {}
+        self.message_order = []
+        self.attachments = {}
+        self.sent_messages = []
+        self.calendar_events = []
+        self.sheet_rows = [["Nama", "Email", "Jadwal Wawancara", "Status", "Ringkasan Resume"]]
+
+        # Riwayat kotak surat untuk users.history.list: [(historyId, message_id)] per email masuk.
+        self.history_id = 1000
+        self.history = []
+        self.watch_request = None
+
+    def _plan_call(self, endpoint: str) -> tuple:
+        """Mencatat panggilan lalu menentukan (jeda_detik, status_error_atau_None) untuknya."""
+        with self.lock:
+            self.api_calls[endpoint] += 1
+            delay = max(0.0, self.latency_ms + self.random.uniform(-self.jitter_ms, self.jitter_ms)) / 1000
+            fail = self.error_rate > 0 and self.random.random() < self.error_rate
+            status = self.random.choice((429, 503)) if fail else None
+            if fail:
+                self.injected_errors[endpoint] += 1
+        return delay, status
+
+    def call(self, endpoint: str, func):
+        delay, status = self._plan_call(endpoint)
+        if delay:
+            time.sleep(delay)
+        if status:
+            resp = httplib2.Response({'status': status, 'retry-after': '0'})
+            raise HttpError(resp, f'{{"error": {{"code": {status}, "message": "injected"}}}}'.encode('utf-8'))
+        with self.lock:
+            return func()
+
+    async def call_async(self, endpoint: str, func) -> httpx.Response:
+        """Seperti `call`, tetapi jeda memakai asyncio.sleep dan hasilnya berupa respons HTTP."""
+        delay, status = self._plan_call(endpoint)
+        if delay:
+            await asyncio.sleep(delay)
+        if status:
+            return httpx.Response(status, headers={'retry-after': '0'},
+                                  json={"error": {"code": status, "message": "injected"}})
+        try:
+            with self.lock:
+                result = func()
+        except HttpError as err:
+            return httpx.Response(err.resp.status, content=err.content)
+        return httpx.Response(200, json=result) if result != '' else httpx.Response(204)
+
+    def async_transport(self) -> httpx.MockTransport:
+        """
+        Transport httpx yang meneruskan request REST Google (google_async.py) ke layanan palsu ini,
+        sehingga jalur asyncio bisa diuji dan di-benchmark tanpa jaringan.
+        """
+        services = self.services()
+
+        async def handler(request: httpx.Request) -> httpx.Response:
+            path = request.url.path
+            params = request.url.params
+            body = json.loads(request.content) if request.content else None
+            gmail = services['gmail'].users().messages()
+            fake_request = None
+
+            if path.startswith('/gmail/v1/users/me/messages'):
+                parts = path.split('/')[6:]
+                if request.method == 'GET' and not parts:
+                    fake_request = gmail.list(q=params.get('q'), pageToken=params.get('pageToken'),
+                                              maxResults=int(params.get('maxResults', 100)))
+                elif request.method == 'POST' and parts == ['send']:
+                    fake_request = gmail.send(body=body)
+                elif request.method == 'POST' and parts == ['batchModify']:
+                    fake_request = gmail.batchModify(body=body)
+                elif len(parts) == 1:
+                    fake_request = gmail.get(id=parts[0], format=params.get('format', 'full'))
+                elif len(parts) == 3 and parts[1] == 'attachments':
+                    fake_request = gmail.attachments().get(messageId=parts[0], id=parts[2])
+            elif path == '/calendar/v3/freeBusy':
+                fake_request = FakeRequest(self, 'calendar.freebusy', lambda: self._freebusy(body))
+            elif path.startswith('/calendar/v3/calendars/') and path.endswith('/events'):
+                events = services['calendar'].events()
+                if request.method == 'GET':
+                    fake_request = events.list(timeMin=params.get('timeMin'), timeMax=params.get('timeMax'),
+                                               orderBy=params.get('orderBy'))
+                else:
+                    fake_request = events.insert(body=body)
+            elif path.startswith('/v4/spreadsheets/'):
+                spreadsheet_id, _, range_name = path[len('/v4/spreadsheets/'):].partition('/values/')
+                values = services['sheets'].spreadsheets().values()
+                if range_name.endswith(':append'):
+                    fake_request = values.append(spreadsheetId=spreadsheet_id, range=range_name[:-len(':append')],
+                                                 body=body)
+                else:
+                    fake_request = values.get(spreadsheetId=spreadsheet_id, range=range_name)
+
+            if fake_request is None:
+                return httpx.Response(404, json={"error": {"code": 404, "message": f"Tidak dikenal: {path}"}})
+            return await self.call_async(fake_request.endpoint, fake_request.func)
+
+        return httpx.MockTransport(handler)
+
+    def _freebusy(self, body: dict) -> dict:
+        start_bound, end_bound = parser.parse(body['timeMin']), parser.parse(body['timeMax'])
+        busy = [{'start': event['start']['dateTime'], 'end': event['end']['dateTime']}
+                for event in self.calendar_events
+                if parser.parse(event['end']['dateTime']) > start_bound
+                and parser.parse(event['start']['dateTime']) < end_bound]
+        return {'calendars': {item['id']: {'busy': busy} for item in body.get('items', [])}}
+
+    def services(self) -> dict:
+        """Pengganti hasil `get_google_services()`."""
+        return {
+            'gmail': FakeGmailService(self),
+            'calendar': FakeCalendarService(self),
+            'sheets': FakeSheetsService(self),
+        }
+
+    def add_message(self, message_id: str, subject: str, sender: str, body: str, pdf_bytes: bytes = None,
+                    filename: str = 'cv.pdf', unread: bool = True):
+        """
+        Menambahkan satu email (opsional dengan lampiran PDF) ke kotak surat palsu.
+        Mengembalikan historyId baru kotak surat, seperti yang dikirim Gmail lewat notifikasi push.
+        """
+        parts = [{
+            'mimeType': 'text/plain',
+            'filename': '',
+            'body': {'size': len(body), 'data': base64.urlsafe_b64encode(body.encode('utf-8')).decode('ascii')}
+        }]
+        if pdf_bytes is not None:
+            attachment_id = f'att-{message_id}'
+            self.attachments[attachment_id] = base64.urlsafe_b64encode(pdf_bytes).decode('ascii')
+            parts.append({
+                'mimeType': 'application/pdf',
+                'filename': filename,
+                'body': {'attachmentId': attachment_id, 'size': len(pdf_bytes)}
+            })
+
+        with self.lock:
+            self.messages[message_id] = {
+                'id': message_id,
+                'threadId': message_id,
+                'labelIds': ['INBOX', 'UNREAD'] if unread else ['INBOX'],
+                'snippet': body[:200],
+                'payload': {
+                    'mimeType': 'multipart/mixed',
+                    'headers': [{'name': 'Subject', 'value': subject}, {'name': 'From', 'value': sender}],
+                    'parts': parts
+                }
+            }
+            self.message_order.append(message_id)
+            self.history_id += 1
+            self.history.append((self.history_id, message_id))
+            return self.history_id
+
+    def _matches_query(self, message: dict, query: str) -> bool:
+        if 'is:unread' in (query or '') and 'UNREAD' not in message['labelIds']:
+            return False
+        subject_filter = re.search(r'subject:"([^"]+)"', query or '')
+        if subject_filter:
+            subject = next(h['value'] for h in message['payload']['headers'] if h['name'] == 'Subject')
+            if subject_filter.group(1).lower() not in subject.lower():
+                return False
+        return True
+
+
+class _FakeGmailMessages:
+    def __init__(self, backend: FakeGoogleBackend):
+        self.backend = backend
+
+    def list(self, userId='me', q=None, pageToken=None, maxResults=100, labelIds=None):
+        def run():
+            ids = [mid for mid in reversed(self.backend.message_order)
+                   if self.backend._matches_query(self.backend.messages[mid], q)]
+            offset = int(pageToken or 0)
+            page = ids[offset:offset + maxResults]
+            result = {'messages': [{'id': mid, 'threadId': mid} for mid in page], 'resultSizeEstimate': len(ids)}
+            if offset + maxResults < len(ids):
+                result['nextPageToken'] = str(offset + maxResults)
+            if not page:
+                result.pop('messages')
+            return result
+        return FakeRequest(self.backend, 'gmail.messages.list', run)
+
+    def get(self, userId='me', id=None, format='full', metadataHeaders=None):
+        def run():
+            message = self.backend.messages.get(id)
+            if message is None:
+                raise HttpError(httplib2.Response({'status': 404}), b'{"error": {"code": 404, "message": "Not Found"}}')
+            return {**message, 'labelIds': list(message['labelIds'])}
+        return FakeRequest(self.backend, 'gmail.messages.get', run)
+
+    def attachments(self):
+        return _FakeGmailAttachments(self.backend)
+
+    def send(self, userId='me', body=None):
+        def run():
+            raw = base64.urlsafe_b64decode(body['raw'])
+            parsed = message_from_bytes(raw)
+            sent_id = f'sent-{len(self.backend.sent_messages) + 1}'
+            self.backend.sent_messages.append({'id': sent_id, 'to': parsed['to'], 'subject': parsed['subject'],
+                                               'body': parsed.get_payload(decode=True).decode('utf-8', 'replace')})
+            return {'id': sent_id, 'labelIds': ['SENT']}
+        return FakeRequest(self.backend, 'gmail.messages.send', run)
+
+    def batchModify(self, userId='me', body=None):
+        def run():
+            for message_id in body.get('ids', []):
+                message = self.backend.messages.get(message_id)
+                if message is None:
+                    continue
+                labels = [label for label in message['labelIds'] if label not in body.get('removeLabelIds', [])]
+                labels += [label for label in body.get('addLabelIds', []) if label not in labels]
+                message['labelIds'] = labels
+            return ''
+        return FakeRequest(self.backend, 'gmail.messages.batchModify', run)
+
+
+class _FakeGmailAttachments:
+    def __init__(self, backend: FakeGoogleBackend):
+        self.backend = backend
+
+    def get(self, userId='me', messageId=None, id=None):
+        def run():
+            data = self.backend.attachments[id]
+            return {'attachmentId': id, 'size': len(data), 'data': data}
+        return FakeRequest(self.backend, 'gmail.attachments.get', run)
+
+
+class _FakeGmailUsers:
+    def __init__(self, backend: FakeGoogleBackend):
+        self.backend = backend
+
+    def messages(self):
+        return _FakeGmailMessages(self.backend)
+
+    def history(self):
+        return _FakeGmailHistory(self.backend)
+
+    def watch(self, userId='me', body=None):
+        def run():
+            self.backend.watch_request = body
+            expiration = int((time.time() + 7 * 24 * 3600) * 1000)
+            return {'historyId': str(self.backend.history_id), 'expiration': str(expiration)}
+        return FakeRequest(self.backend, 'gmail.users.watch', run)
+
+
+class _FakeGmailHistory:
+    def __init__(self, backend: FakeGoogleBackend):
+        self.backend = backend
+
+    def list(self, userId='me', startHistoryId=None, historyTypes=None, labelId=None, pageToken=None, maxResults=100):
+        def run():
+            records = [(hid, mid) for hid, mid in self.backend.history if hid > int(startHistoryId)]
+            offset = int(pageToken or 0)
+            page = records[offset:offset + maxResults]
+            result = {'historyId': str(self.backend.history_id)}
+            if page:
+                result['history'] = [{
+                    'id': str(hid),
+                    'messagesAdded': [{'message': {'id': mid, 'threadId': mid,
+                                                   'labelIds': list(self.backend.messages[mid]['labelIds'])}}]
+                } for hid, mid in page]
+            if offset + maxResults < len(records):
+                result['nextPageToken'] = str(offset + maxResults)
+            return result
+        return FakeRequest(self.backend, 'gmail.history.list', run)
+
+
+class FakeGmailService:
+    def __init__(self, backend: FakeGoogleBackend):
+        self.backend = backend
+
+    def users(self):
+        return _FakeGmailUsers(self.backend)
+
+    def new_batch_http_request(self, callback=None):
+        return FakeBatchRequest(self.backend, callback)
+
+
+class _FakeCalendarEvents:
+    def __init__(self, backend: FakeGoogleBackend):
+        self.backend = backend
+
+    def list(self, calendarId='primary', timeMin=None, timeMax=None, singleEvents=True, orderBy=None, **kwargs):
+        def run():
+            start_bound = parser.parse(timeMin) if timeMin else None
+            end_bound = parser.parse(timeMax) if timeMax else None
+            items = []
+            for event in self.backend.calendar_events:
+                event_start = parser.parse(event['start']['dateTime'])
+                event_end = parser.parse(event['end']['dateTime'])
+                if (start_bound is None or event_end > start_bound) and (end_bound is None or event_start < end_bound):
+                    items.append(event)
+            if orderBy == 'startTime':
+                items.sort(key=lambda event: parser.parse(event['start']['dateTime']))
+            return {'items': items}
+        return FakeRequest(self.backend, 'calendar.events.list', run)
+
+    def insert(self, calendarId='primary', body=None, **kwargs):
+        def run():
+            event = dict(body, id=f'event-{len(self.backend.calendar_events) + 1}', status='confirmed')
+            self.backend.calendar_events.append(event)
+            return event
+        return FakeRequest(self.backend, 'calendar.events.insert', run)
+
+
+class FakeCalendarService:
+    def __init__(self, backend: FakeGoogleBackend):
+        self.backend = backend
+
+    def events(self):
+        return _FakeCalendarEvents(self.backend)
+
+
+class _FakeSheetValues:
+    def __init__(self, backend: FakeGoogleBackend):
+        self.backend = backend
+
+    def get(self, spreadsheetId=None, range=None):
+        def run():
+            rows = self.backend.sheet_rows
+            if range and range.endswith('A1:E1'):
+                rows = rows[:1]
+            return {'range': range, 'majorDimension': 'ROWS', 'values': [list(row) for row in rows]}
+        return FakeRequest(self.backend, 'sheets.values.get', run)
+
+    def append(self, spreadsheetId=None, range=None, valueInputOption=None, insertDataOption=None, body=None):
+        def run():
+            first_row = len(self.backend.sheet_rows) + 1
+            self.backend.sheet_rows.extend(list(row) for row in body['values'])
+            last_row = len(self.backend.sheet_rows)
+            return {'updates': {'updatedRange': f'Sheet1!A{first_row}:E{last_row}',
+                                'updatedRows': len(body['values'])}}
+        return FakeRequest(self.backend, 'sheets.values.append', run)
+
+
+class _FakeSpreadsheets:
+    def __init__(self, backend: FakeGoogleBackend):
+        self.backend = backend
+
+    def values(self):
+        return _FakeSheetValues(self.backend)
+
+
+class FakeSheetsService:
+    def __init__(self, backend: FakeGoogleBackend):
+        self.backend = backend
+
+    def spreadsheets(self):
+        return _FakeSpreadsheets(self.backend)
+
+
+class FakeCredentials:
+    """Pengganti google.oauth2.credentials.Credentials untuk klien async (tidak pernah kedaluwarsa)."""
+    token = 'fake-access-token'
+    valid = True
+    expired = False
+
+    def refresh(self, request):
+        pass
+
+
+class FakeLLM:
+    """
+    Pengganti Gemini. Jawaban screening ditentukan secara deterministik dari hash prompt,
+    sehingga hasil benchmark bisa diulang. `error_rate` mensimulasikan kuota habis (429).
+    """
+
+    VERDICTS = ('SANGAT_COCOK', 'COCOK', 'KURANG_COCOK')
+
+    def __init__(self, latency_ms: float = 0.0, jitter_ms: float = 0.0, error_rate: float = 0.0, seed: int = 0):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.calls = 0
+        self.injected_errors = 0
+        self.runnable = RunnableLambda(self._respond)
+
+    def _respond(self, prompt_value) -> AIMessage:
+        prompt = prompt_value.to_string() if hasattr(prompt_value, 'to_string') else str(prompt_value)
+        with self.lock:
+            self.calls += 1
+            delay = max(0.0, self.latency_ms + self.random.uniform(-self.jitter_ms, self.jitter_ms)) / 1000
+            fail = self.error_rate > 0 and self.random.random() < self.error_rate
+        if delay:
+            time.sleep(delay)
+        if fail:
+            with self.lock:
+                self.injected_errors += 1
+            raise google_exceptions.ResourceExhausted("429 Resource has been exhausted (e.g. check quota).")
+
+        digest = int(hashlib.sha1(prompt.encode('utf-8')).hexdigest(), 16)
+        if prompt.startswith("Tolong buat ringkasan"):
+            content = ("• Pengalaman Kerja: Data Scientist, 3 tahun, membangun model prediksi.\n"
+                       "• Keterampilan Teknis: Python, SQL, TensorFlow.\n"
+                       "• Pendidikan: S1 Teknik Informatika.")
+        else:
+            role_ids = re.findall(r'^- ID (\S+) \(', prompt, re.MULTILINE)
+            if role_ids:
+                content = "\n".join(f"{role_id}: {self.VERDICTS[(digest >> i) % 3]}" for i, role_id in enumerate(role_ids))
+            else:
+                content = self.VERDICTS[digest % 3]
+
+        input_tokens = max(1, len(prompt) // 4)
+        output_tokens = max(1, len(content) // 4)
+        return AIMessage(content=content, usage_metadata={
+            'input_tokens': input_tokens, 'output_tokens': output_tokens,
+            'total_tokens': input_tokens + output_tokens})
+
+    def get_llm(self, temperature: float = 0.2):
+        """Pengganti `hr_agent_real._get_llm`."""
+        return self.runnable
+
+
+# Profil resume sintetis: (jenis, isi). Jenis 'image' menghasilkan PDF tanpa lapisan teks.
+RESUME_PROFILES = [
+    ('strong', "PENGALAMAN KERJA: Data Scientist di PT Analitika Nusantara (2020-2024), membangun model "
+               "machine learning dan deep learning untuk prediksi churn, pengalaman 4 tahun. "
+               "KETERAMPILAN: Python, SQL, TensorFlow, Pandas, NumPy, Scikit-learn, komunikasi tim. "
+               "PENDIDIKAN: S1 Statistika, Universitas Indonesia (2016-2020), IPK 3.70."),
+    ('partial', "PENGALAMAN KERJA: Data Analyst di PT Retail Maju (2021-2024), membuat dashboard penjualan. "
+                "KETERAMPILAN: Excel, SQL, Tableau. "
+                "PENDIDIKAN: S1 Manajemen, Universitas Gadjah Mada (2017-2021)."),
+    ('unrelated', "PENGALAMAN KERJA: Kepala Dapur di Restoran Rasa Sayang (2015-2024), mengelola menu dan staf dapur. "
+                  "KEAHLIAN: Masakan Nusantara, pastry, manajemen persediaan. "
+                  "PENDIDIKAN: D3 Tata Boga, Politeknik Pariwisata Bandung."),
+    ('image', ""),
+]
+
+FIRST_NAMES = ['Budi', 'Siti', 'Andi', 'Dewi', 'Rizky', 'Putri', 'Agus', 'Maya', 'Fajar', 'Lestari']
+LAST_NAMES = ['Santoso', 'Rahmawati', 'Pratama', 'Wijaya', 'Saputra', 'Kusuma', 'Hidayat', 'Permata']
+
+
+def make_resume_pdf(name: str, email: str, body_text: str, scanned_text: str = None) -> bytes:
+    """
+    Membuat PDF resume satu halaman. Jika body_text kosong, halaman hanya berisi gambar (tanpa teks);
+    dengan `scanned_text`, gambar itu adalah hasil render teks tersebut, seperti resume hasil pindaian.
+    """
+    with fitz.open() as doc:
+        page = doc.new_page()
+        if body_text:
+            text = f"Nama: {name}\nEmail: {email}\n\n{body_text}"
+            page.insert_textbox(fitz.Rect(50, 50, 545, 790), text, fontsize=10)
+        elif scanned_text:
+            with fitz.open() as source:
+                source_page = source.new_page()
+                source_page.insert_textbox(fitz.Rect(50, 50, 545, 790),
+                                           f"Nama: {name}\nEmail: {email}\n\n{scanned_text}", fontsize=10)
+                pixmap = source_page.get_pixmap(dpi=150, colorspace=fitz.csGRAY)
+            page.insert_image(page.rect, pixmap=pixmap)
+        else:
+            page.draw_rect(fitz.Rect(50, 50, 545, 300), color=(0, 0, 0), fill=(0.8, 0.8, 0.8))
+        return doc.tobytes()
+
+
+def generate_mailbox(backend: FakeGoogleBackend, size: int, seed: int = 0, no_attachment_ratio: float = 0.02):
+    """
+    Mengisi kotak surat palsu dengan `size` email lamaran belum dibaca, masing-masing dengan PDF unik.
+    Sebagian kecil email sengaja tidak memiliki lampiran.
+    """
+    rng = random.Random(seed)
+    for index in range(size):
+        name = f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}"
+        email = f"{name.lower().replace(' ', '.')}{index}@example.com"
+        kind, body_text = rng.choice(RESUME_PROFILES)
+        subject = "Lamaran Pekerjaan - Data Scientist" if rng.random() < 0.8 else "Lamaran Pekerjaan"
+        # Resume 'image' adalah pindaian resume kuat, agar hasil OCR bisa lolos screening.
+        scanned_text = RESUME_PROFILES[0][1] if kind == 'image' else None
+        pdf_bytes = None if rng.random() < no_attachment_ratio else make_resume_pdf(name, email, body_text, scanned_text)
+        backend.add_message(
+            f"msg{index:06d}", subject, f"{name} <{email}>",
+            f"Dengan hormat, saya {name} ingin melamar posisi Data Scientist. Terlampir CV saya ({kind}).",
+            pdf_bytes
+        )
+
+
+class FakePubSubPublisher:
+    """
+    Pengganti lokal Google Pub/Sub: mengirim envelope push notifikasi Gmail ke endpoint /gmail/push
+    milik aplikasi Flask (lewat `app.test_client()`), persis seperti push subscription sungguhan.
+    """
+
+    def __init__(self, client, backend: FakeGoogleBackend, token: str = None,
+                 email_address: str = 'hrd@example.com', path: str = '/gmail/push'):
+        self.client = client
+        self.backend = backend
+        self.token = token
+        self.email_address = email_address
+        self.path = path
+        self.published = 0
+
+    def publish(self, history_id=None, message_id: str = None):
+        """Mengirim satu notifikasi; history_id bawaan adalah historyId terkini kotak surat palsu."""
+        self.published += 1
+        data = {'emailAddress': self.email_address, 'historyId': int(history_id or self.backend.history_id)}
+        envelope = {
+            'message': {
+                'data': base64.b64encode(json.dumps(data).encode('utf-8')).decode('ascii'),
+                'messageId': message_id or f'pubsub-{self.published}',
+                'publishTime': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime())
+            },
+            'subscription': 'projects/local/subscriptions/gmail-push'
+        }
+        query = {'token': self.token} if self.token else None
+        return self.client.post(self.path, json=envelope, query_string=query)
+
+    def deliver(self, message_id: str, subject: str, sender: str, body: str, pdf_bytes: bytes = None):
+        """Menaruh email baru di kotak surat palsu lalu menerbitkan notifikasinya."""
+        history_id = self.backend.add_message(message_id, subject, sender, body, pdf_bytes)
+        return self.publish(history_id)
+
+
+def install(backend, llm: FakeLLM):
+    """
+    Mengganti layanan Google dan Gemini di hr_agent_real dengan versi palsu.
+    `backend` boleh berupa satu FakeGoogleBackend atau dict {tenant_id: FakeGoogleBackend}
+    untuk menguji beberapa tenant sekaligus.
+    Mengembalikan fungsi untuk memulihkan implementasi aslinya.
+    """
+    import google_async
+    import hr_agent_real
+    from tenants import get_current_tenant
+
+    def current_backend() -> FakeGoogleBackend:
+        return backend[get_current_tenant()['id']] if isinstance(backend, dict) else backend
+
+    original_services = hr_agent_real.get_google_services
+    original_llm = hr_agent_real._get_llm
+    original_async_client = hr_agent_real._get_async_client
+    hr_agent_real.get_google_services = lambda: current_backend().services()
+    hr_agent_real._get_llm = llm.get_llm
+    hr_agent_real._get_async_client = lambda: google_async.AsyncGoogleClient(
+        FakeCredentials(), max_concurrency=hr_agent_real.ASYNC_MAX_CONCURRENCY,
+        transport=current_backend().async_transport())
+
+    def restore():
+        hr_agent_real.get_google_services = original_services
+        hr_agent_real._get_llm = original_llm
+        hr_agent_real._get_async_client = original_async_client
+    return restore
@@ -0,0 +1,124 @@
+"""
+Penerimaan notifikasi push Gmail (users.watch -> Google Pub/Sub -> endpoint HTTP).
+
+Pub/Sub mengirim satu notifikasi untuk setiap perubahan kotak masuk, sering kali beruntun dalam
+hitungan detik. `NotificationDebouncer` mengumpulkan notifikasi yang berdekatan menjadi satu
+micro-batch sehingga agen hanya berjalan sekali untuk semua email yang masuk pada rentang itu.
+"""
+import base64
+import json
+import os
+import threading
+import time
+
+
+# Jeda hening sebelum batch diproses, dan batas maksimal sebuah batch boleh tertahan.
+DEBOUNCE_SECONDS = float(os.getenv("GMAIL_PUSH_DEBOUNCE_SECONDS", 5))
+MAX_BATCH_DELAY_SECONDS = float(os.getenv("GMAIL_PUSH_MAX_BATCH_SECONDS", 30))
+
+
+def decode_pubsub_envelope(envelope: dict) -> dict:
+    """
+    Mengurai envelope push Pub/Sub:
+    {"message": {"data": base64(json({"emailAddress": ..., "historyId": ...})), ...}, "subscription": ...}
+    Mengembalikan {"email_address", "history_id", "message_id"}; ValueError jika formatnya tidak valid.
+    """
+    if not isinstance(envelope, dict) or not isinstance(envelope.get('message'), dict):
+        raise ValueError("Envelope Pub/Sub tidak memiliki field 'message'.")
+    message = envelope['message']
+    try:
+        data = json.loads(base64.b64decode(message.get('data', '')).decode('utf-8'))
+        history_id = str(int(data['historyId']))
+    except (ValueError, TypeError, KeyError) as e:
+        raise ValueError(f"Data notifikasi Gmail tidak valid: {e}")
+    return {
+        "email_address": data.get('emailAddress'),
+        "history_id": history_id,
+        "message_id": message.get('messageId') or message.get('message_id'),
+    }
+
+
+class NotificationDebouncer:
+    """
+    Menggabungkan notifikasi yang datang berdekatan menjadi satu panggilan `callback(history_id, jumlah)`.
+    Batch diproses setelah `delay_seconds` tanpa notifikasi baru, atau paling lambat
+    `max_delay_seconds` sejak notifikasi pertama dalam batch.
+    """
+
+    def __init__(self, callback, delay_seconds: float = None, max_delay_seconds: float = None):
+        self.callback = callback
+        self.delay_seconds = DEBOUNCE_SECONDS if delay_seconds is None else delay_seconds
+        self.max_delay_seconds = MAX_BATCH_DELAY_SECONDS if max_delay_seconds is None else max_delay_seconds
+        self._lock = threading.Lock()
+        self._timer = None
+        self._history_id = None
+        self._count = 0
+        self._first_at = None
+        self._seen_message_ids = set()
+
+    def add(self, history_id: str, message_id: str = None) -> bool:
+        """
+        Menambahkan satu notifikasi ke batch berjalan. Pub/Sub bisa mengirim ulang pesan yang sama;
+        notifikasi dengan message_id yang sudah terlihat diabaikan (mengembalikan False).
+        """
+        with self._lock:
+            if message_id is not None:
+                if message_id in self._seen_message_ids:
+                    return False
+                self._seen_message_ids.add(message_id)
+            if self._history_id is None or int(history_id) > int(self._history_id):
+                self._history_id = history_id
+            self._count += 1
+            now = time.monotonic()
+            if self._first_at is None:
+                self._first_at = now
+            if self._timer is not None:
+                self._timer.cancel()
+            remaining = self.max_delay_seconds - (now - self._first_at)
+            self._timer = threading.Timer(max(0.0, min(self.delay_seconds, remaining)), self._flush)
+            self._timer.daemon = True
+            self._timer.start()
+            return True
+
+    def _take_batch(self) -> tuple:
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+            batch = (self._history_id, self._count)
+            self._timer = None
+            self._history_id = None
+            self._count = 0
+            self._first_at = None
+            # Cukup ingat message_id dari batch terakhir; pengiriman ulang Pub/Sub terjadi dalam hitungan menit.
+            if len(self._seen_message_ids) > 10000:
+                self._seen_message_ids.clear()
+            return batch
+
+    def _flush(self):
+        history_id, count = self._take_batch()
+        if not count:
+            return
+        print(f"Memproses micro-batch {count} notifikasi Gmail (historyId {history_id})...")
+        try:
+            self.callback(history_id, count)
+        except Exception as e:
+            print(f"Gagal memproses micro-batch notifikasi Gmail: {e}")
+            self._requeue(history_id, count)
+
+    def _requeue(self, history_id: str, count: int):
+        """
+        Mengembalikan batch yang gagal ke batch berjalan agar ikut diproses bersama notifikasi berikutnya.
+        Timer tidak dijadwalkan ulang di sini supaya kegagalan yang menetap tidak berulang terus-menerus.
+        """
+        with self._lock:
+            if self._history_id is None or int(history_id) > int(self._history_id):
+                self._history_id = history_id
+            self._count += count
+
+    def flush_now(self):
+        """Memproses batch yang tertunda saat ini juga (dipakai saat shutdown dan pengujian offline)."""
+        self._flush()
+
+    def pending(self) -> int:
+        with self._lock:
+            return self._count
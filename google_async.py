@@ -0,0 +1,210 @@
+"""
+Klien asyncio untuk endpoint REST Google yang dipakai agen HRD (Gmail, Calendar, Sheets).
+
+`googleapiclient` memblokir satu thread per request yang sedang berjalan. Klien ini memakai httpx
+dengan kredensial OAuth yang sama, sehingga ratusan request bisa berjalan bersamaan di satu thread.
+Jumlah request yang sedang berjalan dibatasi semaphore, dan setiap panggilan tetap melewati
+rate limiter bersama (rate_limiter.py) dan pencatatan latensi per tahap (metrics.py).
+
+Respons selain 2xx dilempar sebagai `googleapiclient.errors.HttpError` agar penanganan error
+di pemanggil sama dengan jalur sinkron.
+"""
+import asyncio
+import time
+from urllib.parse import quote
+
+import httplib2
+from googleapiclient.errors import HttpError
+
+import metrics
+from rate_limiter import call_with_backoff_async
+
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+
+GMAIL_BASE_URL = "https://gmail.googleapis.com/gmail/v1/users/me"
+CALENDAR_BASE_URL = "https://www.googleapis.com/calendar/v3"
+SHEETS_BASE_URL = "https://sheets.googleapis.com/v4/spreadsheets"
+
+DEFAULT_MAX_CONCURRENCY = 50
+DEFAULT_TIMEOUT_SECONDS = 30.0
+
+
+def is_available() -> bool:
+    """Klien async hanya bisa dipakai jika paket httpx terpasang."""
+    return httpx is not None
+
+
+class AsyncGoogleClient:
+    """
+    Klien async dengan batas konkurensi. Dipakai sebagai async context manager:
+
+        async with AsyncGoogleClient(creds, max_concurrency=100) as client:
+            messages = await asyncio.gather(*(client.get_message(i) for i in ids))
+    """
+
+    def __init__(self, credentials, max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+                 timeout: float = DEFAULT_TIMEOUT_SECONDS, transport=None):
+        if httpx is None:
+            raise RuntimeError("Paket httpx belum terpasang. Jalankan: pip install httpx")
+        self.credentials = credentials
+        self.max_concurrency = max(1, int(max_concurrency))
+        self.timeout = timeout
+        self.transport = transport
+        self._client = None
+        self._semaphore = None
+        self._refresh_lock = None
+
+    async def __aenter__(self):
+        # Semaphore dan lock harus dibuat di dalam event loop yang akan memakainya.
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        self._refresh_lock = asyncio.Lock()
+        limits = httpx.Limits(max_connections=self.max_concurrency, max_keepalive_connections=self.max_concurrency)
+        self._client = httpx.AsyncClient(timeout=self.timeout, limits=limits, transport=self.transport)
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def _access_token(self, force_refresh: bool = False) -> str:
+        if force_refresh or not self.credentials.valid:
+            async with self._refresh_lock:
+                if force_refresh or not self.credentials.valid:
+                    from google.auth.transport.requests import Request
+                    # Refresh token memakai transport sinkron google-auth; jalankan di thread terpisah.
+                    await asyncio.to_thread(self.credentials.refresh, Request())
+        return self.credentials.token
+
+    async def _send(self, method: str, url: str, params=None, json_body=None):
+        async with self._semaphore:
+            for attempt in range(2):
+                token = await self._access_token(force_refresh=attempt > 0)
+                response = await self._client.request(method, url, params=params, json=json_body,
+                                                      headers={"Authorization": f"Bearer {token}"})
+                # 401 sekali: token mungkin kedaluwarsa di tengah run, refresh lalu ulangi.
+                if response.status_code != 401 or attempt > 0:
+                    break
+
+        if response.status_code >= 400:
+            headers = {"status": str(response.status_code)}
+            if "retry-after" in response.headers:
+                headers["retry-after"] = response.headers["retry-after"]
+            raise HttpError(httplib2.Response(headers), response.content, uri=str(response.url))
+        if not response.content:
+            return {}
+        return response.json()
+
+    async def request(self, api: str, method: str, url: str, params=None, json_body=None,
+                      bucket: str = 'default', stage: str = None):
+        """
+        Menjalankan satu request melalui rate limiter (dengan backoff untuk 429/5xx).
+        Jika `stage` diisi, latensinya dicatat sebagai tahap pipeline.
+        """
+        start = time.perf_counter()
+        error = False
+        try:
+            return await call_with_backoff_async(api, lambda: self._send(method, url, params, json_body), bucket)
+        except BaseException:
+            error = True
+            raise
+        finally:
+            if stage is not None:
+                metrics.record(stage, time.perf_counter() - start, error)
+
+    # --- Gmail ---
+
+    async def list_messages(self, q: str = None, page_token: str = None, max_results: int = 100, stage: str = None):
+        params = {"maxResults": max_results}
+        if q:
+            params["q"] = q
+        if page_token:
+            params["pageToken"] = page_token
+        return await self.request('gmail', 'GET', f"{GMAIL_BASE_URL}/messages", params=params, stage=stage)
+
+    async def list_all_message_ids(self, q: str = None, stage: str = None) -> list:
+        """Mengambil ID semua email yang cocok dengan `q`, mengikuti nextPageToken."""
+        email_ids, page_token = [], None
+        while True:
+            results = await self.list_messages(q, page_token, stage=stage)
+            email_ids.extend(msg['id'] for msg in results.get('messages', []))
+            page_token = results.get('nextPageToken')
+            if not page_token:
+                return email_ids
+
+    async def get_message(self, message_id: str, format: str = 'full', metadata_headers: list = None,
+                          stage: str = None):
+        params = [("format", format)] + [("metadataHeaders", header) for header in metadata_headers or []]
+        return await self.request('gmail', 'GET', f"{GMAIL_BASE_URL}/messages/{quote(message_id, safe='')}",
+                                  params=params, stage=stage)
+
+    async def get_attachment(self, message_id: str, attachment_id: str, stage: str = None):
+        url = f"{GMAIL_BASE_URL}/messages/{quote(message_id, safe='')}/attachments/{quote(attachment_id, safe='')}"
+        return await self.request('gmail', 'GET', url, stage=stage)
+
+    async def send_message(self, raw: str, stage: str = None):
+        """Mengirim email berformat RFC 2822 yang sudah di-encode base64url."""
+        return await self.request('gmail', 'POST', f"{GMAIL_BASE_URL}/messages/send", json_body={"raw": raw},
+                                  bucket='send', stage=stage)
+
+    async def batch_modify(self, ids: list, add_label_ids: list = None, remove_label_ids: list = None,
+                           stage: str = None):
+        body = {"ids": list(ids), "addLabelIds": add_label_ids or [], "removeLabelIds": remove_label_ids or []}
+        return await self.request('gmail', 'POST', f"{GMAIL_BASE_URL}/messages/batchModify", json_body=body,
+                                  stage=stage)
+
+    # --- Google Calendar ---
+
+    async def list_events(self, calendar_id: str = 'primary', time_min: str = None, time_max: str = None,
+                          single_events: bool = True, order_by: str = 'startTime', stage: str = None):
+        params = {"singleEvents": str(single_events).lower()}
+        if order_by:
+            params["orderBy"] = order_by
+        if time_min:
+            params["timeMin"] = time_min
+        if time_max:
+            params["timeMax"] = time_max
+        url = f"{CALENDAR_BASE_URL}/calendars/{quote(calendar_id, safe='')}/events"
+        items, page_token = [], None
+        while True:
+            results = await self.request('calendar', 'GET', url,
+                                         params={**params, **({"pageToken": page_token} if page_token else {})},
+                                         stage=stage)
+            items.extend(results.get('items', []))
+            page_token = results.get('nextPageToken')
+            if not page_token:
+                return {**results, "items": items}
+
+    async def insert_event(self, body: dict, calendar_id: str = 'primary', send_updates: str = None,
+                           stage: str = None):
+        params = {"sendUpdates": send_updates} if send_updates else None
+        url = f"{CALENDAR_BASE_URL}/calendars/{quote(calendar_id, safe='')}/events"
+        return await self.request('calendar', 'POST', url, params=params, json_body=body, stage=stage)
+
+    async def freebusy(self, time_min: str, time_max: str, calendar_ids: list = None, time_zone: str = None,
+                       stage: str = None):
+        body = {"timeMin": time_min, "timeMax": time_max,
+                "items": [{"id": calendar_id} for calendar_id in calendar_ids or ['primary']]}
+        if time_zone:
+            body["timeZone"] = time_zone
+        return await self.request('calendar', 'POST', f"{CALENDAR_BASE_URL}/freeBusy", json_body=body, stage=stage)
+
+    # --- Google Sheets ---
+
+    async def get_values(self, spreadsheet_id: str, range_name: str, stage: str = None):
+        url = f"{SHEETS_BASE_URL}/{quote(spreadsheet_id, safe='')}/values/{quote(range_name, safe='')}"
+        return await self.request('sheets', 'GET', url, stage=stage)
+
+    async def append_values(self, spreadsheet_id: str, range_name: str, values: list,
+                            value_input_option: str = 'USER_ENTERED', insert_data_option: str = 'INSERT_ROWS',
+                            stage: str = None):
+        url = f"{SHEETS_BASE_URL}/{quote(spreadsheet_id, safe='')}/values/{quote(range_name, safe='')}:append"
+        params = {"valueInputOption": value_input_option, "insertDataOption": insert_data_option}
+        return await self.request('sheets', 'POST', url, params=params, json_body={"values": values}, stage=stage)
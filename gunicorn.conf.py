@@ -0,0 +1,44 @@
+"""
+Konfigurasi gunicorn untuk agen HRD: gunicorn -c gunicorn.conf.py wsgi:application
+
+Aplikasi dimuat sekali di master (preload_app) agar impor LangChain/Google tidak diulang di setiap
+worker, lalu state per proses (klien Google, outbox, debouncer push, kunci run, cache baca)
+dibuat ulang di `post_fork`. Run agen dijaga kunci file (run_lock.py), sehingga hanya satu
+worker yang memproses kotak masuk pada satu waktu; worker lain tetap melayani dashboard.
+
+Batas laju di rate_limiter.py berlaku per worker: dengan N worker, bagi RATE_LIMIT_* dengan N
+jika kuota Google/Gemini harus dibagi.
+
+Statistik /metrics juga per worker; agar scrape ke worker mana pun menampilkan total semua worker,
+setiap worker menulis snapshot ke HR_AGENT_METRICS_DIR dan /metrics menjumlahkannya (metrics.py).
+Direktori itu dikosongkan saat master dimulai.
+"""
+import os
+
+# Diisi sebelum aplikasi dimuat (preload_app) agar metrics.py membacanya.
+os.environ.setdefault("HR_AGENT_METRICS_DIR", "metrics_workers")
+
+bind = os.getenv("GUNICORN_BIND", f"0.0.0.0:{os.getenv('PORT', 5000)}")
+workers = int(os.getenv("WEB_CONCURRENCY", 2))
+# Thread dibutuhkan untuk stream SSE (/run-hr-agent/stream/<run_id>) yang terbuka selama satu run.
+worker_class = "gthread"
+threads = int(os.getenv("GUNICORN_THREADS", 8))
+# Satu run agen bisa berlangsung beberapa menit; jangan dibunuh sebagai worker macet.
+timeout = int(os.getenv("GUNICORN_TIMEOUT", 900))
+graceful_timeout = 30
+preload_app = True
+accesslog = "-"
+
+
+def on_starting(server):
+    import metrics
+
+    # Snapshot dari worker gunicorn sebelumnya tidak boleh ikut dijumlahkan.
+    metrics.clear_worker_snapshots()
+
+
+def post_fork(server, worker):
+    import api
+
+    api.reset_worker_state()
+    server.log.info("Worker %s: state agen HRD diinisialisasi ulang setelah fork.", worker.pid)
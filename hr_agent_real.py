@@ -5,6 +5,10 @@ import fitz
 import io
 import json
 import re
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from email.mime.text import MIMEText
 from dateutil import parser 
 
@@ -22,6 +26,21 @@ from langchain.agents import AgentExecutor, create_tool_calling_agent
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.prompts import PromptTemplate
 
+# .env harus dimuat sebelum pengaturan di bawah (dan di modul lokal) dibaca dari environment.
+load_dotenv()
+
+import google_async
+import cassette
+import email_progress
+import metrics
+import ocr
+import profiling
+import tenants
+from outbox import Outbox
+from metrics import stage_timer
+from rate_limiter import RetryableError, call_with_backoff, get_limiter_stats, get_run_limiter_stats, get_tenant_stats
+from tenants import get_current_tenant, use_tenant
+
 
 SCOPES = [
     'https://www.googleapis.com/auth/gmail.readonly',
@@ -31,64 +50,281 @@ SCOPES = [
     'https://www.googleapis.com/auth/gmail.modify'    
 ]
 
-def get_google_services():
+# Kata kunci keterampilan yang dipakai oleh ringkasan fallback dan pra-screening lokal.
+RESUME_SKILL_KEYWORDS = [
+    'python', 'sql', 'machine learning', 'deep learning',
+    'tensorflow', 'pandas', 'numpy', 'scikit'
+]
+_SKILL_KEYWORDS_PATTERN = re.compile('(' + '|'.join(RESUME_SKILL_KEYWORDS) + ')', re.IGNORECASE)
+
+# Kata umum pada deskripsi pekerjaan yang tidak membedakan kandidat.
+_PRESCREEN_STOPWORDS = {
+    'kami', 'mencari', 'dengan', 'yang', 'dan', 'di', 'dalam', 'serta', 'atau', 'untuk',
+    'dari', 'pada', 'ini', 'itu', 'memiliki', 'minimal', 'mahir', 'baik', 'bidang', 'sebagai',
+    'the', 'and', 'with', 'for', 'of', 'in', 'to', 'we', 'are', 'looking', 'is', 'be',
+    'as', 'on', 'at', 'or', 'our', 'you', 'have', 'has', 'least', 'years', 'year'
+}
+
+def _get_float_env(name: str, default: float) -> float:
+    """Membaca angka desimal dari environment, kembali ke default jika tidak valid."""
+    try:
+        return float(os.getenv(name, default))
+    except (TypeError, ValueError):
+        return default
+
+PRESCREEN_ENABLED = os.getenv("PRESCREEN_ENABLED", "true").lower() not in ("0", "false", "no")
+PRESCREEN_REJECT_THRESHOLD = _get_float_env("PRESCREEN_REJECT_THRESHOLD", 0.15)
+
+# Statistik kumulatif pra-screening sejak proses dimulai.
+prescreen_stats = {
+    "auto_rejected": 0,
+    "sent_to_llm": 0,
+    "llm_calls_saved": 0
+}
+# Run tenant yang paralel menambahkan statistiknya ke prescreen_stats di akhir run.
+_prescreen_stats_lock = threading.Lock()
+
+# Lowongan bawaan jika file konfigurasi deskripsi pekerjaan tidak ada.
+DEFAULT_JOB_ROLES = [
+    {
+        "id": "data-scientist",
+        "title": "Data Scientist",
+        "description": "Kami mencari Data Scientist dengan pengalaman minimal 2 tahun di bidang machine learning dan deep learning, mahir dalam Python dan SQL, serta memiliki kemampuan komunikasi yang baik.",
+        "routing_keywords": ["data scientist"]
+    }
+]
+
+def load_job_roles() -> list[dict]:
+    """
+    Memuat daftar lowongan dari file JSON (JOB_DESCRIPTIONS_FILE, default 'job_descriptions.json').
+    Setiap lowongan berisi 'id', 'title', 'description', dan opsional 'routing_keywords'.
+    Kembali ke DEFAULT_JOB_ROLES jika file tidak ada atau tidak valid.
+    """
+    path = get_current_tenant().get('job_descriptions_file') or os.getenv("JOB_DESCRIPTIONS_FILE", "job_descriptions.json")
+    if not os.path.exists(path):
+        return DEFAULT_JOB_ROLES
+
+    try:
+        with open(path, encoding='utf-8') as f:
+            roles = json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"Gagal membaca konfigurasi lowongan {path}: {e}. Menggunakan lowongan bawaan.")
+        return DEFAULT_JOB_ROLES
+
+    valid_roles = []
+    for role in roles if isinstance(roles, list) else []:
+        if isinstance(role, dict) and role.get('id') and role.get('description'):
+            role.setdefault('title', role['id'])
+            role.setdefault('routing_keywords', [role['title']])
+            valid_roles.append(role)
+        else:
+            print(f"Lowongan tidak valid diabaikan: {role}")
+
+    return valid_roles or DEFAULT_JOB_ROLES
+
+def _route_application_to_roles(subject: str, body: str, roles: list[dict]) -> list[dict]:
+    """
+    Menentukan lowongan yang dilamar berdasarkan subjek dan isi email (bagian text/plain yang sudah
+    didekode; snippet Gmail hanya dipakai jika email tidak memiliki bagian teks).
+    Jika tidak ada kata kunci yang cocok, lamaran dinilai terhadap semua lowongan.
+    """
+    text = f"{subject or ''} {body or ''}".lower()
+    matched_roles = [
+        role for role in roles
+        if any(keyword.lower() in text for keyword in role.get('routing_keywords', []))
+    ]
+    return matched_roles or roles
+
+def get_google_credentials():
     """
-    Mengatur otentikasi untuk Google API. 
-    Akan meminta otorisasi browser jika token.json tidak ada atau tidak valid.
+    Mengatur otentikasi untuk Google API milik tenant aktif. 
+    Akan meminta otorisasi browser jika file token tenant (default token.json) tidak ada atau tidak valid.
     """
+    tenant = get_current_tenant()
+    token_file = tenant['token_file']
     creds = None
-    if os.path.exists('token.json'):
-        creds = Credentials.from_authorized_user_file('token.json', SCOPES)
+    if os.path.exists(token_file):
+        creds = Credentials.from_authorized_user_file(token_file, SCOPES)
     if not creds or not creds.valid:
         if creds and creds.expired and creds.refresh_token:
             creds.refresh(Request())
         else:
-            flow = InstalledAppFlow.from_client_secrets_file('credentials.json', SCOPES)
+            print(f"Meminta otorisasi Google untuk tenant '{tenant['id']}'...")
+            flow = InstalledAppFlow.from_client_secrets_file(tenant['credentials_file'], SCOPES)
             creds = flow.run_local_server(port=0)
-        with open('token.json', 'w') as token:
+        with open(token_file, 'w') as token:
             token.write(creds.to_json())
+    return creds
+
+# Klien googleapiclient tidak aman dipakai bersama antar-thread, jadi cache dibuat per thread dan per tenant.
+_service_cache = threading.local()
+
+def get_google_services():
+    """
+    Klien googleapiclient (sinkron) untuk Gmail, Calendar, dan Sheets milik tenant aktif.
+    `build()` (discovery) mahal, sehingga hasilnya di-cache; kredensial diperbarui otomatis saat kedaluwarsa.
+    """
+    tenant_id = get_current_tenant()['id']
+    services_by_tenant = getattr(_service_cache, 'services', None)
+    if services_by_tenant is None:
+        services_by_tenant = _service_cache.services = {}
+    if tenant_id in services_by_tenant:
+        return services_by_tenant[tenant_id]
+
+    creds = get_google_credentials()
     
-    return {
-        'gmail': build('gmail', 'v1', credentials=creds),
-        'calendar': build('calendar', 'v3', credentials=creds),
-        'sheets': build('sheets', 'v4', credentials=creds)
-    }
+    with stage_timer('service_build'):
+        services = {
+            'gmail': build('gmail', 'v1', credentials=creds),
+            'calendar': build('calendar', 'v3', credentials=creds),
+            'sheets': build('sheets', 'v4', credentials=creds)
+        }
+    services_by_tenant[tenant_id] = services
+    return services
+
+def _get_async_client():
+    """Klien asyncio (google_async.py) dengan kredensial OAuth yang sama dengan get_google_services."""
+    return google_async.AsyncGoogleClient(get_google_credentials(), max_concurrency=ASYNC_MAX_CONCURRENCY)
+
+def _execute(request, api: str, bucket: str = 'default', stage: str = None):
+    """
+    Menjalankan request googleapiclient melalui rate limiter bersama.
+    Error kuota/5xx diulang dengan backoff; jika tetap gagal, RetryableError dilempar.
+    Jika `stage` diisi, latensi (termasuk waktu tunggu limiter) dicatat sebagai tahap pipeline.
+    """
+    if stage is None:
+        return call_with_backoff(api, request.execute, bucket)
+    with stage_timer(stage):
+        return call_with_backoff(api, request.execute, bucket)
 
 def _get_new_job_applications_logic() -> list[str]:
     """
     Logika inti untuk mengambil email lamaran pekerjaan baru dari Gmail.
     Email dianggap sebagai lamaran jika subjeknya 'Lamaran Pekerjaan'.
     Hanya mengambil email yang BELUM DIBACA.
-    Mengembalikan daftar ID email yang ditemukan.
+    Mengembalikan daftar ID email yang ditemukan (semua halaman hasil, bukan hanya 100 pertama).
     """
     try:
         service = get_google_services()['gmail']
-        results = service.users().messages().list(userId='me', q='subject:"Lamaran Pekerjaan" is:unread').execute()
-        messages = results.get('messages', [])
-        
-        if not messages:
-            return []
-            
-        email_ids = [msg['id'] for msg in messages]
+        email_ids = []
+        list_kwargs = {'userId': 'me', 'q': 'subject:"Lamaran Pekerjaan" is:unread'}
+        while True:
+            results = _execute(service.users().messages().list(**list_kwargs), 'gmail', stage='list')
+            email_ids.extend(msg['id'] for msg in results.get('messages', []))
+            if not results.get('nextPageToken'):
+                break
+            list_kwargs['pageToken'] = results['nextPageToken']
+
         return email_ids
     except HttpError as err:
         print(f"Error mengambil email: {err.content.decode('utf-8')}")
         return []
 
+def _gmail_watch_state_file() -> str:
+    return get_current_tenant().get('gmail_watch_state_file') or GMAIL_WATCH_STATE_FILE
+
+def _load_gmail_watch_state() -> dict:
+    path = _gmail_watch_state_file()
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+    except (OSError, json.JSONDecodeError) as e:
+        print(f"Gagal membaca {path}: {e}")
+        return {}
+
+def _save_gmail_watch_state(state: dict):
+    with open(_gmail_watch_state_file(), 'w', encoding='utf-8') as f:
+        json.dump(state, f, indent=2)
+
+def register_gmail_watch(topic_name: str) -> dict:
+    """
+    Mendaftarkan `users.watch` agar Gmail mengirim notifikasi Pub/Sub setiap ada perubahan di INBOX.
+    historyId awal disimpan sebagai titik mulai pemrosesan inkremental.
+    Watch kedaluwarsa setelah 7 hari, jadi fungsi ini perlu dipanggil ulang secara berkala (misalnya harian).
+    """
+    try:
+        service = get_google_services()['gmail']
+        response = _execute(service.users().watch(userId='me', body={
+            'topicName': topic_name,
+            'labelIds': ['INBOX'],
+            'labelFilterBehavior': 'include'
+        }), 'gmail')
+        state = _load_gmail_watch_state()
+        state.update({'topic_name': topic_name, 'expiration': response.get('expiration')})
+        # historyId lama dipertahankan agar email yang masuk sebelum watch diperbarui tidak terlewat.
+        state.setdefault('history_id', response.get('historyId'))
+        _save_gmail_watch_state(state)
+        print(f"Gmail watch terdaftar untuk topik {topic_name}, historyId {response.get('historyId')}.")
+        return {"history_id": response.get('historyId'), "expiration": response.get('expiration')}
+    except HttpError as err:
+        error_msg = err.content.decode('utf-8')
+        print(f"Gagal mendaftarkan Gmail watch: {error_msg}")
+        return {"error": f"Gagal mendaftarkan Gmail watch: {error_msg}"}
+
+def _get_new_job_applications_from_history_logic(start_history_id: str) -> tuple:
+    """
+    Logika inti mode push: mengambil email lamaran yang masuk sejak `start_history_id`
+    lewat `users.history.list`, tanpa memindai seluruh kotak masuk.
+    Mengembalikan (daftar_id_email, history_id_terbaru). daftar_id_email bernilai None jika
+    start_history_id sudah terlalu lama (HTTP 404) sehingga pemanggil harus memindai ulang penuh.
+    """
+    service = get_google_services()['gmail']
+    added_ids = []
+    latest_history_id = start_history_id
+    list_kwargs = {'userId': 'me', 'startHistoryId': start_history_id,
+                   'historyTypes': ['messageAdded'], 'labelId': 'INBOX'}
+    try:
+        while True:
+            results = _execute(service.users().history().list(**list_kwargs), 'gmail', stage='history')
+            latest_history_id = results.get('historyId', latest_history_id)
+            for record in results.get('history', []):
+                for added in record.get('messagesAdded', []):
+                    message_id = added['message']['id']
+                    if message_id not in added_ids:
+                        added_ids.append(message_id)
+            if not results.get('nextPageToken'):
+                break
+            list_kwargs['pageToken'] = results['nextPageToken']
+    except HttpError as err:
+        if err.resp.status == 404:
+            print(f"historyId {start_history_id} sudah kedaluwarsa, perlu pemindaian penuh.")
+            return None, latest_history_id
+        raise
+
+    email_ids = []
+    for message_id in added_ids:
+        try:
+            message = _execute(service.users().messages().get(
+                userId='me', id=message_id, format='metadata', metadataHeaders=['Subject']), 'gmail', stage='fetch')
+        except HttpError as err:
+            if err.resp.status == 404:
+                continue  # Email sudah dihapus sebelum sempat diproses.
+            raise
+        headers = message.get('payload', {}).get('headers', [])
+        subject = next((h['value'] for h in headers if h['name'] == 'Subject'), '')
+        if 'UNREAD' in message.get('labelIds', []) and 'lamaran pekerjaan' in subject.lower():
+            email_ids.append(message_id)
+
+    return email_ids, latest_history_id
+
 def _mark_email_as_read_logic(email_id: str) -> str:
     """
     Menandai email dengan ID tertentu sebagai sudah dibaca (read).
     """
     try:
         service = get_google_services()['gmail']
-        service.users().messages().batchModify(
+        _execute(service.users().messages().batchModify(
             userId='me',
             body={
                 'ids': [email_id],
                 'removeLabelIds': ['UNREAD']
             }
-        ).execute()
+        ), 'gmail', stage='mark_read')
         return f"Email {email_id} berhasil ditandai sebagai sudah dibaca."
+    except RetryableError:
+        raise
     except HttpError as err:
         error_msg = err.content.decode('utf-8')
         print(f"Gagal menandai email {email_id} sebagai dibaca: {error_msg}")
@@ -143,21 +379,82 @@ def clean_resume_text(resume_text: str) -> str:
     
     return clean_text.strip()
 
-def _extract_applicant_info_from_email_id_logic(email_id: str) -> dict:
+def _prefetch_applications_logic(email_ids: list) -> dict:
+    """
+    Mengunduh email dan lampiran PDF pertama untuk semua `email_ids` secara bersamaan lewat klien asyncio
+    (maksimal ASYNC_MAX_CONCURRENCY request berjalan sekaligus di satu thread).
+    Mengembalikan {email_id: {'message': ..., 'attachments': {attachment_id: bytes}}}. Email yang gagal
+    diunduh tidak disertakan sehingga jalur sinkron mengambilnya ulang dengan penanganan error biasa.
+    """
+    if not google_async.is_available():
+        print("Prefetch async dilewati: paket httpx belum terpasang.")
+        return {}
+
+    async def fetch_one(client, email_id):
+        message = await client.get_message(email_id, stage='fetch')
+        attachments = {}
+        for part in message.get('payload', {}).get('parts', []):
+            if part.get('mimeType') == 'application/pdf' and part.get('filename'):
+                attachment_id = part['body']['attachmentId']
+                attachment = await client.get_attachment(email_id, attachment_id, stage='attachment_download')
+                attachments[attachment_id] = base64.urlsafe_b64decode(attachment['data'])
+                break
+        return {'message': message, 'attachments': attachments}
+
+    async def fetch_all():
+        async with _get_async_client() as client:
+            results = await asyncio.gather(*(fetch_one(client, email_id) for email_id in email_ids),
+                                           return_exceptions=True)
+        return dict(zip(email_ids, results))
+
+    try:
+        with stage_timer('prefetch'):
+            results = asyncio.run(fetch_all())
+    except RetryableError:
+        raise
+    except Exception as e:
+        print(f"Prefetch async gagal, melanjutkan dengan jalur sinkron: {e}")
+        return {}
+    prefetched = {email_id: data for email_id, data in results.items() if not isinstance(data, BaseException)}
+    if len(prefetched) < len(email_ids):
+        print(f"Prefetch async: {len(email_ids) - len(prefetched)} email gagal diunduh, akan diambil ulang satu per satu.")
+    return prefetched
+
+def _extract_plain_text_body(payload: dict) -> str:
+    """Teks bagian text/plain pertama dari payload Gmail (juga di dalam multipart bertingkat); kosong jika tidak ada."""
+    data = payload.get('body', {}).get('data')
+    if payload.get('mimeType') == 'text/plain' and data and not payload.get('filename'):
+        return base64.urlsafe_b64decode(data).decode('utf-8', 'replace')
+    for part in payload.get('parts', []):
+        text = _extract_plain_text_body(part)
+        if text:
+            return text
+    return ''
+
+def _extract_applicant_info_from_email_id_logic(email_id: str, prefetched: dict = None) -> dict:
     """
     Logika inti untuk mengambil konten dari email, HANYA dari lampiran PDF jika ada, 
     dan mengekstrak info pelamar.
+    `prefetched` opsional berisi email dan lampiran yang sudah diunduh oleh _prefetch_applications_logic.
     """
     try:
-        service = get_google_services()['gmail']
-        msg = service.users().messages().get(userId='me', id=email_id, format='full').execute()
+        service = get_google_services()['gmail'] if prefetched is None else None
+        if prefetched is not None:
+            msg = prefetched['message']
+        else:
+            msg = _execute(service.users().messages().get(userId='me', id=email_id, format='full'), 'gmail', stage='fetch')
         
         resume_text = ""
         payload = msg['payload']
+        headers = payload.get('headers', [])
+        subject = next((h['value'] for h in headers if h['name'] == 'Subject'), '')
+        # Isi email lengkap (untuk routing lowongan); snippet ~200 karakter hanya sebagai cadangan.
+        body_text = _extract_plain_text_body(payload) or msg.get('snippet', '')
         
         print(f"Memproses payload email: {payload.get('mimeType')}")
         
         pdf_found = False
+        pdf_bytes = None
         if 'parts' in payload:
             for part in payload['parts']:
                 mime_type = part.get('mimeType')
@@ -168,29 +465,55 @@ def _extract_applicant_info_from_email_id_logic(email_id: str) -> dict:
                     attachment_id = part['body']['attachmentId']
                     
                     try:
-                        attachment = service.users().messages().attachments().get(
-                            userId='me', messageId=email_id, id=attachment_id).execute()
-                        file_data = base64.urlsafe_b64decode(attachment['data'])
+                        file_data = prefetched['attachments'].get(attachment_id) if prefetched is not None else None
+                        if file_data is None:
+                            service = service or get_google_services()['gmail']
+                            attachment = _execute(service.users().messages().attachments().get(
+                                userId='me', messageId=email_id, id=attachment_id), 'gmail', stage='attachment_download')
+                            file_data = base64.urlsafe_b64decode(attachment['data'])
                         
-                        with fitz.open(stream=file_data, filetype="pdf") as doc:
+                        pdf_bytes = file_data
+                        with stage_timer('pdf_parse'), fitz.open(stream=file_data, filetype="pdf") as doc:
                             for page in doc:
                                 resume_text += page.get_text()
                         
                         print(f"     Ekstraksi PDF berhasil. Panjang teks: {len(resume_text)}")
                         break
+                    except RetryableError:
+                        raise
                     except Exception as pdf_e:
                         print(f"     Gagal mengekstrak teks dari PDF {filename}: {pdf_e}")
                         resume_text = "Gagal mengekstrak teks dari PDF."
         
         if not pdf_found:
             print("     Tidak ada PDF ditemukan. Hanya akan mengekstrak info dari PDF.")
-            return {"name": "Tidak Diketahui", "email": "Tidak Diketahui", "resume_text": "Tidak ada lampiran PDF ditemukan."}
+            return {"name": "Tidak Diketahui", "email": "Tidak Diketahui", "resume_text": "Tidak ada lampiran PDF ditemukan.",
+                    "subject": subject, "body": body_text}
         
         if not resume_text.strip():
             print("Peringatan: Teks resume dari PDF kosong setelah ekstraksi.")
-            return {"name": "Tidak Diketahui", "email": "Tidak Diketahui", "resume_text": "Teks PDF tidak dapat diekstrak atau kosong."}
-        
-        resume_text = clean_resume_text(resume_text)
+            info = {"name": "Tidak Diketahui", "email": "Tidak Diketahui", "resume_text": "Teks PDF tidak dapat diekstrak atau kosong.",
+                    "subject": subject, "body": body_text}
+            if pdf_bytes is not None and OCR_ENABLED:
+                # Kemungkinan PDF hasil pindaian; byte PDF disimpan untuk tahap OCR di run_agent_process.
+                info["pdf_bytes"] = pdf_bytes
+            return info
+
+        return _parse_applicant_info_from_text(resume_text, subject, body_text)
+    except RetryableError:
+        raise
+    except HttpError as err:
+        print(f"Error mengekstrak info dari email {email_id}: {err.content.decode('utf-8')}")
+        return {"name": "Error", "email": "Error", "resume_text": f"Error: {err.content.decode('utf-8')}"}
+    except Exception as e:
+        print(f"Error umum mengekstrak info dari email {email_id}: {e}")
+        return {"name": "Error", "email": "Error", "resume_text": f"Error umum: {str(e)}"}
+
+def _parse_applicant_info_from_text(resume_text: str, subject: str, body: str) -> dict:
+    """Membersihkan teks resume lalu mengekstrak nama dan email pelamar darinya."""
+    try:
+        with stage_timer('clean'):
+            resume_text = clean_resume_text(resume_text)
         
         name_patterns = [
             r'(?:nama|name)[:\s]*([A-Za-z\s]+)(?:\n|$)',
@@ -240,21 +563,176 @@ def _extract_applicant_info_from_email_id_logic(email_id: str) -> dict:
             extracted_name = email_name
 
         print(f"Nama diekstrak dari PDF: '{extracted_name}', Email diekstrak dari PDF: '{extracted_email}'")
-        return {"name": extracted_name, "email": extracted_email, "resume_text": resume_text}
-    except HttpError as err:
-        print(f"Error mengekstrak info dari email {email_id}: {err.content.decode('utf-8')}")
-        return {"name": "Error", "email": "Error", "resume_text": f"Error: {err.content.decode('utf-8')}"}
+        return {"name": extracted_name, "email": extracted_email, "resume_text": resume_text,
+                "subject": subject, "body": body}
     except Exception as e:
-        print(f"Error umum mengekstrak info dari email {email_id}: {e}")
+        print(f"Error umum mengekstrak info pelamar dari teks resume: {e}")
         return {"name": "Error", "email": "Error", "resume_text": f"Error umum: {str(e)}"}
+
+def _submit_ocr_logic(email_id: str, applicant_info: dict):
+    """
+    Mengantrekan OCR untuk PDF tanpa lapisan teks. Mengembalikan Future, atau None jika OCR
+    tidak tersedia sehingga kandidat diperlakukan seperti sebelumnya (PDF kosong).
+    """
+    if not ocr.is_available():
+        print("OCR diaktifkan tetapi Tesseract/tessdata tidak ditemukan; PDF hasil pindaian dilewati.")
+        return None
+    print(f"PDF email {email_id} tidak memiliki teks. OCR dijalankan di latar belakang...")
+    try:
+        return ocr.submit(applicant_info.pop("pdf_bytes"))
+    except Exception as e:
+        print(f"Gagal mengantrekan OCR untuk email {email_id}: {e}")
+        return None
+
+def _finish_ocr_logic(email_id: str, applicant_info: dict, future, submitted_at: float) -> dict:
+    """
+    Menunggu hasil OCR lalu mengekstrak info pelamar dari teksnya. Batas waktu OCR_TIMEOUT_SECONDS
+    berlaku per pekerjaan sejak mulai dijalankan di proses pekerja (lihat ocr.py), sehingga waktu antre
+    tidak ikut dihitung; `submitted_at` (time.monotonic) hanya dipakai untuk mencatat latensi kegagalan.
+    Mengembalikan None jika OCR gagal atau melebihi batas waktu: email dibiarkan belum dibaca dan
+    dicoba lagi pada run berikutnya, bukan ditolak sebagai PDF kosong.
+    """
+    try:
+        result = future.result()
+    except Exception as e:
+        reason = "melebihi batas waktu" if isinstance(e, TimeoutError) else str(e)
+        print(f"OCR gagal untuk email {email_id}: {reason}")
+        metrics.record('ocr', time.monotonic() - submitted_at, True)
+        return None
+
+    metrics.record('ocr', result['seconds'], False)
+    print(f"OCR selesai untuk email {email_id}: {result['pages']} halaman, {len(result['text'])} karakter.")
+    if not result['text'].strip():
+        return applicant_info
+    return _parse_applicant_info_from_text(result['text'], applicant_info.get('subject'), applicant_info.get('body'))
     
-def _summarize_resume_logic(resume_text: str) -> str:
+def _estimate_tokens(text: str) -> int:
+    """Perkiraan kasar jumlah token: sekitar 4 karakter per token."""
+    if not text:
+        return 0
+    return max(1, len(text) // 4)
+
+# Judul bagian resume dan jenisnya. Teks resume sudah dibersihkan menjadi satu baris,
+# jadi judul dikenali dari huruf kapital atau dari tanda titik dua setelahnya.
+_RESUME_SECTION_HEADINGS = {
+    'experience': ['PENGALAMAN KERJA', 'PENGALAMAN', 'RIWAYAT PEKERJAAN', 'WORK EXPERIENCE',
+                   'PROFESSIONAL EXPERIENCE', 'EXPERIENCE'],
+    'skills': ['KETERAMPILAN', 'KEAHLIAN', 'TECHNICAL SKILLS', 'SKILLS', 'SKILL'],
+    'education': ['PENDIDIKAN', 'EDUCATION'],
+    'certifications': ['SERTIFIKASI', 'SERTIFIKAT', 'CERTIFICATIONS', 'CERTIFICATES'],
+    'projects': ['PROYEK', 'PROJECTS'],
+    'languages': ['BAHASA', 'LANGUAGES'],
+    'boilerplate': ['REFERENSI', 'REFERENCES', 'HOBI', 'HOBBIES', 'MINAT', 'INTERESTS',
+                    'PERNYATAAN', 'DECLARATION'],
+}
+_HEADING_TO_SECTION = {
+    heading: section for section, headings in _RESUME_SECTION_HEADINGS.items() for heading in headings
+}
+_HEADING_ALTERNATION = '|'.join(sorted(map(re.escape, _HEADING_TO_SECTION), key=len, reverse=True))
+_UPPERCASE_HEADING_PATTERN = re.compile(r'\b(' + _HEADING_ALTERNATION + r')\b')
+_COLON_HEADING_PATTERN = re.compile(r'\b(' + _HEADING_ALTERNATION + r')\s*:', re.IGNORECASE)
+
+# Urutan prioritas saat anggaran token tidak cukup; bagian 'header' berisi teks sebelum judul pertama.
+_SECTION_PRIORITY = ['experience', 'skills', 'education', 'header', 'certifications', 'projects', 'languages']
+
+PROMPT_TOKEN_BUDGET = int(_get_float_env("PROMPT_TOKEN_BUDGET", 1500))
+
+# Prefetch asyncio: email dan lampiran PDF sekelompok kandidat diunduh bersamaan sebelum diproses.
+ASYNC_PREFETCH_ENABLED = os.getenv("ASYNC_PREFETCH_ENABLED", "false").lower() in ("1", "true", "yes")
+ASYNC_MAX_CONCURRENCY = int(_get_float_env("ASYNC_MAX_CONCURRENCY", 50))
+ASYNC_PREFETCH_BATCH_SIZE = int(_get_float_env("ASYNC_PREFETCH_BATCH_SIZE", 200))
+
+# OCR cadangan untuk resume hasil pindaian (lihat ocr.py); nonaktif secara default.
+OCR_ENABLED = ocr.OCR_ENABLED
+# Setelah OCR satu email gagal sebanyak ini (dihitung lintas run di catatan progres), email tidak ditunda
+# lagi tetapi diserahkan ke tinjauan manual, agar tidak terus menunggu (mode push tidak memprosesnya ulang).
+OCR_MAX_ATTEMPTS = max(1, int(_get_float_env("OCR_MAX_ATTEMPTS", 3)))
+
+# Posisi terakhir riwayat Gmail (historyId) yang sudah diproses oleh mode push (Gmail watch + Pub/Sub).
+GMAIL_WATCH_STATE_FILE = os.getenv("GMAIL_WATCH_STATE_FILE", "gmail_watch_state.json")
+
+def _split_resume_sections(resume_text: str) -> list[tuple]:
+    """Memecah teks resume menjadi daftar (jenis_bagian, teks) sesuai urutan aslinya."""
+    starts = {}
+    for pattern in (_UPPERCASE_HEADING_PATTERN, _COLON_HEADING_PATTERN):
+        for match in pattern.finditer(resume_text):
+            starts.setdefault(match.start(), _HEADING_TO_SECTION[match.group(1).upper()])
+
+    sections = []
+    positions = sorted(starts)
+    if not positions or positions[0] > 0:
+        sections.append(('header', resume_text[:positions[0] if positions else len(resume_text)]))
+    for i, start in enumerate(positions):
+        end = positions[i + 1] if i + 1 < len(positions) else len(resume_text)
+        sections.append((starts[start], resume_text[start:end]))
+    return [(kind, text.strip()) for kind, text in sections if text.strip()]
+
+def _compact_resume_for_prompt(resume_text: str, token_budget: int = None) -> str:
+    """
+    Memadatkan resume sebelum dikirim ke LLM.
+    Bagian boilerplate (referensi, hobi, pernyataan) dibuang, lalu bagian bernilai tinggi
+    (pengalaman, keterampilan, pendidikan) diutamakan hingga anggaran token terpenuhi.
+    """
+    if not resume_text:
+        return resume_text
+    token_budget = token_budget or PROMPT_TOKEN_BUDGET
+
+    sections = [(kind, text) for kind, text in _split_resume_sections(resume_text) if kind != 'boilerplate']
+    compacted = ' '.join(text for _, text in sections)
+    if _estimate_tokens(compacted) <= token_budget:
+        return compacted
+
+    # Setiap bagian mendapat jatah rata terlebih dahulu agar bagian pengalaman yang panjang
+    # tidak menghabiskan seluruh anggaran; sisa jatah dibagikan sesuai urutan prioritas.
+    budget_chars = token_budget * 4
+    ordered = sorted(range(len(sections)), key=lambda index: _SECTION_PRIORITY.index(sections[index][0]))
+    fair_share = budget_chars // len(ordered)
+    allocation = {index: min(len(sections[index][1]), fair_share) for index in ordered}
+    leftover = budget_chars - sum(allocation.values())
+    for index in ordered:
+        extra = min(len(sections[index][1]) - allocation[index], leftover)
+        allocation[index] += extra
+        leftover -= extra
+
+    compacted_sections = []
+    for index, (_, text) in enumerate(sections):
+        if allocation[index] == 0:
+            continue
+        if allocation[index] < len(text):
+            text = text[:allocation[index]].rsplit(' ', 1)[0] + ' ...'
+        compacted_sections.append(text)
+    return ' '.join(compacted_sections)
+
+def _get_llm(temperature: float = 0.2):
+    """
+    Membuat model Gemini yang dipakai oleh screening dan ringkasan.
+    Retry internal LangChain dimatikan karena percobaan ulang diatur oleh rate_limiter.
+    """
+    return ChatGoogleGenerativeAI(model="models/gemini-1.5-flash-latest", temperature=temperature, max_retries=1)
+
+def _invoke_llm(prompt: PromptTemplate, inputs: dict, usage: dict = None, temperature: float = 0.2, stage: str = 'llm'):
+    """
+    Menjalankan prompt ke LLM dan mencatat jumlah token input/output ke dict `usage`.
+    Memakai usage_metadata dari Gemini jika tersedia, jika tidak memakai perkiraan.
+    """
+    chain = prompt | _get_llm(temperature)
+    with stage_timer(stage):
+        result = call_with_backoff('gemini', lambda: chain.invoke(inputs), tenant=get_current_tenant()['id'])
+
+    if usage is not None:
+        metadata = getattr(result, 'usage_metadata', None) or {}
+        usage['input_tokens'] = usage.get('input_tokens', 0) + (
+            metadata.get('input_tokens') or _estimate_tokens(prompt.format(**inputs)))
+        usage['output_tokens'] = usage.get('output_tokens', 0) + (
+            metadata.get('output_tokens') or _estimate_tokens(result.content))
+        usage['llm_calls'] = usage.get('llm_calls', 0) + 1
+    return result
+
+def _summarize_resume_logic(resume_text: str, usage: dict = None) -> str:
     """
     Menggunakan LLM untuk meringkas teks resume yang panjang menjadi beberapa poin penting.
     Hasil ringkasan lebih rapi dan terstruktur.
     """
-    llm = ChatGoogleGenerativeAI(model="models/gemini-1.5-flash-latest", temperature=0.2)
-    
     summarize_prompt = PromptTemplate.from_template(
         "Tolong buat ringkasan PADAT dan RAPI dari resume berikut. "
         "Fokus pada poin-poin utama dengan format yang terstruktur:\n"
@@ -270,13 +748,11 @@ def _summarize_resume_logic(resume_text: str) -> str:
         "Ringkasan Rapi:"
     )
     
-    summarize_chain = summarize_prompt | llm
-    
     try:
         if not resume_text or len(resume_text) < 100:
             return "Informasi resume tidak cukup untuk dibuat ringkasan."
             
-        result = summarize_chain.invoke({"resume_text": resume_text})
+        result = _invoke_llm(summarize_prompt, {"resume_text": _compact_resume_for_prompt(resume_text)}, usage, stage='summarize')
         return result.content.strip()
     except Exception as e:
         print(f"Error saat meringkas resume oleh LLM: {e}")
@@ -287,7 +763,7 @@ def _simple_summarize_resume(resume_text: str) -> str:
     Fallback summarization manual jika AI gagal.
     """
     experience_match = re.search(r'(?:pengalaman|experience).*?(\d+[\+\s]tahun|tahun)', resume_text, re.IGNORECASE)
-    skills_match = re.findall(r'(python|sql|machine learning|deep learning|tensorflow|pandas|numpy|scikit)', resume_text, re.IGNORECASE)
+    skills_match = _SKILL_KEYWORDS_PATTERN.findall(resume_text)
     education_match = re.search(r'(?:pendidikan|education).*?(s[12]|d3|d4|sarjana|magister|diploma)', resume_text, re.IGNORECASE)
     
     summary = "Ringkasan:\n"
@@ -303,14 +779,64 @@ def _simple_summarize_resume(resume_text: str) -> str:
         summary += f"• Pendidikan: {education_match.group(0)}\n"
     
     return summary
-        
-def _analyze_and_screen_resume_logic(job_description: str, resume_text: str) -> str:
+
+def _prescreen_score(job_description: str, resume_text: str) -> float:
+    """
+    Menghitung skor kecocokan lokal (0.0 - 1.0) antara resume dan deskripsi pekerjaan.
+    Skor adalah proporsi berbobot istilah deskripsi pekerjaan yang muncul di resume;
+    kata kunci keterampilan diberi bobot dua kali lipat. Frasa keterampilan ("machine learning")
+    dihitung sekali sebagai frasa, bukan lagi sebagai kata-kata penyusunnya.
+    """
+    job_text = job_description.lower()
+    resume_lower = resume_text.lower()
+    resume_tokens = set(re.findall(r'[a-z0-9+#]+', resume_lower))
+
+    weighted_terms = {}
+    for keyword in RESUME_SKILL_KEYWORDS:
+        keyword_pattern = r'\b' + re.escape(keyword) + r'\b'
+        if re.search(keyword_pattern, job_text):
+            weighted_terms[keyword] = 2.0
+            job_text = re.sub(keyword_pattern, ' ', job_text)
+    for token in re.findall(r'[a-z0-9+#]+', job_text):
+        if len(token) < 3 or token.isdigit() or token in _PRESCREEN_STOPWORDS:
+            continue
+        weighted_terms.setdefault(token, 1.0)
+
+    if not weighted_terms:
+        return 0.0
+
+    matched_weight = 0.0
+    for term, weight in weighted_terms.items():
+        if ' ' in term:
+            found = re.search(r'\b' + re.escape(term) + r'\b', resume_lower) is not None
+        else:
+            found = term in resume_tokens
+        if found:
+            matched_weight += weight
+
+    return matched_weight / sum(weighted_terms.values())
+
+def _prescreen_resume_logic(job_description: str, resume_text: str) -> tuple:
+    """
+    Pra-screening lokal sebelum memanggil Gemini.
+    Mengembalikan ('KURANG COCOK', skor) jika skor di bawah ambang tolak, atau (None, skor) jika
+    perlu dinilai LLM. Skor tinggi tidak pernah meloloskan kandidat tanpa LLM, karena resume yang
+    hanya dijejali kata kunci juga mendapat skor tinggi.
+    """
+    if not PRESCREEN_ENABLED:
+        return None, 0.0
+
+    score = _prescreen_score(job_description, resume_text)
+    if score < PRESCREEN_REJECT_THRESHOLD:
+        return "KURANG COCOK", score
+    return None, score
+
+def _analyze_and_screen_resume_logic(job_description: str, resume_text: str, usage: dict = None) -> str:
     """
     Menganalisis resume menggunakan model AI.
-    Mengembalikan 'SANGAT COCOK', 'COCOK', atau 'KURANG COCOK'.
+    Mengembalikan 'SANGAT COCOK', 'COCOK', atau 'KURANG COCOK', atau 'TIDAK DIKETAHUI' jika LLM gagal
+    (selain kuota) atau jawabannya tidak dikenali; kandidat tersebut diserahkan ke tinjauan manual.
     """
-    llm = ChatGoogleGenerativeAI(model="models/gemini-1.5-flash-latest", temperature=0.2) 
-    
     screening_prompt = PromptTemplate.from_template(
         "Anda adalah seorang perekrut ahli. "
         "Bandingkan resume berikut dengan deskripsi pekerjaan yang diberikan. "
@@ -323,27 +849,130 @@ def _analyze_and_screen_resume_logic(job_description: str, resume_text: str) ->
         "Penilaian Kecocokan:"
     )
     
-    screening_chain = screening_prompt | llm
-    
     try:
-        result = screening_chain.invoke({"job_description": job_description, "resume_text": resume_text})
+        result = _invoke_llm(
+            screening_prompt,
+            {"job_description": job_description, "resume_text": _compact_resume_for_prompt(resume_text)},
+            usage,
+            stage='screen'
+        )
         screening_output = result.content.strip().upper()
         
         print(f"RAW AI RESPONSE: '{screening_output}'")  
 
-        if "SANGAT_COCOK" in screening_output:
-            return "SANGAT COCOK"
-        elif "COCOK" in screening_output:
-            return "COCOK"
-        elif "KURANG_COCOK" in screening_output:
-            return "KURANG COCOK"
-        else:
-            print("AI response tidak expected, default ke COCOK")
-            return "COCOK"
+        return _parse_screening_verdict(screening_output)
             
+    except RetryableError:
+        raise
     except Exception as e:
         print(f"Error saat screening resume oleh LLM: {e}")
-        return "COCOK"  
+        return "TIDAK DIKETAHUI"
+
+def _parse_screening_verdict(screening_output: str) -> str:
+    """
+    Mengubah jawaban mentah LLM menjadi 'SANGAT COCOK', 'COCOK', atau 'KURANG COCOK'.
+    'KURANG_COCOK' diperiksa sebelum 'COCOK' karena mengandung kata tersebut.
+    Jawaban lain menjadi 'TIDAK DIKETAHUI', bukan dianggap cocok.
+    """
+    normalized = screening_output.upper().replace(" ", "_")
+    if "SANGAT_COCOK" in normalized:
+        return "SANGAT COCOK"
+    elif "KURANG_COCOK" in normalized:
+        return "KURANG COCOK"
+    elif "COCOK" in normalized:
+        return "COCOK"
+    else:
+        print(f"AI response tidak dikenali: '{screening_output}'")
+        return "TIDAK DIKETAHUI"
+
+def _analyze_and_screen_resume_multi_role_logic(roles: list[dict], resume_text: str, usage: dict = None) -> dict:
+    """
+    Menilai satu resume terhadap beberapa lowongan dalam SATU panggilan LLM.
+    Mengembalikan dict {id_lowongan: 'SANGAT COCOK' | 'COCOK' | 'KURANG COCOK' | 'TIDAK DIKETAHUI'}.
+    """
+    screening_prompt = PromptTemplate.from_template(
+        "Anda adalah seorang perekrut ahli. "
+        "Bandingkan resume berikut dengan SETIAP deskripsi pekerjaan yang diberikan. "
+        "Berikan penilaian kecocokan berdasarkan seberapa baik kualifikasi, pengalaman, dan keterampilan di resume "
+        "sesuai dengan persyaratan masing-masing pekerjaan.\n"
+        "Balas dengan SATU baris per pekerjaan dengan format 'ID: PENILAIAN', "
+        "di mana PENILAIAN HANYA salah satu dari 'SANGAT_COCOK', 'COCOK', atau 'KURANG_COCOK'.\n\n"
+        "Daftar Pekerjaan:\n{job_descriptions}\n\n"
+        "Resume:\n{resume_text}\n\n"
+        "Penilaian Kecocokan:"
+    )
+    job_descriptions = "\n".join(f"- ID {role['id']} ({role['title']}): {role['description']}" for role in roles)
+
+    try:
+        result = _invoke_llm(
+            screening_prompt,
+            {"job_descriptions": job_descriptions, "resume_text": _compact_resume_for_prompt(resume_text)},
+            usage,
+            stage='screen'
+        )
+        screening_output = result.content.strip()
+        print(f"RAW AI RESPONSE: '{screening_output}'")
+    except RetryableError:
+        raise
+    except Exception as e:
+        print(f"Error saat screening resume multi-lowongan oleh LLM: {e}")
+        screening_output = ""
+
+    verdicts = {}
+    for role in roles:
+        # Id dicocokkan utuh di awal baris ("- ID engineer (Judul): COCOK"), sehingga 'engineer'
+        # tidak mengambil penilaian baris 'senior-engineer'.
+        match = re.search(r'^[^\w\n]*(?:ID\s+)?' + re.escape(role['id']) + r'(?![\w-])(?:\s*\([^)\n]*\))?\s*[:=-]\s*([A-Za-z_ ]+)',
+                          screening_output, re.IGNORECASE | re.MULTILINE)
+        verdicts[role['id']] = _parse_screening_verdict(match.group(1) if match else "")
+    return verdicts
+
+_VERDICT_RANK = {"TIDAK DIKETAHUI": -1, "KURANG COCOK": 0, "COCOK": 1, "SANGAT COCOK": 2}
+
+def _screen_resume_for_roles(roles: list[dict], resume_text: str, run_prescreen_stats: dict, usage: dict = None) -> tuple:
+    """
+    Menilai resume terhadap semua lowongan yang relevan.
+    Pra-screening lokal dijalankan per lowongan; lowongan yang masih ambigu dinilai LLM
+    sekaligus dalam satu panggilan. Mengembalikan (lowongan_terbaik, hasil_screening, ditolak_lokal)
+    di mana ditolak_lokal bernilai True jika semua lowongan ditolak tanpa memanggil LLM.
+    Hasilnya 'TIDAK DIKETAHUI' jika tidak ada lowongan yang cocok tetapi penilaian LLM untuk
+    sebagian lowongan gagal, karena kandidat tidak boleh ditolak untuk lowongan yang belum dinilai.
+    """
+    scores = {}
+    verdicts = {}
+    ambiguous_roles = []
+    for role in roles:
+        with stage_timer('prescreen'):
+            prescreen_result, scores[role['id']] = _prescreen_resume_logic(role['description'], resume_text)
+        if prescreen_result:
+            verdicts[role['id']] = prescreen_result
+        else:
+            ambiguous_roles.append(role)
+        print(f"Skor pra-screening untuk {role['title']}: {scores[role['id']]:.2f}")
+
+    if not ambiguous_roles:
+        # Penolakan otomatis: screening dan ringkasan LLM sama-sama dilewati.
+        print("Pra-screening menolak kandidat untuk semua lowongan tanpa memanggil LLM.")
+        run_prescreen_stats["auto_rejected"] += 1
+        run_prescreen_stats["llm_calls_saved"] += 2
+        best_role = max(roles, key=lambda role: scores[role['id']])
+        return best_role, 'KURANG COCOK', True
+
+    run_prescreen_stats["sent_to_llm"] += 1
+    if len(ambiguous_roles) == 1:
+        verdicts[ambiguous_roles[0]['id']] = _analyze_and_screen_resume_logic(ambiguous_roles[0]['description'], resume_text, usage)
+    else:
+        verdicts.update(_analyze_and_screen_resume_multi_role_logic(ambiguous_roles, resume_text, usage))
+
+    best_role = max(
+        roles,
+        key=lambda role: (_VERDICT_RANK[verdicts[role['id']]], scores[role['id']])
+    )
+    unknown_roles = [role for role in roles if verdicts[role['id']] == "TIDAK DIKETAHUI"]
+    if unknown_roles and _VERDICT_RANK[verdicts[best_role['id']]] <= _VERDICT_RANK["KURANG COCOK"]:
+        best_role = max(unknown_roles, key=lambda role: scores[role['id']])
+        return best_role, "TIDAK DIKETAHUI", False
+    return best_role, verdicts[best_role['id']], False
 
 def _find_available_slot_logic():
     """
@@ -351,70 +980,73 @@ def _find_available_slot_logic():
     Mengembalikan string datetime dalam format yang rapi dengan zona waktu.
     """
     try:
-        service = get_google_services()['calendar']
-        wib_tz = datetime.timezone(datetime.timedelta(hours=7))
-        time_min = datetime.datetime.now(wib_tz).replace(hour=0, minute=0, second=0, microsecond=0)
-        time_max = time_min + datetime.timedelta(days=7)
-        events_result = service.events().list(
-            calendarId='primary',
-            timeMin=time_min.isoformat(),
-            timeMax=time_max.isoformat(),
-            singleEvents=True,
-            orderBy='startTime'
-        ).execute()
-        existing_events = events_result.get('items', [])
-
-        working_hours_start = 9
-        working_hours_end = 17
-        slot_duration = datetime.timedelta(hours=1)
-
-        current_date = time_min + datetime.timedelta(days=1)
-        found_slot = None
-
-        while current_date < time_max and not found_slot:
-            if current_date.weekday() >= 5:
-                current_date += datetime.timedelta(days=1)
-                continue
+        with stage_timer('slot_search'):
+            service = get_google_services()['calendar']
+            wib_tz = datetime.timezone(datetime.timedelta(hours=7))
+            time_min = datetime.datetime.now(wib_tz).replace(hour=0, minute=0, second=0, microsecond=0)
+            time_max = time_min + datetime.timedelta(days=7)
+            events_result = _execute(service.events().list(
+                calendarId=get_current_tenant()['calendar_id'],
+                timeMin=time_min.isoformat(),
+                timeMax=time_max.isoformat(),
+                singleEvents=True,
+                orderBy='startTime'
+            ), 'calendar')
+            existing_events = events_result.get('items', [])
+
+            working_hours_start = 9
+            working_hours_end = 17
+            slot_duration = datetime.timedelta(hours=1)
+
+            current_date = time_min + datetime.timedelta(days=1)
+            found_slot = None
+
+            while current_date < time_max and not found_slot:
+                if current_date.weekday() >= 5:
+                    current_date += datetime.timedelta(days=1)
+                    continue
 
-            current_time = current_date.replace(hour=working_hours_start, minute=0, second=0, microsecond=0)
-            end_of_day = current_date.replace(hour=working_hours_end, minute=0, second=0, microsecond=0)
+                current_time = current_date.replace(hour=working_hours_start, minute=0, second=0, microsecond=0)
+                end_of_day = current_date.replace(hour=working_hours_end, minute=0, second=0, microsecond=0)
 
-            while current_time < end_of_day and not found_slot:
-                slot_end = current_time + slot_duration
+                while current_time < end_of_day and not found_slot:
+                    slot_end = current_time + slot_duration
 
-                is_available = True
-                for event in existing_events:
-                    event_start_str = event['start'].get('dateTime', event['start'].get('date'))
-                    event_end_str = event['end'].get('dateTime', event['end'].get('date'))
+                    is_available = True
+                    for event in existing_events:
+                        event_start_str = event['start'].get('dateTime', event['start'].get('date'))
+                        event_end_str = event['end'].get('dateTime', event['end'].get('date'))
 
-                    event_start = parser.parse(event_start_str)
-                    event_end = parser.parse(event_end_str)
-                    if (current_time < event_end) and (slot_end > event_start):
-                        is_available = False
-                        break
+                        event_start = parser.parse(event_start_str)
+                        event_end = parser.parse(event_end_str)
+                        if (current_time < event_end) and (slot_end > event_start):
+                            is_available = False
+                            break
 
-                if is_available:
-                    found_slot = current_time
-                    break
+                    if is_available:
+                        found_slot = current_time
+                        break
 
-                current_time += slot_duration
+                    current_time += slot_duration
 
-            if not found_slot:
-                current_date += datetime.timedelta(days=1)
+                if not found_slot:
+                    current_date += datetime.timedelta(days=1)
 
-        if found_slot:
-            formatted_time = found_slot.strftime('%Y-%m-%d pukul %H:%M WIB')
-            return formatted_time
-        else:
-            return "Tidak ada slot kosong yang ditemukan dalam 7 hari ke depan."
+            if found_slot:
+                formatted_time = found_slot.strftime('%Y-%m-%d pukul %H:%M WIB')
+                return formatted_time
+            else:
+                return "Tidak ada slot kosong yang ditemukan dalam 7 hari ke depan."
 
+    except RetryableError:
+        raise
     except Exception as e:
         print(f"Error mencari slot wawancara: {e}")
         fallback_time = (datetime.datetime.now() + datetime.timedelta(days=1)).replace(hour=10, minute=0, second=0, microsecond=0)
         formatted_time = fallback_time.strftime('%Y-%m-%d pukul %H:%M WIB')
         return formatted_time
 
-def _schedule_interview_logic(candidate_email: str, candidate_name: str, interview_time: str) -> str:
+def _schedule_interview_logic(candidate_email: str, candidate_name: str, interview_time: str, position: str = "Data Scientist") -> str:
     """
     Menjadwalkan wawancara di Google Calendar.
     """
@@ -434,7 +1066,7 @@ def _schedule_interview_logic(candidate_email: str, candidate_name: str, intervi
         
         event = {
             'summary': f'Wawancara {candidate_name}',
-            'description': f'Wawancara untuk posisi Data Scientist dengan {candidate_name}',
+            'description': f'Wawancara untuk posisi {position} dengan {candidate_name}',
             'start': {
                 'dateTime': start_time.isoformat(),
                 'timeZone': 'Asia/Jakarta',
@@ -452,9 +1084,11 @@ def _schedule_interview_logic(candidate_email: str, candidate_name: str, intervi
             },
         }
         
-        event = service.events().insert(calendarId='primary', body=event).execute()
+        event = _execute(service.events().insert(calendarId=get_current_tenant()['calendar_id'], body=event), 'calendar', stage='event_insert')
         return f"Wawancara berhasil dijadwalkan untuk {candidate_name} pada {interview_time}"
         
+    except RetryableError:
+        raise
     except Exception as e:
         print(f"Error menjadwalkan wawancara: {e}")
         return f"Gagal menjadwalkan wawancara: {str(e)}"
@@ -462,12 +1096,12 @@ def _schedule_interview_logic(candidate_email: str, candidate_name: str, intervi
 def test_sheets_connection():
     """Test koneksi ke Google Sheets"""
     try:
-        SPREADSHEET_ID = 'ID_SHEET_ANDA'
+        SPREADSHEET_ID = get_current_tenant()['spreadsheet_id']
         service = get_google_services()['sheets']
         
-        result = service.spreadsheets().values().get(
+        result = _execute(service.spreadsheets().values().get(
             spreadsheetId=SPREADSHEET_ID,
-            range='Sheet1!A1:E1').execute()
+            range='Sheet1!A1:E1'), 'sheets')
         
         print("Koneksi Google Sheets BERHASIL")
         print("Data yang ada:", result.get('values', []))
@@ -476,37 +1110,49 @@ def test_sheets_connection():
         print(f"Koneksi Google Sheets GAGAL: {e}")
         return False
 
-def _add_to_approved_candidates_sheet_logic(candidate_name: str, candidate_email: str, interview_schedule: str, screening_result: str, resume_text: str) -> str:
+def _format_sheet_row(candidate_name: str, candidate_email: str, interview_schedule: str, screening_result: str, resume_text: str) -> list:
     """
-    Logika inti untuk menambahkan data kandidat ke Google Sheets.
-    Menyertakan teks resume yang diekstrak.
+    Menyusun satu baris Google Sheets (kolom A:E) persis seperti yang akan ditulis,
+    sehingga dashboard bisa menampilkan baris yang sama tanpa membaca ulang sheet.
     """
-    SPREADSHEET_ID = 'ID_SHEET_ANDA'
-    service = get_google_services()['sheets']
-    range_name = 'Sheet1!A:E'
-
     clean_name = ' '.join(candidate_name.split()[:3])  
 
     if len(resume_text) > 10000:
         resume_text = resume_text[:10000] + "... [truncated]"
 
     clean_screening = screening_result.replace("_", " ").title()
+
+    return [clean_name, candidate_email, interview_schedule, clean_screening, resume_text]
+
+def _add_to_approved_candidates_sheet_logic(candidate_name: str, candidate_email: str, interview_schedule: str, screening_result: str, resume_text: str) -> str:
+    """
+    Logika inti untuk menambahkan data kandidat ke Google Sheets.
+    Menyertakan teks resume yang diekstrak.
+    """
+    SPREADSHEET_ID = get_current_tenant()['spreadsheet_id']
+    service = get_google_services()['sheets']
+    range_name = 'Sheet1!A:E'
+
+    row = _format_sheet_row(candidate_name, candidate_email, interview_schedule, screening_result, resume_text)
+    clean_name = row[0]
     
-    values = [[clean_name, candidate_email, interview_schedule, clean_screening, resume_text]]
+    values = [row]
     body = {'values': values}
     
     try:
         print(f"Menambahkan ke Sheets: {clean_name}, {candidate_email}, {interview_schedule}")
-        result = service.spreadsheets().values().append(
+        result = _execute(service.spreadsheets().values().append(
             spreadsheetId=SPREADSHEET_ID, 
             range=range_name,
             valueInputOption='USER_ENTERED',
             insertDataOption='INSERT_ROWS',
-            body=body).execute()
+            body=body), 'sheets', stage='sheet_append')
         
         print(f"Data kandidat {clean_name} berhasil ditambahkan ke Google Sheets.")
         print(f"Update range: {result.get('updates', {}).get('updatedRange')}")
         return f"Data kandidat {clean_name} berhasil ditambahkan ke Google Sheets."
+    except RetryableError:
+        raise
     except HttpError as err:
         error_msg = err.content.decode('utf-8')
         print(f"Gagal menambahkan data ke Google Sheets: {error_msg}")
@@ -527,7 +1173,7 @@ def _send_email_reply_logic(recipient: str, subject: str, body: str) -> str:
         
         raw_message = base64.urlsafe_b64encode(message.as_bytes()).decode('utf-8')
         
-        service.users().messages().send(userId='me', body={'raw': raw_message}).execute()
+        _execute(service.users().messages().send(userId='me', body={'raw': raw_message}), 'gmail', 'send', stage='email_send')
         
         return f"Email balasan berhasil dikirim ke {recipient} dengan subjek: {subject}"
     except HttpError as err:
@@ -535,12 +1181,30 @@ def _send_email_reply_logic(recipient: str, subject: str, body: str) -> str:
         print(f"Gagal mengirim email: {error_msg}")
         return f"Gagal mengirim email: {error_msg}. Pastikan izin email sudah benar dan alamat penerima valid."
 
+# Email penolakan/undangan dari run agen dikirim lewat outbox (template, batch, dan idempoten).
+# Lambda dipakai agar get_google_services yang diganti (misalnya oleh fakes.install) tetap terpakai.
+outbox = Outbox(lambda: get_google_services())
+
+# Langkah yang sudah selesai per email (event kalender, baris sheet), agar email yang ditunda di tengah
+# jalan tidak membuat event atau baris ganda saat diproses ulang (lihat email_progress.py).
+progress = email_progress.EmailProgress()
+
+def _finish_email_logic(email_id: str) -> str:
+    """
+    Menandai email sudah dibaca, lalu menghapus catatan progresnya. Jika gagal, catatan tetap ada
+    sehingga run berikutnya tidak mengulang langkah yang sudah selesai.
+    """
+    status = _mark_email_as_read_logic(email_id)
+    if "berhasil" in status:
+        progress.clear(email_id)
+    return status
+
 def get_list_of_emails():
     """Mengambil daftar semua email lamaran, terlepas dari status dibaca/belum dibaca,
        dan menyertakan status 'Dibaca'/'Belum Dibaca'."""
     try:
         service = get_google_services()['gmail']
-        results = service.users().messages().list(userId='me', q='subject:"Lamaran Pekerjaan"').execute()
+        results = _execute(service.users().messages().list(userId='me', q='subject:"Lamaran Pekerjaan"'), 'gmail')
         messages = results.get('messages', [])
         
         if not messages:
@@ -549,7 +1213,7 @@ def get_list_of_emails():
         email_list = []
         for msg in messages:
             try:
-                full_msg = service.users().messages().get(userId='me', id=msg['id'], format='full').execute()
+                full_msg = _execute(service.users().messages().get(userId='me', id=msg['id'], format='full'), 'gmail')
                 
                 headers = full_msg['payload']['headers']
                 subject = next((h['value'] for h in headers if h['name'] == 'Subject'), 'Tidak Diketahui')
@@ -573,15 +1237,15 @@ def get_list_of_emails():
 
 def get_sheet_data():
     """Mengambil semua data dari Google Sheet."""
-    SPREADSHEET_ID = 'ID_SHEET_ANDA'
+    SPREADSHEET_ID = get_current_tenant()['spreadsheet_id']
     service = get_google_services()['sheets']
     range_name = 'Sheet1!A:E'
     
     try:
         print(f"Mengambil data dari Google Sheets: {SPREADSHEET_ID}, Range: {range_name}...")
-        result = service.spreadsheets().values().get(
+        result = _execute(service.spreadsheets().values().get(
             spreadsheetId=SPREADSHEET_ID,
-            range=range_name).execute()
+            range=range_name), 'sheets')
         
         values = result.get('values', [])
         print(f"Data dari Google Sheets berhasil diambil. Jumlah baris: {len(values)}")
@@ -618,7 +1282,7 @@ def extract_applicant_info_from_email_id_tool(email_id: str) -> dict:
 def analyze_and_screen_resume_tool(job_description: str, resume_text: str) -> str:
     """
     Menganalisis resume untuk menentukan kecocokannya dengan deskripsi pekerjaan menggunakan model AI.
-    Mengembalikan 'SANGAT COCOK', 'COCOK', atau 'KURANG COCOK'.
+    Mengembalikan 'SANGAT COCOK', 'COCOK', 'KURANG COCOK', atau 'TIDAK DIKETAHUI' jika penilaian gagal.
     """
     return _analyze_and_screen_resume_logic(job_description, resume_text)
 
@@ -668,41 +1332,148 @@ prompt = ChatPromptTemplate.from_messages(
 agent = create_tool_calling_agent(llm, tools, prompt)
 agent_executor = AgentExecutor(agent=agent, tools=tools, verbose=True)
 
-def run_agent_process():
+def _emit_event(on_event, event_type: str, **data):
+    """
+    Mengirim event progres per kandidat ke callback `on_event` (jika ada).
+    Kegagalan callback (misalnya klien dashboard terputus) tidak boleh menghentikan pipeline.
+    """
+    if on_event is None:
+        return
+    try:
+        on_event(event_type, data)
+    except Exception as e:
+        print(f"Gagal mengirim event '{event_type}': {e}")
+
+def run_agent_process(on_event=None, email_ids=None):
     """
     Fungsi utama untuk menjalankan agen HRD.
     Ini adalah fungsi yang akan dipanggil oleh endpoint Flask.
     Mengelola alur kerja dan mengembalikan ringkasan naratif.
+
+    Jika `email_ids` diisi (mode push), hanya email tersebut yang diproses dan
+    kotak masuk tidak dipindai ulang.
+
+    `on_event(event_type, data)` opsional dipanggil setiap kali satu kandidat selesai
+    diproses: 'started', 'screened', 'scheduled', 'rejected', 'manual_review', 'error', dan 'deferred'.
+    Event 'scheduled', 'rejected', dan 'manual_review' menyertakan `sheet_row` jika baris ditulis ke Google Sheets.
+
+    Kandidat yang hasil screening-nya 'TIDAK DIKETAHUI' (LLM gagal atau jawabannya tidak dikenali)
+    tidak dijadwalkan maupun ditolak: barisnya ditulis ke sheet dengan status "Perlu Tinjauan Manual",
+    tanpa email ke kandidat, dan dihitung di `manual_review_count`. Hal yang sama berlaku untuk email yang
+    OCR-nya sudah gagal OCR_MAX_ATTEMPTS kali; sebelum itu email tersebut ditunda ke run berikutnya.
+
+    Ringkasan berisi `completed`: False jika run berhenti sebelum semua email diperiksa
+    (Google Sheets tidak terjangkau atau kesalahan umum), sehingga mode push tidak memajukan historyId.
+
+    Event kalender dan baris sheet yang sudah dibuat dicatat per email (`progress`); email yang ditunda
+    setelah langkah itu melanjutkan dari keputusan dan jadwal yang sama pada run berikutnya.
     """
     if not test_sheets_connection():
         return json.dumps({
             "summary_message": "Gagal terkoneksi ke Google Sheets. Pastikan ID spreadsheet benar dan izin sudah diberikan.",
+            "completed": False,
             "processed_count": 0, "scheduled_count": 0, "rejected_count": 0
         })
     
     processed_count = 0
     scheduled_count = 0
     rejected_count = 0
+    deferred_count = 0
+    manual_review_count = 0
+    run_prescreen_stats = {key: 0 for key in prescreen_stats}
+    run_metrics = metrics.begin_run()
+    outbox.resume()
+    outbox_before = outbox.stats(get_current_tenant()['id'])
+    ocr_pending = {}
+
+    token_usage = []
 
-    job_description = "Kami mencari Data Scientist dengan pengalaman minimal 2 tahun di bidang machine learning dan deep learning, mahir dalam Python dan SQL, serta memiliki kemampuan komunikasi yang baik."
+    job_roles = load_job_roles()
+    scheduled_by_role = {role['id']: 0 for role in job_roles}
+    print(f"Lowongan aktif: {', '.join(role['title'] for role in job_roles)}")
 
     try:
-        print("\n--- Memeriksa email lamaran baru... ---")
-        email_ids = _get_new_job_applications_logic()
+        if email_ids is None:
+            print("\n--- Memeriksa email lamaran baru... ---")
+            email_ids = _get_new_job_applications_logic()
+        else:
+            print(f"\n--- Memproses {len(email_ids)} email dari notifikasi Gmail... ---")
         
         if not email_ids:
             print("Tidak ada email lamaran baru yang ditemukan untuk diproses.") 
             return json.dumps({
                 "summary_message": "Tidak ada email lamaran baru yang ditemukan untuk diproses.",
+                "completed": True,
                 "processed_count": 0, "scheduled_count": 0, "rejected_count": 0
             })
 
         print(f"Ditemukan {len(email_ids)} email lamaran baru. Memulai pemrosesan...")
+        _emit_event(on_event, 'started', total=len(email_ids))
+
+        def defer_remaining(index: int, email_id: str, error: RetryableError) -> int:
+            # Kuota/5xx masih gagal setelah backoff: email dibiarkan belum dibaca agar diproses
+            # ulang pada run berikutnya, dan sisa email ditunda karena kuota yang sama kemungkinan habis.
+            remaining = len(email_ids) - index
+            print(f"Kuota/layanan sementara tidak tersedia saat memproses email {email_id}: {error}")
+            print(f"Menunda {remaining} email ke run berikutnya.")
+            _emit_event(on_event, 'deferred', email_id=email_id, count=remaining, message=str(error))
+            return remaining
         
-        for email_id in email_ids:
+        prefetched = {}
+        # PDF tanpa teks di-OCR di proses pekerja OCR sementara email lain diproses; email tersebut
+        # ditambahkan lagi ke akhir antrean dan diselesaikan setelah hasil OCR-nya siap.
+        email_ids = list(email_ids)
+        for index, email_id in enumerate(email_ids):
+            if ASYNC_PREFETCH_ENABLED and index % ASYNC_PREFETCH_BATCH_SIZE == 0:
+                # Diunduh per kelompok agar memori untuk PDF tetap terbatas pada kotak masuk yang besar.
+                prefetched = _prefetch_applications_logic([pending_id for pending_id in email_ids[index:index + ASYNC_PREFETCH_BATCH_SIZE]
+                                                           if pending_id not in ocr_pending])
             print(f"\n--- Memproses email ID: {email_id}... ---") 
             try:
-                applicant_info = _extract_applicant_info_from_email_id_logic(email_id)
+                if email_id in ocr_pending:
+                    pending_info, future, submitted_at = ocr_pending.pop(email_id)
+                    applicant_info = _finish_ocr_logic(email_id, pending_info, future, submitted_at)
+                    if applicant_info is None:
+                        previous = progress.get(email_id)
+                        ocr_failures = previous.get('ocr_failures', 0) + 1
+                        if ocr_failures < OCR_MAX_ATTEMPTS:
+                            progress.update(email_id, ocr_failures=ocr_failures)
+                            deferred_count += 1
+                            print(f"Menunda email {email_id} ke run berikutnya karena OCR gagal "
+                                  f"(percobaan {ocr_failures}/{OCR_MAX_ATTEMPTS}).")
+                            _emit_event(on_event, 'deferred', email_id=email_id, count=1,
+                                        message="OCR gagal atau melebihi batas waktu")
+                            continue
+
+                        print(f"OCR email {email_id} gagal {ocr_failures} kali. Diserahkan ke tinjauan manual...")
+                        manual_review_count += 1
+                        note = (f"OCR gagal {ocr_failures} kali untuk email {email_id} "
+                                f"(subjek: {pending_info.get('subject')}). Periksa lampiran secara manual.")
+                        sheet_row = None
+                        if not previous.get('sheet'):
+                            progress.update(email_id, ocr_failures=ocr_failures)
+                            add_to_sheet_status = _add_to_approved_candidates_sheet_logic(
+                                pending_info['name'], pending_info['email'], "", "Perlu Tinjauan Manual", note)
+                            print(add_to_sheet_status)
+                            if "berhasil" in add_to_sheet_status:
+                                sheet_row = _format_sheet_row(pending_info['name'], pending_info['email'], "",
+                                                              "Perlu Tinjauan Manual", note)
+                                progress.update(email_id, sheet=True)
+                        if sheet_row is not None or previous.get('sheet'):
+                            _finish_email_logic(email_id)
+                        _emit_event(on_event, 'manual_review', email_id=email_id, name=pending_info['name'],
+                                    email=pending_info['email'], subject=pending_info.get('subject'),
+                                    reason=f"OCR gagal {ocr_failures} kali", position=None, sheet_row=sheet_row)
+                        continue
+                else:
+                    applicant_info = _extract_applicant_info_from_email_id_logic(email_id, prefetched.pop(email_id, None))
+                    if "pdf_bytes" in applicant_info:
+                        future = _submit_ocr_logic(email_id, applicant_info)
+                        applicant_info.pop("pdf_bytes", None)
+                        if future is not None:
+                            ocr_pending[email_id] = (applicant_info, future, time.monotonic())
+                            email_ids.append(email_id)
+                            continue
                 candidate_name = applicant_info.get('name')
                 candidate_email = applicant_info.get('email')
                 full_resume_text = applicant_info.get('resume_text')
@@ -710,7 +1481,9 @@ def run_agent_process():
                 if not candidate_email or candidate_email == "tidak_ada@email.com" or candidate_email == "tidak_valid@email.com":
                     print(f"Lewati email {email_id}: Email tidak valid. Info: {applicant_info}")
                     rejected_count += 1
-                    _mark_email_as_read_logic(email_id) 
+                    _finish_email_logic(email_id) 
+                    _emit_event(on_event, 'rejected', email_id=email_id, name=candidate_name, email=candidate_email,
+                                subject=applicant_info.get('subject'), reason="Email tidak valid", sheet_row=None)
                     continue
 
                 if not candidate_name or candidate_name == "Tidak Diketahui":
@@ -721,55 +1494,112 @@ def run_agent_process():
                 if not full_resume_text or full_resume_text == "Tidak ada lampiran PDF ditemukan." or full_resume_text == "Teks PDF tidak dapat diekstrak atau kosong.":
                     print(f"Lewati email {email_id}: Tidak ada lampiran PDF yang dapat diekstrak atau diekstrak sebagai kosong.") 
                     rejected_count += 1
-                    _mark_email_as_read_logic(email_id)
+                    _finish_email_logic(email_id)
+                    _emit_event(on_event, 'rejected', email_id=email_id, name=candidate_name, email=candidate_email,
+                                subject=applicant_info.get('subject'), reason="Tidak ada lampiran PDF", sheet_row=None)
                     continue
 
                 processed_count += 1
 
-                print(f"Menganalisis resume untuk {candidate_name}...") 
-                screening_result = _analyze_and_screen_resume_logic(job_description, full_resume_text)
-                print(f"Hasil screening untuk {candidate_name}: '{screening_result}'")
-
-                print("Membuat ringkasan resume...")
-                summarized_resume = _summarize_resume_logic(full_resume_text)
+                candidate_roles = _route_application_to_roles(applicant_info.get('subject'), applicant_info.get('body'), job_roles)
+                usage = {"input_tokens": 0, "output_tokens": 0, "llm_calls": 0}
+                token_usage.append({"email_id": email_id, "name": candidate_name, "usage": usage})
+                # Email yang ditunda setelah efek samping pertama melanjutkan dari keputusan yang tercatat.
+                previous = progress.get(email_id)
+                if previous.get('verdict'):
+                    print(f"Melanjutkan email {email_id} dari run sebelumnya: {previous['verdict']}.")
+                    role = next((item for item in job_roles if item['id'] == previous.get('role_id')), candidate_roles[0])
+                    screening_result = previous['verdict']
+                    locally_rejected = previous.get('locally_rejected', False)
+                    summarized_resume = previous.get('summary', '')
+                else:
+                    print(f"Menganalisis resume untuk {candidate_name} terhadap {len(candidate_roles)} lowongan...")
+                    role, screening_result, locally_rejected = _screen_resume_for_roles(candidate_roles, full_resume_text, run_prescreen_stats, usage)
+                position = role['title']
+                print(f"Hasil screening untuk {candidate_name}: '{screening_result}' ({position})")
+                _emit_event(on_event, 'screened', email_id=email_id, name=candidate_name, email=candidate_email,
+                            subject=applicant_info.get('subject'), verdict=screening_result, position=position,
+                            locally_rejected=locally_rejected)
+
+                if not previous.get('verdict'):
+                    if locally_rejected:
+                        summarized_resume = _simple_summarize_resume(full_resume_text)
+                    else:
+                        print("Membuat ringkasan resume...")
+                        summarized_resume = _summarize_resume_logic(full_resume_text, usage)
 
-                if len(summarized_resume) < 50 or "gagal" in summarized_resume.lower():
-                    print("AI summarization gagal, menggunakan fallback...")
-                    summarized_resume = _simple_summarize_resume(full_resume_text)
+                        if len(summarized_resume) < 50 or "gagal" in summarized_resume.lower():
+                            print("AI summarization gagal, menggunakan fallback...")
+                            summarized_resume = _simple_summarize_resume(full_resume_text)
                 
                 print(f"Ringkasan resume berhasil dibuat. Panjang: {len(summarized_resume)} karakter.")
-
-                if screening_result == 'KURANG COCOK':
+                decision = {"verdict": screening_result, "role_id": role['id'],
+                            "locally_rejected": locally_rejected, "summary": summarized_resume}
+
+                if screening_result == 'TIDAK DIKETAHUI':
+                    print(f"Hasil screening {candidate_name} tidak dapat ditentukan. Diserahkan ke tinjauan manual...")
+                    manual_review_count += 1
+
+                    sheet_row = None
+                    if not previous.get('sheet'):
+                        add_to_sheet_status = _add_to_approved_candidates_sheet_logic(
+                            candidate_name, candidate_email, "", "Perlu Tinjauan Manual", summarized_resume)
+                        print(add_to_sheet_status)
+                        if "berhasil" in add_to_sheet_status:
+                            sheet_row = _format_sheet_row(candidate_name, candidate_email, "", "Perlu Tinjauan Manual", summarized_resume)
+                            progress.update(email_id, sheet=True, **decision)
+
+                    # Baris sheet adalah satu-satunya penanda tinjauan manual; tanpa baris itu email dibiarkan
+                    # belum dibaca agar tetap terlihat dan dicoba lagi pada run berikutnya.
+                    if sheet_row is not None or previous.get('sheet'):
+                        _finish_email_logic(email_id)
+                    _emit_event(on_event, 'manual_review', email_id=email_id, name=candidate_name, email=candidate_email,
+                                subject=applicant_info.get('subject'), reason="Hasil screening LLM tidak dapat ditentukan",
+                                position=position, sheet_row=sheet_row)
+
+                elif screening_result == 'KURANG COCOK':
                     print(f"Kandidat {candidate_name} kurang cocok. Menolak lamaran...")
                     rejected_count += 1
 
-                    add_to_sheet_status = _add_to_approved_candidates_sheet_logic(
-                        candidate_name, 
-                        candidate_email, 
-                        "", 
-                        "Ditolak", 
-                        summarized_resume
-                    )
-                    print(add_to_sheet_status)
+                    sheet_row = None
+                    if not previous.get('sheet'):
+                        add_to_sheet_status = _add_to_approved_candidates_sheet_logic(
+                            candidate_name, 
+                            candidate_email, 
+                            "", 
+                            "Ditolak", 
+                            summarized_resume
+                        )
+                        print(add_to_sheet_status)
+                        if "berhasil" in add_to_sheet_status:
+                            sheet_row = _format_sheet_row(candidate_name, candidate_email, "", "Ditolak", summarized_resume)
+                            progress.update(email_id, sheet=True, **decision)
                     
-                    rejection_subject = "Update Lamaran Pekerjaan"
-                    rejection_body = f"Halo {candidate_name},\n\n" \
-                                     f"Terima kasih atas minat Anda untuk bergabung dengan tim kami. Setelah meninjau lamaran Anda, " \
-                                     f"kami mohon maaf untuk menginformasikan bahwa kami tidak dapat melanjutkan proses seleksi untuk Anda saat ini.\n\n" \
-                                     f"Kami menghargai waktu dan usaha Anda. Semoga sukses di masa depan!\n\n" \
-                                     f"Salam,\nTim HRD"
-                    email_status = _send_email_reply_logic(candidate_email, rejection_subject, rejection_body)
+                    email_status = outbox.enqueue(f"{email_id}:rejection", candidate_email, 'rejection',
+                                                  name=candidate_name)
                     print(email_status)
                     
-                    _mark_email_as_read_logic(email_id)
+                    _finish_email_logic(email_id)
+                    _emit_event(on_event, 'rejected', email_id=email_id, name=candidate_name, email=candidate_email,
+                                subject=applicant_info.get('subject'), reason="Kurang cocok", position=position,
+                                sheet_row=sheet_row)
                     
                 else:  
-                    print(f"Kandidat {candidate_name} cocok. Mencari slot wawancara...") 
-                    interview_time = _find_available_slot_logic() 
+                    if previous.get('event'):
+                        interview_time = previous['interview_time']
+                        schedule_status = f"Wawancara berhasil dijadwalkan untuk {candidate_name} pada {interview_time}"
+                        print(f"Wawancara {candidate_name} sudah dijadwalkan pada run sebelumnya: {interview_time}.")
+                    else:
+                        print(f"Kandidat {candidate_name} cocok. Mencari slot wawancara...") 
+                        interview_time = _find_available_slot_logic() 
+                        schedule_status = None
                     
                     if interview_time and "Gagal" not in interview_time and "Tidak ada slot kosong" not in interview_time and "error" not in interview_time.lower():
-                        print(f"Slot tersedia: {interview_time}. Menjadwalkan wawancara untuk {candidate_name}...") 
-                        schedule_status = _schedule_interview_logic(candidate_email, candidate_name, interview_time)
+                        if schedule_status is None:
+                            print(f"Slot tersedia: {interview_time}. Menjadwalkan wawancara untuk {candidate_name}...") 
+                            schedule_status = _schedule_interview_logic(candidate_email, candidate_name, interview_time, position)
+                            if "berhasil dijadwalkan" in schedule_status.lower():
+                                progress.update(email_id, event=True, interview_time=interview_time, **decision)
                         
                         if "berhasil dijadwalkan" in schedule_status.lower():
                             print(f"Wawancara dijadwalkan untuk {candidate_name} pada {interview_time}.") 
@@ -786,57 +1616,245 @@ def run_agent_process():
                             except:
                                 email_time_display = interview_time
 
-                            add_to_sheet_status = _add_to_approved_candidates_sheet_logic(
-                                candidate_name, 
-                                candidate_email, 
-                                interview_time, 
-                                "Jadwalkan Wawancara", 
-                                summarized_resume
-                            )
-                            print(add_to_sheet_status)
+                            sheet_status = f"Jadwalkan Wawancara - {position}" if len(job_roles) > 1 else "Jadwalkan Wawancara"
+                            sheet_row = None
+                            if not previous.get('sheet'):
+                                add_to_sheet_status = _add_to_approved_candidates_sheet_logic(
+                                    candidate_name, 
+                                    candidate_email, 
+                                    interview_time, 
+                                    sheet_status,
+                                    summarized_resume
+                                )
+                                print(add_to_sheet_status)
+                                if "berhasil" in add_to_sheet_status:
+                                    sheet_row = _format_sheet_row(candidate_name, candidate_email, interview_time, sheet_status, summarized_resume)
+                                    progress.update(email_id, sheet=True)
                             
-                            interview_subject = "Undangan Wawancara untuk Posisi Data Scientist"
-                            interview_body = f"Halo {candidate_name},\n\n" \
-                                             f"Terima kasih atas lamaran Anda. Kami ingin mengundang Anda untuk wawancara terkait posisi Data Scientist pada:\n\n" \
-                                             f"Tanggal: {email_time_display}\n\n" \
-                                             f"Kami akan mengirimkan link meeting secara terpisah.\n\n" \
-                                             f"Salam,\nTim HRD"
-                            email_status = _send_email_reply_logic(candidate_email, interview_subject, interview_body)
+                            email_status = outbox.enqueue(f"{email_id}:interview_invitation", candidate_email,
+                                                          'interview_invitation', name=candidate_name,
+                                                          position=position, interview_time=email_time_display)
                             print(email_status)
                             scheduled_count += 1
-                            _mark_email_as_read_logic(email_id)
+                            scheduled_by_role[role['id']] += 1
+                            _finish_email_logic(email_id)
+                            _emit_event(on_event, 'scheduled', email_id=email_id, name=candidate_name, email=candidate_email,
+                                        subject=applicant_info.get('subject'), position=position,
+                                        interview_time=interview_time, sheet_row=sheet_row)
                         else:
                             print(f"Gagal menjadwalkan wawancara untuk {candidate_name}.")
                             rejected_count += 1
-                            _mark_email_as_read_logic(email_id)
+                            _finish_email_logic(email_id)
+                            _emit_event(on_event, 'rejected', email_id=email_id, name=candidate_name, email=candidate_email,
+                                        subject=applicant_info.get('subject'), reason="Gagal menjadwalkan wawancara",
+                                        position=position, sheet_row=None)
                     else:
                         print(f"Tidak ada slot wawancara yang tersedia untuk {candidate_name}.")
                         rejected_count += 1
-                        _mark_email_as_read_logic(email_id)
+                        _finish_email_logic(email_id)
+                        _emit_event(on_event, 'rejected', email_id=email_id, name=candidate_name, email=candidate_email,
+                                    subject=applicant_info.get('subject'), reason="Tidak ada slot wawancara",
+                                    position=position, sheet_row=None)
                     
+            except RetryableError as e:
+                deferred_count += defer_remaining(index, email_id, e)
+                break
             except Exception as e:
                 print(f"Kesalahan fatal saat memproses email {email_id}: {e}")
-                _mark_email_as_read_logic(email_id)
+                try:
+                    _finish_email_logic(email_id)
+                except RetryableError as retry_error:
+                    deferred_count += defer_remaining(index, email_id, retry_error)
+                    break
+                _emit_event(on_event, 'error', email_id=email_id, message=str(e))
                 continue
     
     except Exception as e:
         print(f"Kesalahan umum dalam proses utama: {e}")
+        _emit_event(on_event, 'error', email_id=None, message=str(e))
         return json.dumps({
             "summary_message": f"Terjadi kesalahan dalam proses: {str(e)}",
-            "processed_count": processed_count, "scheduled_count": scheduled_count, "rejected_count": rejected_count
+            "completed": False,
+            "processed_count": processed_count, "scheduled_count": scheduled_count, "rejected_count": rejected_count,
+            "deferred_count": deferred_count, "manual_review_count": manual_review_count,
+            "prescreen": run_prescreen_stats,
+            "rate_limiter": get_run_limiter_stats(run_metrics),
+            "stage_metrics": metrics.summarize_run(run_metrics)
         })
+    finally:
+        # Tunggu email di outbox terkirim agar waktunya tercatat di run ini dan ringkasannya akurat.
+        outbox.flush()
+        # OCR milik run ini yang belum diambil hasilnya (run berhenti lebih awal) dibatalkan satu per satu;
+        # OCR run lain tetap berjalan, dan emailnya tetap belum dibaca.
+        for _, future, _ in ocr_pending.values():
+            ocr.cancel(future)
+        with _prescreen_stats_lock:
+            for key, value in run_prescreen_stats.items():
+                prescreen_stats[key] += value
+        metrics.end_run(run_metrics)
 
     summary_message = f"Proses agen HRD selesai. Jumlah email diproses: {processed_count}. Berhasil dijadwalkan: {scheduled_count}. Ditolak: {rejected_count}."
+    if manual_review_count:
+        summary_message += f" Perlu tinjauan manual: {manual_review_count}."
+    if deferred_count:
+        summary_message += f" Ditunda ke run berikutnya (kuota atau OCR): {deferred_count}."
     print("\n--- Proses Selesai ---") 
     print(summary_message) 
-
-    return json.dumps({
+    print(f"Pra-screening: {run_prescreen_stats['llm_calls_saved']} panggilan LLM dihemat.")
+    total_input_tokens = sum(entry['usage']['input_tokens'] for entry in token_usage)
+    total_output_tokens = sum(entry['usage']['output_tokens'] for entry in token_usage)
+    print(f"Token LLM: {total_input_tokens} input, {total_output_tokens} output.")
+    stage_metrics = metrics.summarize_run(run_metrics)
+    print(f"Tahap paling lama: {stage_metrics['dominant_stage']}")
+    outbox_after = outbox.stats(get_current_tenant()['id'])
+    run_outbox_stats = {key: value - outbox_before.get(key, 0) for key, value in outbox_after.items() if key != 'pending'}
+    print(f"Outbox: {run_outbox_stats['sent']} email terkirim dalam {run_outbox_stats['batches']} batch, "
+          f"{run_outbox_stats['failed']} gagal, {run_outbox_stats['duplicates_skipped']} duplikat dilewati.")
+
+    result = {
+        "tenant": get_current_tenant()['id'],
         "summary_message": summary_message,
+        "completed": True,
         "processed_count": processed_count,
         "scheduled_count": scheduled_count,
-        "rejected_count": rejected_count
+        "rejected_count": rejected_count,
+        "deferred_count": deferred_count,
+        "manual_review_count": manual_review_count,
+        "scheduled_by_role": scheduled_by_role,
+        "prescreen": run_prescreen_stats,
+        "token_usage": {
+            "input_tokens": total_input_tokens,
+            "output_tokens": total_output_tokens,
+            "per_candidate": [{"email_id": entry['email_id'], "name": entry['name'], **entry['usage']} for entry in token_usage]
+        },
+        "outbox": run_outbox_stats,
+        "rate_limiter": get_run_limiter_stats(run_metrics),
+        "stage_metrics": stage_metrics
+    }
+    if cassette.get_active() is not None:
+        result["cassette"] = cassette.get_active().stats()
+    return json.dumps(result)
+
+_gmail_push_locks = {}
+_gmail_push_locks_guard = threading.Lock()
+
+def process_gmail_notifications(history_id: str = None) -> str:
+    """
+    Memproses satu micro-batch notifikasi Gmail tenant aktif: hanya email lamaran yang masuk sejak
+    historyId terakhir yang diproses. Batch milik tenant yang sama dijalankan berurutan.
+    Jika belum ada historyId tersimpan atau historyId sudah kedaluwarsa, kotak masuk dipindai penuh sekali.
+    """
+    with _gmail_push_locks_guard:
+        push_lock = _gmail_push_locks.setdefault(get_current_tenant()['id'], threading.Lock())
+    with push_lock:
+        state = _load_gmail_watch_state()
+        start_history_id = state.get('history_id')
+        email_ids, latest_history_id = None, history_id
+        if start_history_id:
+            email_ids, latest_history_id = _get_new_job_applications_from_history_logic(start_history_id)
+
+        if email_ids is None:
+            print("Tidak ada historyId yang valid, memindai seluruh kotak masuk...")
+            output = run_agent_process()
+        elif not email_ids:
+            print("Notifikasi Gmail tidak berisi lamaran baru.")
+            output = json.dumps({
+                "summary_message": "Tidak ada email lamaran baru yang ditemukan untuk diproses.",
+                "completed": True,
+                "processed_count": 0, "scheduled_count": 0, "rejected_count": 0
+            })
+        else:
+            output = run_agent_process(email_ids=email_ids)
+
+        # historyId hanya dimajukan setelah run selesai tanpa email tertunda. Run yang gagal di tengah
+        # (Sheets tidak terjangkau, kesalahan umum) atau menunda email karena kuota meninggalkan email
+        # belum dibaca; batch berikutnya mengambilnya lagi (email yang sudah dibaca otomatis tersaring).
+        summary = json.loads(output)
+        if summary.get('completed') and not summary.get('deferred_count'):
+            candidates = [value for value in (latest_history_id, history_id, start_history_id) if value]
+            if candidates:
+                state['history_id'] = str(max(int(value) for value in candidates))
+                _save_gmail_watch_state(state)
+        return output
+
+# Jumlah tenant yang diproses bersamaan oleh run_all_tenants.
+TENANT_MAX_WORKERS = int(_get_float_env("TENANT_MAX_WORKERS", 4))
+
+def _run_agent_for_tenant(tenant: dict, profile: bool = False) -> dict:
+    with use_tenant(tenant):
+        print(f"\n=== Tenant {tenant['id']} ({tenant['name']}) ===")
+        try:
+            # Diprofil di thread tenant itu sendiri; profiler di thread koordinator hanya melihat executor.map.
+            if profile:
+                return json.loads(profiling.profile_json_call(run_agent_process, label=tenant['id']))
+            return json.loads(run_agent_process())
+        except Exception as e:
+            print(f"Run agen untuk tenant {tenant['id']} gagal: {e}")
+            return {"tenant": tenant['id'], "summary_message": f"Terjadi kesalahan dalam proses: {str(e)}",
+                    "completed": False, "processed_count": 0, "scheduled_count": 0, "rejected_count": 0}
+
+def run_all_tenants(max_workers: int = None, profile: bool = False) -> str:
+    """
+    Menjalankan agen untuk semua tenant secara paralel (satu thread per tenant, maksimal
+    TENANT_MAX_WORKERS). Kuota Gemini global dibagi round-robin antar-tenant sehingga tenant
+    dengan kotak masuk besar tidak menghambat tenant lain.
+    Dengan `profile`, run setiap tenant diprofil dan laporannya ada di ringkasan tenant tersebut.
+    """
+    all_tenants = tenants.load_tenants()
+    max_workers = max_workers or min(len(all_tenants), TENANT_MAX_WORKERS)
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="hr-agent-tenant") as executor:
+        results = dict(zip((tenant['id'] for tenant in all_tenants),
+                           executor.map(lambda tenant: _run_agent_for_tenant(tenant, profile), all_tenants)))
+
+    totals = {key: sum(result.get(key, 0) or 0 for result in results.values())
+              for key in ("processed_count", "scheduled_count", "rejected_count", "deferred_count", "manual_review_count")}
+    summary_message = f"Proses agen HRD selesai untuk {len(results)} tenant. Jumlah email diproses: {totals['processed_count']}. " \
+                      f"Berhasil dijadwalkan: {totals['scheduled_count']}. Ditolak: {totals['rejected_count']}."
+    return json.dumps({
+        "summary_message": summary_message,
+        "completed": all(result.get('completed') for result in results.values()),
+        **totals,
+        "tenants": results,
+        "gemini_fair_share": get_tenant_stats().get("gemini.default", {})
     })
 
+def _prometheus_counters() -> dict:
+    """Statistik rate limiter, pra-screening, dan antrean tenant proses ini untuk metrics.render_prometheus."""
+    limiter_stats = get_limiter_stats()
+    return {
+        "hr_agent_rate_limiter_wait_seconds_total": (
+            "Total waktu menunggu token rate limiter.", "counter",
+            {(("bucket", name),): stats["wait_seconds"] for name, stats in limiter_stats.items()}),
+        "hr_agent_rate_limiter_backoff_seconds_total": (
+            "Total waktu backoff setelah error sementara.", "counter",
+            {(("bucket", name),): stats["backoff_seconds"] for name, stats in limiter_stats.items()}),
+        "hr_agent_rate_limiter_retries_total": (
+            "Jumlah percobaan ulang karena error sementara.", "counter",
+            {(("bucket", name),): stats["retries"] for name, stats in limiter_stats.items()}),
+        "hr_agent_rate_limiter_failures_total": (
+            "Jumlah panggilan yang tetap gagal setelah semua percobaan ulang.", "counter",
+            {(("bucket", name),): stats["failures"] for name, stats in limiter_stats.items()}),
+        "hr_agent_prescreen_total": (
+            "Hasil pra-screening lokal.", "counter",
+            {(("outcome", key),): value for key, value in prescreen_stats.items() if key != "llm_calls_saved"}),
+        "hr_agent_llm_calls_saved_total": (
+            "Jumlah panggilan LLM yang dihemat oleh pra-screening.", "counter",
+            {(): prescreen_stats["llm_calls_saved"]}),
+        "hr_agent_tenant_wait_seconds_total": (
+            "Total waktu menunggu giliran kuota bersama per tenant.", "counter",
+            {(("bucket", name), ("tenant", tenant)): stats["wait_seconds"]
+             for name, by_tenant in get_tenant_stats().items() for tenant, stats in by_tenant.items()}),
+    }
+
+metrics.register_counters(_prometheus_counters)
+
+def get_prometheus_metrics() -> str:
+    """
+    Metrik kumulatif agen dalam format Prometheus: latensi per tahap,
+    statistik rate limiter, dan hasil pra-screening (gabungan semua worker jika HR_AGENT_METRICS_DIR diisi).
+    """
+    return metrics.render_prometheus(_prometheus_counters())
+
 def test_nabira_screening():
     """Test screening untuk CV XXXX"""
     job_description = "Kami mencari Data Scientist dengan pengalaman minimal 2 tahun di bidang machine learning dan deep learning, mahir dalam Python dan SQL, memiliki kemampuan komunikasi yang baik, memiliki IPK minimal 3.25 dari universitas, serta memiliki kompetensi  bahasa Inggris."
@@ -860,6 +1878,8 @@ def test_nabira_screening():
     
     if result == 'KURANG COCOK':
         print("STATUS: DITOLAK")
+    elif result == 'TIDAK DIKETAHUI':
+        print("STATUS: PERLU TINJAUAN MANUAL")
     else:
         print("STATUS: DITERIMA")
 
@@ -910,6 +1930,26 @@ def manual_test_sheets():
     else:
         print("Connection failed. Please check spreadsheet ID and permissions.")
 
+def reset_worker_state():
+    """
+    Membuat ulang state modul yang tidak boleh dibagi antarproses. Dipanggil setelah fork worker
+    (gunicorn post_fork dengan preload_app): koneksi HTTP klien Google yang di-cache, thread outbox,
+    antrean dan proses pekerja OCR, dan kunci notifikasi Gmail diwarisi dari proses master dan harus dibuat baru.
+    Thread snapshot metrik (lihat metrics.py) juga dimulai di sini, per worker.
+    """
+    global _service_cache, outbox, progress, _gmail_push_locks, _gmail_push_locks_guard
+    _service_cache = threading.local()
+    outbox = Outbox(lambda: get_google_services(), store_path=outbox.store_path)
+    progress = email_progress.EmailProgress(progress.store_path)
+    _gmail_push_locks = {}
+    _gmail_push_locks_guard = threading.Lock()
+    ocr.reset_after_fork()
+    metrics.start_worker_snapshots()
+
+# Mode rekam/putar ulang lalu lintas API (HR_AGENT_CASSETTE_MODE=record|replay), lihat cassette.py.
+if cassette.CASSETTE_MODE in ('record', 'replay'):
+    cassette.install()
+
 if __name__ == "__main__":
     test_nabira_screening()
     test_summarization()
\ No newline at end of file
@@ -0,0 +1,161 @@
+"""
+Uji beban endpoint baca dashboard (/get-emails dan /get-sheet-data) di bawah gunicorn.
+
+Untuk setiap jumlah worker, server gunicorn dijalankan dengan gunicorn.conf.py, lalu sejumlah
+request dikirim paralel dan throughput (request/detik) serta latensi p50/p95 dilaporkan.
+Dengan --fakes, server memakai Gmail/Sheets palsu (fakes.py) sehingga tidak butuh kredensial.
+
+Contoh:
+    python loadtest.py --fakes --workers 1 2 4 --requests 400 --concurrency 16
+    python loadtest.py --fakes --workers 2 --api-latency-ms 50 --no-cache
+    python loadtest.py --url http://127.0.0.1:5000 --requests 200   # server yang sudah berjalan
+"""
+import argparse
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import httpx
+
+ENDPOINTS = ["/get-emails", "/get-sheet-data"]
+
+
+def fake_application():
+    """
+    Factory WSGI untuk gunicorn ('loadtest:fake_application()'): aplikasi asli dengan layanan palsu.
+    Ukuran kotak surat dan latensi API diatur lewat LOADTEST_MAILBOX_SIZE dan LOADTEST_API_LATENCY_MS.
+    """
+    os.environ.setdefault("GOOGLE_API_KEY", "loadtest-offline")
+    import benchmark
+    import fakes
+    from api import app
+
+    backend = fakes.FakeGoogleBackend(latency_ms=float(os.getenv("LOADTEST_API_LATENCY_MS", 0)))
+    fakes.generate_mailbox(backend, int(os.getenv("LOADTEST_MAILBOX_SIZE", 20)))
+    # Yang diukur kapasitas server, bukan kuota Google; limiter dibuka seperti di benchmark.
+    benchmark._unlimited_rate_limits(0.001)
+    fakes.install(backend, fakes.FakeLLM())
+    return app
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _wait_until_ready(base_url: str, process, timeout: float = 60.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"gunicorn berhenti dengan kode {process.returncode}")
+        try:
+            if httpx.get(f"{base_url}/", timeout=1.0).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"Server di {base_url} tidak siap dalam {timeout} detik")
+
+
+def _percentile(sorted_values: list, quantile: float) -> float:
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(quantile * len(sorted_values)))]
+
+
+def run_load(base_url: str, total_requests: int, concurrency: int) -> dict:
+    """Mengirim `total_requests` GET bergantian ke ENDPOINTS dengan `concurrency` klien paralel."""
+    latencies, errors = [], 0
+
+    def one_request(index: int, client: httpx.Client):
+        start = time.perf_counter()
+        response = client.get(f"{base_url}{ENDPOINTS[index % len(ENDPOINTS)]}")
+        return time.perf_counter() - start, response.status_code
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    with httpx.Client(timeout=120.0, limits=limits) as client, ThreadPoolExecutor(concurrency) as pool:
+        start = time.perf_counter()
+        for latency, status in pool.map(lambda index: one_request(index, client), range(total_requests)):
+            latencies.append(latency)
+            errors += status != 200
+        elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        "requests": total_requests,
+        "errors": errors,
+        "seconds": round(elapsed, 3),
+        "requests_per_second": round(total_requests / elapsed, 1) if elapsed else None,
+        "p50_ms": round(_percentile(latencies, 0.50) * 1000, 1),
+        "p95_ms": round(_percentile(latencies, 0.95) * 1000, 1),
+    }
+
+
+def run_with_gunicorn(workers: int, total_requests: int, concurrency: int, use_fakes: bool,
+                      api_latency_ms: float, mailbox_size: int, read_cache: bool, threads: int) -> dict:
+    port = _free_port()
+    env = dict(os.environ, WEB_CONCURRENCY=str(workers), GUNICORN_THREADS=str(threads),
+               GUNICORN_BIND=f"127.0.0.1:{port}", LOADTEST_API_LATENCY_MS=str(api_latency_ms),
+               LOADTEST_MAILBOX_SIZE=str(mailbox_size))
+    if not read_cache:
+        env["READ_CACHE_TTL_SECONDS"] = "0"
+    app_spec = "loadtest:fake_application()" if use_fakes else "wsgi:application"
+    command = [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", app_spec]
+    process = subprocess.Popen(command, env=env, cwd=os.path.dirname(os.path.abspath(__file__)),
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    base_url = f"http://127.0.0.1:{port}"
+    try:
+        _wait_until_ready(base_url, process)
+        # Pemanasan: klien Google per worker dibuat saat request pertama.
+        run_load(base_url, workers * threads, min(concurrency, workers * threads))
+        return {"workers": workers, "threads": threads, **run_load(base_url, total_requests, concurrency)}
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(description="Uji beban /get-emails dan /get-sheet-data.")
+    arg_parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4], help="Jumlah worker gunicorn per skenario.")
+    arg_parser.add_argument("--threads", type=int, default=8, help="Thread per worker (gthread).")
+    arg_parser.add_argument("--requests", type=int, default=400, help="Jumlah request per skenario.")
+    arg_parser.add_argument("--concurrency", type=int, default=16, help="Jumlah klien paralel.")
+    arg_parser.add_argument("--fakes", action="store_true", help="Pakai Gmail/Sheets palsu (fakes.py) di server.")
+    arg_parser.add_argument("--api-latency-ms", type=float, default=20.0, help="Latensi buatan API palsu.")
+    arg_parser.add_argument("--mailbox-size", type=int, default=20, help="Jumlah email di kotak surat palsu.")
+    arg_parser.add_argument("--no-cache", action="store_true", help="Matikan cache baca (READ_CACHE_TTL_SECONDS=0).")
+    arg_parser.add_argument("--url", help="Uji server yang sudah berjalan alih-alih menjalankan gunicorn.")
+    arg_parser.add_argument("--json", dest="json_path", help="Simpan hasil ke file JSON.")
+    args = arg_parser.parse_args(argv)
+
+    if args.url:
+        results = [{"workers": None, **run_load(args.url.rstrip('/'), args.requests, args.concurrency)}]
+    else:
+        results = [run_with_gunicorn(workers, args.requests, args.concurrency, args.fakes, args.api_latency_ms,
+                                     args.mailbox_size, not args.no_cache, args.threads)
+                   for workers in args.workers]
+
+    cache = "tanpa cache" if args.no_cache else "dengan cache baca"
+    print(f"\n=== Uji beban {', '.join(ENDPOINTS)} ({cache}, {args.concurrency} klien paralel) ===")
+    print(f"  {'workers':>7} {'req/s':>9} {'p50 ms':>9} {'p95 ms':>9} {'error':>6}")
+    for result in results:
+        print(f"  {str(result['workers'] or '-'):>7} {result['requests_per_second']:>9} "
+              f"{result['p50_ms']:>9} {result['p95_ms']:>9} {result['errors']:>6}")
+
+    if args.json_path:
+        with open(args.json_path, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+        print(f"\nHasil disimpan ke {args.json_path}")
+    return results
+
+
+if __name__ == "__main__":
+    main()
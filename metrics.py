@@ -0,0 +1,323 @@
+"""
+Instrumentasi latensi per tahap pipeline agen HRD.
+
+Setiap tahap (list, fetch, attachment_download, pdf_parse, clean, screen, summarize, slot_search,
+event_insert, sheet_append, email_send, mark_read, ...) dicatat jumlah panggilan, error, dan
+latensinya. Data kumulatif diekspor dalam format Prometheus, sedangkan data per run disertakan
+dalam ringkasan JSON `run_agent_process`.
+
+Dengan beberapa worker gunicorn, setiap worker hanya punya statistiknya sendiri. Jika
+HR_AGENT_METRICS_DIR diisi (gunicorn.conf.py mengisinya secara default), setiap worker menulis
+snapshot statistiknya ke `<dir>/worker_<pid>.json` (berkala, setelah setiap run, dan saat melayani
+/metrics), dan /metrics menjumlahkan snapshot semua worker. Persentil gabungan dihitung dari
+MAX_EXPORTED_SAMPLES sampel terakhir per tahap per worker, sehingga merupakan perkiraan.
+"""
+import contextvars
+import json
+import math
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+
+# Jumlah sampel latensi terakhir yang disimpan per tahap untuk menghitung persentil.
+MAX_SAMPLES_PER_STAGE = 10000
+
+QUANTILES = (0.5, 0.95, 0.99)
+
+# Direktori bersama untuk menggabungkan metrik antar-worker; kosong berarti hanya proses ini.
+METRICS_DIR = os.getenv("HR_AGENT_METRICS_DIR", "")
+METRICS_FLUSH_SECONDS = float(os.getenv("HR_AGENT_METRICS_FLUSH_SECONDS", 10))
+# Sampel latensi per tahap yang ikut ditulis ke snapshot worker (membatasi ukuran file).
+MAX_EXPORTED_SAMPLES = 1000
+
+
+def _percentile(sorted_values: list, quantile: float) -> float:
+    """Persentil metode nearest-rank dari daftar yang sudah diurutkan."""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(quantile * len(sorted_values)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def _summarize_stage(data: dict, sorted_samples: list) -> dict:
+    return {
+        "count": data["count"],
+        "errors": data["errors"],
+        "error_rate": round(data["errors"] / data["count"], 4) if data["count"] else 0.0,
+        "total_seconds": round(data["total_seconds"], 6),
+        **{f"p{int(q * 100)}": round(_percentile(sorted_samples, q), 6) for q in QUANTILES}
+    }
+
+
+class StageMetrics:
+    """Kumpulan statistik latensi per tahap. Aman dipakai dari banyak thread."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stages = {}
+        # Penghitung tambahan per kelompok, misalnya statistik rate limiter per bucket dalam satu run.
+        self._counts = {}
+
+    def record(self, stage: str, seconds: float, error: bool = False):
+        with self._lock:
+            data = self._stages.get(stage)
+            if data is None:
+                data = {"count": 0, "errors": 0, "total_seconds": 0.0,
+                        "samples": deque(maxlen=MAX_SAMPLES_PER_STAGE)}
+                self._stages[stage] = data
+            data["count"] += 1
+            data["errors"] += 1 if error else 0
+            data["total_seconds"] += seconds
+            data["samples"].append(seconds)
+
+    def snapshot(self) -> dict:
+        """
+        Mengembalikan {tahap: {count, errors, error_rate, total_seconds, p50, p95, p99}}.
+        Latensi dalam detik.
+        """
+        with self._lock:
+            stages = {name: (dict(data), sorted(data["samples"])) for name, data in self._stages.items()}
+        return {name: _summarize_stage(data, samples) for name, (data, samples) in stages.items()}
+
+    def export(self, max_samples: int = MAX_EXPORTED_SAMPLES) -> dict:
+        """Data mentah {tahap: {count, errors, total_seconds, samples}} untuk snapshot worker."""
+        with self._lock:
+            return {name: {"count": data["count"], "errors": data["errors"],
+                           "total_seconds": data["total_seconds"],
+                           "samples": list(data["samples"])[-max_samples:]}
+                    for name, data in self._stages.items()}
+
+    def add_counts(self, group: str, amounts: dict):
+        with self._lock:
+            counts = self._counts.setdefault(group, {})
+            for key, value in amounts.items():
+                counts[key] = counts.get(key, 0) + value
+
+    def counts_snapshot(self) -> dict:
+        """Mengembalikan salinan {kelompok: {nama: nilai}} dari add_counts."""
+        with self._lock:
+            return {group: dict(counts) for group, counts in self._counts.items()}
+
+    def reset(self):
+        with self._lock:
+            self._stages.clear()
+            self._counts.clear()
+
+
+# Statistik kumulatif sejak proses dimulai (diekspor lewat /metrics).
+registry = StageMetrics()
+
+# Statistik milik run yang sedang berjalan di konteks ini. Tenant yang berjalan paralel
+# (run_all_tenants) masing-masing punya run sendiri, sehingga sampelnya tidak saling tercampur.
+_current_run = contextvars.ContextVar("hr_agent_run_metrics", default=None)
+
+
+def record(stage: str, seconds: float, error: bool = False):
+    registry.record(stage, seconds, error)
+    run_metrics = _current_run.get()
+    if run_metrics is not None:
+        run_metrics.record(stage, seconds, error)
+
+
+@contextmanager
+def stage_timer(stage: str):
+    """
+    Mengukur durasi blok kode sebagai satu tahap pipeline.
+    Exception yang keluar dari blok dihitung sebagai error tahap tersebut, lalu diteruskan.
+    """
+    start = time.perf_counter()
+    error = False
+    try:
+        yield
+    except BaseException:
+        error = True
+        raise
+    finally:
+        record(stage, time.perf_counter() - start, error)
+
+
+def begin_run() -> StageMetrics:
+    """Mulai mengumpulkan statistik terpisah untuk satu run agen di konteks (thread) saat ini."""
+    run_metrics = StageMetrics()
+    run_metrics._context_token = _current_run.set(run_metrics)
+    return run_metrics
+
+
+def end_run(run_metrics: StageMetrics):
+    token = getattr(run_metrics, '_context_token', None)
+    if token is not None:
+        _current_run.reset(token)
+        run_metrics._context_token = None
+    write_worker_snapshot()
+
+
+def current_run() -> StageMetrics:
+    """Run yang sedang aktif di konteks ini, atau None."""
+    return _current_run.get()
+
+
+@contextmanager
+def use_run(run_metrics: StageMetrics):
+    """
+    Mencatat tahap atas nama `run_metrics` dari thread lain (misalnya worker outbox),
+    karena thread baru tidak mewarisi konteks run pemanggilnya.
+    """
+    token = _current_run.set(run_metrics)
+    try:
+        yield run_metrics
+    finally:
+        _current_run.reset(token)
+
+
+def summarize_run(run_metrics: StageMetrics) -> dict:
+    """Ringkasan statistik satu run, termasuk tahap yang paling banyak memakan waktu."""
+    stages = run_metrics.snapshot()
+    dominant_stage = max(stages, key=lambda name: stages[name]["total_seconds"]) if stages else None
+    return {"dominant_stage": dominant_stage, "stages": stages}
+
+
+# Fungsi tanpa argumen yang mengembalikan metrik tambahan proses ini (format `counters` di
+# render_prometheus); didaftarkan oleh hr_agent_real agar ikut masuk snapshot worker.
+_counter_provider = None
+
+
+def register_counters(provider):
+    global _counter_provider
+    _counter_provider = provider
+
+
+def _local_counters() -> dict:
+    return _counter_provider() if _counter_provider is not None else {}
+
+
+def write_worker_snapshot(counters: dict = None):
+    """Menulis snapshot statistik proses ini ke HR_AGENT_METRICS_DIR (jika diisi)."""
+    if not METRICS_DIR:
+        return
+    if counters is None:
+        counters = _local_counters()
+    snapshot = {
+        "pid": os.getpid(),
+        "stages": registry.export(),
+        "counters": [[name, help_text, metric_type, [list(label) for label in labels], value]
+                     for name, (help_text, metric_type, samples) in counters.items()
+                     for labels, value in samples.items()]
+    }
+    path = os.path.join(METRICS_DIR, f"worker_{os.getpid()}.json")
+    temp_path = f"{path}.tmp"
+    try:
+        os.makedirs(METRICS_DIR, exist_ok=True)
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(snapshot, f)
+        os.replace(temp_path, path)
+    except OSError as e:
+        print(f"Gagal menulis snapshot metrik ke {path}: {e}")
+
+
+def _snapshot_loop():
+    while True:
+        time.sleep(METRICS_FLUSH_SECONDS)
+        try:
+            write_worker_snapshot()
+        except Exception as e:
+            print(f"Gagal memperbarui snapshot metrik: {e}")
+
+
+def start_worker_snapshots():
+    """
+    Dipanggil di setiap worker setelah fork: menulis snapshot pertama lalu memperbaruinya setiap
+    METRICS_FLUSH_SECONDS, agar statistik dari worker yang tidak melayani /metrics tetap terbaru.
+    """
+    if not METRICS_DIR:
+        return
+    write_worker_snapshot()
+    threading.Thread(target=_snapshot_loop, name="hr-agent-metrics-snapshot", daemon=True).start()
+
+
+def clear_worker_snapshots():
+    """Menghapus snapshot worker lama. Dipanggil sekali saat master gunicorn mulai."""
+    if not METRICS_DIR or not os.path.isdir(METRICS_DIR):
+        return
+    for name in os.listdir(METRICS_DIR):
+        if name.startswith("worker_"):
+            try:
+                os.remove(os.path.join(METRICS_DIR, name))
+            except OSError:
+                pass
+
+
+def _merge_worker_snapshots() -> tuple:
+    """
+    Menjumlahkan snapshot semua worker. Snapshot worker yang sudah berhenti tetap dihitung agar
+    counter tidak turun; direktori dikosongkan saat gunicorn dimulai ulang.
+    """
+    stages = {}
+    counters = {}
+    for name in sorted(os.listdir(METRICS_DIR)):
+        if not (name.startswith("worker_") and name.endswith(".json")):
+            continue
+        try:
+            with open(os.path.join(METRICS_DIR, name), 'r', encoding='utf-8') as f:
+                snapshot = json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            print(f"Gagal membaca snapshot metrik {name}: {e}")
+            continue
+        for stage, data in snapshot.get("stages", {}).items():
+            merged = stages.setdefault(stage, {"count": 0, "errors": 0, "total_seconds": 0.0, "samples": []})
+            merged["count"] += data["count"]
+            merged["errors"] += data["errors"]
+            merged["total_seconds"] += data["total_seconds"]
+            merged["samples"].extend(data["samples"])
+        for metric_name, help_text, metric_type, labels, value in snapshot.get("counters", []):
+            samples = counters.setdefault(metric_name, (help_text, metric_type, {}))[2]
+            key = tuple(tuple(label) for label in labels)
+            samples[key] = samples.get(key, 0) + value
+    return ({stage: _summarize_stage(data, sorted(data["samples"])) for stage, data in stages.items()},
+            counters)
+
+
+def _escape_label(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def render_prometheus(counters: dict = None) -> str:
+    """
+    Merender statistik kumulatif dalam format teks Prometheus.
+    `counters` opsional berbentuk {nama_metrik: (bantuan, tipe, {((label, nilai_label), ...): nilai})}
+    untuk metrik tambahan seperti statistik rate limiter dan pra-screening; jika tidak diisi, dipakai
+    metrik dari register_counters. Dengan HR_AGENT_METRICS_DIR, hasilnya gabungan semua worker.
+    """
+    if counters is None:
+        counters = _local_counters()
+    if METRICS_DIR:
+        write_worker_snapshot(counters)
+        stages, counters = _merge_worker_snapshots()
+    else:
+        stages = registry.snapshot()
+    lines = [
+        "# HELP hr_agent_stage_duration_seconds Latensi per tahap pipeline agen HRD.",
+        "# TYPE hr_agent_stage_duration_seconds summary",
+    ]
+    for name, data in sorted(stages.items()):
+        label = _escape_label(name)
+        for q in QUANTILES:
+            lines.append(f'hr_agent_stage_duration_seconds{{stage="{label}",quantile="{q}"}} {data[f"p{int(q * 100)}"]}')
+        lines.append(f'hr_agent_stage_duration_seconds_sum{{stage="{label}"}} {data["total_seconds"]}')
+        lines.append(f'hr_agent_stage_duration_seconds_count{{stage="{label}"}} {data["count"]}')
+
+    lines.append("# HELP hr_agent_stage_errors_total Jumlah error per tahap pipeline agen HRD.")
+    lines.append("# TYPE hr_agent_stage_errors_total counter")
+    for name, data in sorted(stages.items()):
+        lines.append(f'hr_agent_stage_errors_total{{stage="{_escape_label(name)}"}} {data["errors"]}')
+
+    for metric_name, (help_text, metric_type, samples) in counters.items():
+        lines.append(f"# HELP {metric_name} {help_text}")
+        lines.append(f"# TYPE {metric_name} {metric_type}")
+        for labels, value in samples.items():
+            label_text = ','.join(f'{key}="{_escape_label(val)}"' for key, val in labels)
+            lines.append(f"{metric_name}{{{label_text}}} {value}" if label_text else f"{metric_name} {value}")
+
+    return "\n".join(lines) + "\n"
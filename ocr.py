@@ -0,0 +1,221 @@
+"""
+OCR cadangan untuk resume PDF hasil pindaian (halaman berupa gambar tanpa lapisan teks).
+
+OCR memakai Tesseract lokal lewat dukungan OCR PyMuPDF (`page.get_textpage_ocr`) dan dijalankan di
+proses pekerja terpisah yang jumlahnya dibatasi (`OCR_MAX_WORKERS`), sehingga jalur cepat (PDF dengan
+teks) tidak terpengaruh. Hanya `OCR_MAX_PAGES` halaman pertama yang dibaca.
+
+Setiap pekerjaan mendapat batas waktu `OCR_TIMEOUT_SECONDS` sendiri yang dihitung sejak pekerjaan itu
+mulai dijalankan, bukan sejak diantrekan, sehingga PDF di belakang antrean tidak gagal sebelum sempat
+diproses. Batas yang sama dipakai di dalam proses pekerja (halaman berikutnya tidak dibaca setelah
+waktunya habis). Pekerjaan yang tetap melewatinya, atau yang dibatalkan lewat `cancel()`, dihentikan
+dengan mematikan proses pekerjanya saja; OCR lain (termasuk milik tenant lain) tetap berjalan.
+Fitur ini nonaktif kecuali OCR_ENABLED=true.
+"""
+import multiprocessing
+import os
+import queue
+import shutil
+import threading
+import time
+from concurrent.futures import Future
+
+import fitz
+
+
+OCR_ENABLED = os.getenv("OCR_ENABLED", "false").lower() in ("1", "true", "yes")
+OCR_MAX_WORKERS = max(1, int(float(os.getenv("OCR_MAX_WORKERS", 2))))
+OCR_MAX_PAGES = max(1, int(float(os.getenv("OCR_MAX_PAGES", 3))))
+OCR_TIMEOUT_SECONDS = float(os.getenv("OCR_TIMEOUT_SECONDS", 60))
+OCR_DPI = int(float(os.getenv("OCR_DPI", 200)))
+# Bahasa Tesseract, misalnya "eng+ind" jika data bahasa Indonesia terpasang.
+OCR_LANGUAGE = os.getenv("OCR_LANGUAGE", "eng")
+
+
+def is_available() -> bool:
+    """OCR hanya bisa dipakai jika data bahasa Tesseract (tessdata) ditemukan oleh PyMuPDF."""
+    if os.getenv("TESSDATA_PREFIX") or shutil.which("tesseract"):
+        return True
+    try:
+        return bool(fitz.get_tessdata())
+    except Exception:
+        return False
+
+
+def ocr_pdf_bytes(pdf_bytes: bytes, max_pages: int = None, language: str = None, dpi: int = None,
+                  time_budget: float = None) -> dict:
+    """
+    Menjalankan OCR pada halaman-halaman pertama PDF. Dipanggil di proses pekerja.
+    Setelah `time_budget` detik habis, halaman berikutnya tidak dibaca lagi.
+    Mengembalikan {"text", "pages", "seconds"}.
+    """
+    start = time.perf_counter()
+    max_pages = max_pages or OCR_MAX_PAGES
+    text_parts = []
+    with fitz.open(stream=pdf_bytes, filetype="pdf") as doc:
+        for page_number in range(min(len(doc), max_pages)):
+            if time_budget is not None and text_parts and time.perf_counter() - start >= time_budget:
+                break
+            page = doc[page_number]
+            textpage = page.get_textpage_ocr(dpi=dpi or OCR_DPI, full=True, language=language or OCR_LANGUAGE)
+            text_parts.append(page.get_text(textpage=textpage))
+    return {"text": "".join(text_parts), "pages": len(text_parts), "seconds": time.perf_counter() - start}
+
+
+class _OcrWorker:
+    """
+    Satu proses pekerja OCR yang dipakai ulang oleh satu thread pengirim. Proses dibuat saat pekerjaan
+    pertama datang dan dibuat ulang setelah dimatikan (timeout atau pembatalan).
+    """
+
+    def __init__(self):
+        self.process = None
+        self.conn = None
+
+    def _start(self):
+        # 'spawn' agar proses pekerja tidak mewarisi thread (outbox, debouncer) dari proses utama.
+        context = multiprocessing.get_context("spawn")
+        parent_conn, child_conn = context.Pipe()
+        process = context.Process(target=_worker_main, args=(child_conn,), name="hr-agent-ocr", daemon=True)
+        try:
+            process.start()
+        finally:
+            child_conn.close()
+        self.process, self.conn = process, parent_conn
+        # Menunggu proses siap agar waktu start proses tidak ikut memakan batas waktu pekerjaan pertama.
+        self.conn.recv()
+
+    def run(self, func, args: tuple, timeout: float):
+        """Menjalankan `func(*args)` di proses pekerja, paling lama `timeout` detik sejak dikirim."""
+        try:
+            if self.process is None or not self.process.is_alive():
+                self._start()
+            self.conn.send((func, args))
+            finished = self.conn.poll(timeout)
+            if finished:
+                ok, payload = self.conn.recv()
+        except (EOFError, OSError) as e:
+            self.stop()
+            raise RuntimeError("Proses OCR berhenti sebelum selesai (dibatalkan atau crash)") from e
+        except BaseException:
+            self.stop()
+            raise
+        if not finished:
+            self.stop()
+            raise TimeoutError(f"OCR melebihi batas waktu {timeout:g} detik")
+        if not ok:
+            raise RuntimeError(payload)
+        return payload
+
+    def kill(self):
+        """Mematikan proses yang sedang menjalankan pekerjaan; thread pengirimnya menerima EOF."""
+        process = self.process
+        if process is not None and process.is_alive():
+            process.terminate()
+
+    def stop(self):
+        process, conn = self.process, self.conn
+        self.process = self.conn = None
+        if process is not None:
+            if process.is_alive():
+                process.terminate()
+            process.join(timeout=5)
+        if conn is not None:
+            conn.close()
+
+
+def _worker_main(conn):
+    """Loop di proses pekerja: menerima (fungsi, argumen), mengirim balik (berhasil, hasil_atau_pesan)."""
+    conn.send(None)
+    while True:
+        try:
+            func, args = conn.recv()
+        except EOFError:
+            return
+        try:
+            conn.send((True, func(*args)))
+        except Exception as e:
+            conn.send((False, f"{type(e).__name__}: {e}"))
+
+
+_jobs = queue.Queue()
+_dispatchers = []
+_workers = []
+# Future yang sedang berjalan -> pekerja yang menjalankannya (untuk cancel()).
+_running = {}
+_lock = threading.Lock()
+
+
+def _dispatch_loop(worker: _OcrWorker):
+    while True:
+        future, func, args = _jobs.get()
+        if not future.set_running_or_notify_cancel():
+            continue
+        with _lock:
+            _running[future] = worker
+        try:
+            result = worker.run(func, args, OCR_TIMEOUT_SECONDS)
+        except BaseException as e:
+            future.set_exception(e)
+        else:
+            future.set_result(result)
+        finally:
+            with _lock:
+                _running.pop(future, None)
+
+
+def _submit(func, *args) -> Future:
+    """Mengantrekan `func(*args)` ke salah satu dari OCR_MAX_WORKERS proses pekerja."""
+    with _lock:
+        while len(_dispatchers) < OCR_MAX_WORKERS:
+            worker = _OcrWorker()
+            thread = threading.Thread(target=_dispatch_loop, args=(worker,), name="hr-agent-ocr-dispatch", daemon=True)
+            _workers.append(worker)
+            _dispatchers.append(thread)
+            thread.start()
+    future = Future()
+    _jobs.put((future, func, args))
+    return future
+
+
+def submit(pdf_bytes: bytes) -> Future:
+    """Mengantrekan OCR satu PDF dan langsung mengembalikan Future."""
+    return _submit(ocr_pdf_bytes, pdf_bytes, OCR_MAX_PAGES, OCR_LANGUAGE, OCR_DPI, OCR_TIMEOUT_SECONDS)
+
+
+def cancel(future: Future):
+    """
+    Membatalkan satu OCR: dibuang dari antrean jika belum mulai, atau proses pekerjanya dimatikan
+    jika sedang berjalan (Future.cancel() saja tidak bisa menghentikannya). OCR lain tidak terpengaruh.
+    """
+    if future.cancel():
+        return
+    # Dimatikan sambil memegang lock agar proses yang sudah pindah ke pekerjaan berikutnya tidak ikut dimatikan.
+    with _lock:
+        worker = _running.get(future)
+        if worker is not None:
+            worker.kill()
+
+
+def shutdown():
+    """Membatalkan OCR yang masih antre dan menghentikan semua proses pekerja."""
+    while True:
+        try:
+            future, _, _ = _jobs.get_nowait()
+        except queue.Empty:
+            break
+        future.cancel()
+    with _lock:
+        workers = list(_workers)
+    for worker in workers:
+        worker.kill()
+
+
+def reset_after_fork():
+    """Melupakan antrean, thread, dan proses pekerja milik proses induk (setelah fork tidak bisa dipakai)."""
+    global _jobs, _dispatchers, _workers, _running, _lock
+    _jobs = queue.Queue()
+    _dispatchers = []
+    _workers = []
+    _running = {}
+    _lock = threading.Lock()
@@ -0,0 +1,329 @@
+"""
+Outbox email keluar (penolakan dan undangan wawancara) untuk agen HRD.
+
+- Pesan dirender dari template `string.Template` yang dikompilasi sekali saat modul dimuat, lalu
+  dirakit menjadi MIME mentah dari header yang juga sudah disiapkan, tanpa membuat MIMEText per kandidat.
+- `enqueue` hanya merender dan memasukkan pesan ke antrean; pengiriman dilakukan thread latar belakang
+  yang mengelompokkan pesan ke dalam batch request Gmail dan tetap mengikuti bucket ('gmail', 'send').
+- Setiap pesan memiliki kunci idempotensi (misalnya "<tenant>:<email_id>:rejection") yang disimpan ke
+  file JSON. Kunci yang sudah pernah dikirim, atau sedang dikirim saat proses berhenti, tidak akan
+  dikirim ulang, sehingga run ulang tidak pernah mengirim email ganda ke kandidat.
+"""
+import base64
+import datetime
+import json
+import os
+import queue
+import threading
+import time
+from email.header import Header
+from string import Template
+
+import metrics
+import rate_limiter
+from tenants import get_current_tenant, use_tenant
+
+
+OUTBOX_STORE_FILE = os.getenv("OUTBOX_STORE_FILE", "outbox_store.json")
+# Batch Gmail mendukung hingga 100 request, tetapi Google menyarankan maksimal 50 untuk Gmail.
+OUTBOX_BATCH_SIZE = max(1, min(50, int(float(os.getenv("OUTBOX_BATCH_SIZE", 10)))))
+# Berapa lama worker menunggu pesan tambahan sebelum mengirim batch yang belum penuh.
+OUTBOX_BATCH_WAIT_SECONDS = float(os.getenv("OUTBOX_BATCH_WAIT_SECONDS", 0.5))
+OUTBOX_RETENTION_DAYS = float(os.getenv("OUTBOX_RETENTION_DAYS", 30))
+
+_STAT_KEYS = ("queued", "sent", "duplicates_skipped", "retried", "failed", "batches")
+
+TEMPLATES = {
+    'rejection': (
+        Template("Update Lamaran Pekerjaan"),
+        Template("Halo $name,\n\n"
+                 "Terima kasih atas minat Anda untuk bergabung dengan tim kami. Setelah meninjau lamaran Anda, "
+                 "kami mohon maaf untuk menginformasikan bahwa kami tidak dapat melanjutkan proses seleksi untuk Anda saat ini.\n\n"
+                 "Kami menghargai waktu dan usaha Anda. Semoga sukses di masa depan!\n\n"
+                 "Salam,\nTim HRD")
+    ),
+    'interview_invitation': (
+        Template("Undangan Wawancara untuk Posisi $position"),
+        Template("Halo $name,\n\n"
+                 "Terima kasih atas lamaran Anda. Kami ingin mengundang Anda untuk wawancara terkait posisi $position pada:\n\n"
+                 "Tanggal: $interview_time\n\n"
+                 "Kami akan mengirimkan link meeting secara terpisah.\n\n"
+                 "Salam,\nTim HRD")
+    ),
+}
+
+# Header MIME yang sama untuk semua pesan; hanya penerima dan subjek yang berubah.
+_MIME_HEADERS = Template('Content-Type: text/plain; charset="utf-8"\r\n'
+                         'MIME-Version: 1.0\r\n'
+                         'Content-Transfer-Encoding: base64\r\n'
+                         'to: $to\r\n'
+                         'subject: $subject\r\n\r\n')
+
+
+def _header_value(value: str) -> str:
+    """Mencegah injeksi header dan meng-encode subjek non-ASCII (RFC 2047)."""
+    value = ' '.join(str(value).splitlines())
+    try:
+        value.encode('ascii')
+        return value
+    except UnicodeEncodeError:
+        return Header(value, 'utf-8').encode()
+
+
+def render_message(template: str, recipient: str, **context) -> tuple:
+    """Merender template menjadi (subjek, raw base64url siap kirim ke Gmail API)."""
+    subject_template, body_template = TEMPLATES[template]
+    subject = subject_template.substitute(context)
+    body = body_template.substitute(context)
+    mime = _MIME_HEADERS.substitute(to=_header_value(recipient), subject=_header_value(subject)).encode('ascii') \
+        + base64.encodebytes(body.encode('utf-8'))
+    return subject, base64.urlsafe_b64encode(mime).decode('ascii')
+
+
+class Outbox:
+    """
+    Antrean email keluar dengan pengiriman batch di thread latar belakang.
+    `services_factory` mengembalikan dict layanan Google (seperti get_google_services) untuk tenant aktif.
+    """
+
+    def __init__(self, services_factory, store_path: str = None, batch_size: int = None,
+                 batch_wait_seconds: float = None):
+        self.services_factory = services_factory
+        self.store_path = store_path or OUTBOX_STORE_FILE
+        self.batch_size = batch_size or OUTBOX_BATCH_SIZE
+        self.batch_wait_seconds = OUTBOX_BATCH_WAIT_SECONDS if batch_wait_seconds is None else batch_wait_seconds
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._worker = None
+        self._store = self._load_store()
+        # Statistik per tenant agar ringkasan run tenant yang berjalan paralel tidak saling tercampur.
+        self._stats = {}
+        self._in_queue = set()
+
+    # --- Penyimpanan idempotensi ---
+
+    def _load_store(self) -> dict:
+        try:
+            with open(self.store_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except (OSError, json.JSONDecodeError) as e:
+            print(f"Gagal membaca {self.store_path}: {e}")
+            return {}
+
+    def _merge_disk_store(self, disk_wins: bool = False):
+        """
+        Menggabungkan entri dari file (ditulis worker lain) ke memori. Entri di file menang jika lebih baru
+        (`updated_at`), atau selalu jika `disk_wins`, sehingga salinan 'queued' yang basi di worker ini
+        diganti status 'sent' yang ditulis worker lain. Harus dipanggil dengan self._lock dipegang.
+        """
+        for key, entry in self._load_store().items():
+            current = self._store.get(key)
+            if current is None or disk_wins or entry.get('updated_at', '') > current.get('updated_at', ''):
+                self._store[key] = entry
+
+    def _save_store(self):
+        cutoff = (datetime.datetime.now(datetime.timezone.utc)
+                  - datetime.timedelta(days=OUTBOX_RETENTION_DAYS)).isoformat()
+        with self._lock:
+            # Beberapa worker gunicorn berbagi file yang sama; jangan hapus kunci milik worker lain.
+            self._merge_disk_store()
+            for key in [key for key, entry in self._store.items()
+                        if entry.get('status') == 'sent' and entry.get('updated_at', '') < cutoff]:
+                del self._store[key]
+            snapshot = json.dumps(self._store, indent=2)
+        temp_path = f"{self.store_path}.tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            f.write(snapshot)
+        os.replace(temp_path, self.store_path)
+
+    def _set_status(self, key: str, status: str, **fields):
+        with self._lock:
+            entry = self._store.setdefault(key, {})
+            entry.update(fields, status=status,
+                         updated_at=datetime.datetime.now(datetime.timezone.utc).isoformat())
+            if status == 'sent':
+                entry.pop('raw', None)
+
+    def resume(self):
+        """
+        Dipanggil di awal setiap run (di bawah kunci run): memuat ulang file (isi file menang atas memori,
+        karena worker lain mungkin sudah mengirim pesan yang di sini masih 'queued'), lalu mengantrekan
+        ulang pesan yang masih 'queued' saat proses sebelumnya berhenti.
+        """
+        with self._lock:
+            self._merge_disk_store(disk_wins=True)
+            pending = [(key, entry) for key, entry in self._store.items()
+                       if entry.get('status') == 'queued' and entry.get('raw') and key not in self._in_queue]
+        for key, entry in pending:
+            self._put({"key": key, "tenant": entry.get('tenant'), "recipient": entry['recipient'],
+                       "subject": entry['subject'], "raw": entry['raw'], "attempt": 0})
+        if pending:
+            print(f"Outbox: {len(pending)} email tertunda dari run sebelumnya dimasukkan kembali ke antrean.")
+            self._start_worker()
+
+    def _bump(self, tenant_id: str, key: str, amount: int = 1):
+        """Menambah statistik tenant. Harus dipanggil dengan self._lock dipegang."""
+        counts = self._stats.setdefault(tenant_id, dict.fromkeys(_STAT_KEYS, 0))
+        counts[key] += amount
+
+    def _put(self, item: dict):
+        # Run pemanggil ikut dibawa agar waktu 'email_send' tercatat di run yang mengantrekannya.
+        item.setdefault('run', metrics.current_run())
+        with self._lock:
+            self._in_queue.add(item['key'])
+        self._queue.put(item)
+
+    # --- API publik ---
+
+    def enqueue(self, idempotency_key: str, recipient: str, template: str, **context) -> str:
+        """
+        Merender dan mengantrekan satu email. Mengembalikan pesan status seperti _send_email_reply_logic.
+        Kunci yang sudah pernah diantrekan/dikirim (untuk tenant yang sama) dilewati.
+        """
+        tenant = get_current_tenant()
+        key = f"{tenant['id']}:{idempotency_key}"
+        with self._lock:
+            existing = self._store.get(key)
+            if existing and existing.get('status') in ('queued', 'sending', 'sent'):
+                self._bump(tenant['id'], "duplicates_skipped")
+                return f"Email untuk {recipient} dilewati: sudah {existing['status']} sebelumnya ({idempotency_key})."
+
+        subject, raw = render_message(template, recipient, **context)
+        self._set_status(key, 'queued', tenant=tenant['id'], recipient=recipient, subject=subject, raw=raw)
+        with self._lock:
+            self._bump(tenant['id'], "queued")
+        self._put({"key": key, "tenant": tenant['id'], "recipient": recipient,
+                   "subject": subject, "raw": raw, "attempt": 0})
+        self._start_worker()
+        return f"Email balasan ke {recipient} dengan subjek: {subject} masuk antrean pengiriman."
+
+    def flush(self, timeout: float = None) -> bool:
+        """Menunggu semua email di antrean selesai diproses. Mengembalikan False jika timeout."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self._queue.unfinished_tasks:
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            time.sleep(0.01)
+        return True
+
+    def stats(self, tenant_id: str = None) -> dict:
+        """Statistik satu tenant, atau total semua tenant jika `tenant_id` tidak diisi."""
+        with self._lock:
+            if tenant_id is not None:
+                counts = dict(self._stats.get(tenant_id) or dict.fromkeys(_STAT_KEYS, 0))
+            else:
+                counts = {key: sum(tenant_counts[key] for tenant_counts in self._stats.values())
+                          for key in _STAT_KEYS}
+            return dict(counts, pending=self._queue.unfinished_tasks)
+
+    # --- Worker ---
+
+    def _start_worker(self):
+        with self._lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._run_worker, name="hr-agent-outbox", daemon=True)
+                self._worker.start()
+
+    def _next_batch(self) -> list:
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.batch_wait_seconds
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self._queue.get(timeout=max(0.0, deadline - time.monotonic())))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run_worker(self):
+        while True:
+            batch = self._next_batch()
+            try:
+                groups = {}
+                for item in batch:
+                    groups.setdefault((item['tenant'], id(item.get('run'))), []).append(item)
+                for items in groups.values():
+                    self._send_batch(items[0]['tenant'], items)
+                self._save_store()
+            except Exception as e:
+                print(f"Outbox: kesalahan tak terduga saat mengirim batch: {e}")
+            finally:
+                for item in batch:
+                    with self._lock:
+                        if self._store.get(item['key'], {}).get('status') != 'queued':
+                            self._in_queue.discard(item['key'])
+                    self._queue.task_done()
+
+    def _send_batch(self, tenant_id: str, items: list):
+        import tenants
+        tenant = tenants.get_tenant(tenant_id) or get_current_tenant()
+
+        # Status di file diperiksa ulang: worker lain mungkin sudah mengirim pesan ini sejak diantrekan.
+        with self._lock:
+            self._merge_disk_store()
+            fresh = [item for item in items if self._store.get(item['key'], {}).get('status') == 'queued']
+            self._bump(tenant_id, "duplicates_skipped", len(items) - len(fresh))
+        items = fresh
+        if not items:
+            return
+
+        # Ditandai 'sending' sebelum dikirim: jika proses mati di tengah batch, pesan ini tidak akan
+        # dikirim ulang (lebih baik satu email terlewat daripada kandidat menerima email ganda).
+        for item in items:
+            self._set_status(item['key'], 'sending')
+        self._save_store()
+
+        retry = []
+        with use_tenant(tenant), metrics.use_run(items[0].get('run')), metrics.stage_timer('email_send'):
+            service = self.services_factory()['gmail']
+            results = {}
+
+            def on_response(request_id, response, exception):
+                results[request_id] = (response, exception)
+
+            batch_request = service.new_batch_http_request(callback=on_response)
+            for index, item in enumerate(items):
+                rate_limiter.acquire('gmail', 'send')
+                batch_request.add(service.users().messages().send(userId='me', body={'raw': item['raw']}),
+                                  request_id=str(index))
+            try:
+                batch_request.execute()
+            except Exception as e:
+                # Seluruh batch gagal terkirim (tidak ada satu pun yang sampai ke Gmail), aman untuk diulang.
+                results = {str(index): (None, e) for index in range(len(items))}
+
+        with self._lock:
+            self._bump(tenant_id, "batches")
+        for index, item in enumerate(items):
+            response, exception = results.get(str(index), (None, RuntimeError("Tidak ada respons batch.")))
+            if exception is None:
+                self._set_status(item['key'], 'sent', message_id=(response or {}).get('id'))
+                with self._lock:
+                    self._bump(tenant_id, "sent")
+                continue
+
+            retryable, rate_limited, retry_after = rate_limiter.classify_error(exception)
+            if rate_limited:
+                rate_limiter.get_bucket('gmail', 'send').throttle()
+            if retryable and item['attempt'] < rate_limiter.MAX_RETRIES:
+                item['attempt'] += 1
+                retry.append((item, retry_after))
+            else:
+                print(f"Outbox: gagal mengirim email ke {item['recipient']}: {exception}")
+                self._set_status(item['key'], 'failed', error=str(exception))
+                with self._lock:
+                    self._bump(tenant_id, "failed")
+
+        if retry:
+            delay = max((retry_after for _, retry_after in retry if retry_after is not None), default=None)
+            attempt = max(item['attempt'] for item, _ in retry)
+            if delay is None:
+                delay = min(rate_limiter.BACKOFF_MAX_SECONDS, rate_limiter.BACKOFF_BASE_SECONDS * (2 ** (attempt - 1)))
+            print(f"Outbox: {len(retry)} email gagal sementara, dicoba lagi dalam {delay:.1f} detik.")
+            time.sleep(min(delay, rate_limiter.BACKOFF_MAX_SECONDS))
+            for item, _ in retry:
+                self._set_status(item['key'], 'queued')
+                with self._lock:
+                    self._bump(tenant_id, "retried")
+                self._queue.put(item)
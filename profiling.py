@@ -0,0 +1,160 @@
+"""
+Profiling opsional untuk satu run agen HRD.
+
+Run yang diprofil menulis dua artefak bertimestamp ke PROFILE_DIR:
+- `<timestamp>_<label>.html`: flame graph interaktif dari pyinstrument (jika terpasang), atau
+  tabel hotspot sederhana jika hanya cProfile yang tersedia;
+- `<timestamp>_<label>.pstats`: data pstats yang bisa dibuka dengan `python -m pstats` atau snakeviz.
+
+Ringkasan top-N hotspot (waktu sendiri per fungsi) dan pembagian waktu per pustaka
+(discovery `build()`, dateutil, PyMuPDF, Gemini/LangChain, jaringan) dikembalikan sebagai dict
+untuk disisipkan ke JSON respons. Hanya thread pemanggil yang diprofil; pengiriman outbox dan
+OCR berjalan di thread/proses lain dan terlihat di stage_metrics.
+
+Diaktifkan per request dengan `?profile=1` pada POST `/run-hr-agent` atau `/run-hr-agent/stream`, atau untuk
+semua run (termasuk batch push Gmail) dengan HR_AGENT_PROFILE=true. Pada `?tenant=all` setiap tenant
+diprofil di thread-nya sendiri dan laporannya disertakan per tenant.
+"""
+import cProfile
+import datetime
+import html
+import io
+import json
+import os
+import pstats
+import re
+
+try:
+    import pyinstrument
+    from pyinstrument.renderers import HTMLRenderer, PstatsRenderer
+except ImportError:
+    pyinstrument = None
+
+
+PROFILE_ENABLED = os.getenv("HR_AGENT_PROFILE", "false").lower() in ("1", "true", "yes")
+PROFILE_DIR = os.getenv("HR_AGENT_PROFILE_DIR", "profiles")
+PROFILE_TOP_N = int(float(os.getenv("HR_AGENT_PROFILE_TOP_N", 15)))
+# Interval sampling pyinstrument dalam detik.
+PROFILE_INTERVAL_SECONDS = float(os.getenv("HR_AGENT_PROFILE_INTERVAL", 0.001))
+
+# Pola path file -> kelompok waktu yang biasanya dicurigai saat run lambat.
+_LIBRARY_PATTERNS = [
+    ('google_discovery_build', re.compile(r'googleapiclient[/\\](discovery|schema|model)')),
+    ('dateutil', re.compile(r'dateutil[/\\]')),
+    ('pymupdf', re.compile(r'(fitz|pymupdf)[/\\]|_mupdf|<built-in> (page|document|pixmap|textpage)_')),
+    ('gemini_langchain', re.compile(r'langchain|google[/\\](genai|ai[/\\]generativelanguage)|grpc|proto[/\\]')),
+    ('network_http', re.compile(r'httplib2|httpx|httpcore|ssl|socket|http[/\\]client|urllib3|requests[/\\]')),
+    ('json', re.compile(r'json[/\\]')),
+]
+
+
+def is_requested(flag) -> bool:
+    """True jika profiling diminta lewat parameter request (`1`, `true`, `yes`) atau HR_AGENT_PROFILE."""
+    return PROFILE_ENABLED or str(flag or '').lower() in ("1", "true", "yes")
+
+
+def _artifact_base(label: str) -> str:
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    timestamp = datetime.datetime.now().strftime('%Y%m%d-%H%M%S-%f')
+    safe_label = re.sub(r'[^A-Za-z0-9_.-]+', '_', label or 'run')
+    return os.path.join(PROFILE_DIR, f"{timestamp}_{safe_label}")
+
+
+def _function_name(func_key: tuple) -> str:
+    filename, line, name = func_key
+    if filename == '~':
+        return name
+    # Path pustaka dipendekkan mulai dari nama paketnya.
+    filename = re.split(r'[/\\](?:site|dist)-packages[/\\]', filename)[-1]
+    if os.path.isabs(filename):
+        filename = os.path.relpath(filename)
+    return f"{filename}:{line}({name})"
+
+
+def summarize_pstats(stats: pstats.Stats, top_n: int = None) -> dict:
+    """Top-N fungsi berdasarkan waktu sendiri, plus total waktu sendiri per kelompok pustaka."""
+    top_n = top_n or PROFILE_TOP_N
+    rows = []
+    by_library = {name: 0.0 for name, _ in _LIBRARY_PATTERNS}
+    for func_key, (primitive_calls, total_calls, self_seconds, cumulative_seconds, _) in stats.stats.items():
+        rows.append((self_seconds, cumulative_seconds, total_calls, func_key))
+        location = f"{func_key[0]} {func_key[2]}"
+        for name, pattern in _LIBRARY_PATTERNS:
+            if pattern.search(location):
+                by_library[name] += self_seconds
+                break
+
+    rows.sort(key=lambda row: -row[0])
+    return {
+        "total_seconds": round(stats.total_tt, 4),
+        "hotspots": [{
+            "function": _function_name(func_key),
+            # pyinstrument adalah sampling profiler dan tidak menghitung panggilan (-1 di pstats).
+            "calls": calls if calls >= 0 else None,
+            "self_seconds": round(self_seconds, 4),
+            "cumulative_seconds": round(cumulative_seconds, 4),
+        } for self_seconds, cumulative_seconds, calls, func_key in rows[:top_n]],
+        "self_seconds_by_library": {name: round(seconds, 4) for name, seconds in by_library.items()},
+    }
+
+
+def _write_fallback_html(path: str, summary: dict, label: str):
+    rows = "\n".join(
+        f"<tr><td>{html.escape(row['function'])}</td><td>{row['calls']}</td>"
+        f"<td>{row['self_seconds']:.4f}</td><td>{row['cumulative_seconds']:.4f}</td></tr>"
+        for row in summary["hotspots"])
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(f"<html><head><meta charset='utf-8'><title>Profil {html.escape(label)}</title></head><body>"
+                f"<h1>Profil run agen HRD: {html.escape(label)}</h1>"
+                f"<p>pyinstrument tidak terpasang, flame graph tidak tersedia. Buka file .pstats dengan "
+                f"<code>snakeviz</code> atau pasang pyinstrument.</p>"
+                f"<table border='1' cellpadding='4'><tr><th>Fungsi</th><th>Panggilan</th>"
+                f"<th>Waktu sendiri (s)</th><th>Kumulatif (s)</th></tr>{rows}</table></body></html>")
+
+
+def profile_call(func, *args, label: str = 'run', **kwargs) -> tuple:
+    """
+    Menjalankan `func(*args, **kwargs)` di bawah profiler. Mengembalikan (hasil, ringkasan_profil).
+    Exception dari `func` diteruskan setelah artefak profil ditulis.
+    """
+    base = _artifact_base(label)
+    html_path, pstats_path = f"{base}.html", f"{base}.pstats"
+
+    if pyinstrument is not None:
+        profiler = pyinstrument.Profiler(interval=PROFILE_INTERVAL_SECONDS)
+        profiler.start()
+        try:
+            result = func(*args, **kwargs)
+        finally:
+            session = profiler.stop()
+            with open(html_path, 'w', encoding='utf-8') as f:
+                f.write(HTMLRenderer().render(session))
+            with open(pstats_path, 'w', encoding='utf-8', errors='surrogateescape') as f:
+                f.write(PstatsRenderer().render(session))
+        profiler_name = "pyinstrument"
+    else:
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            result = func(*args, **kwargs)
+        finally:
+            profiler.disable()
+            profiler.dump_stats(pstats_path)
+        profiler_name = "cProfile"
+
+    summary = summarize_pstats(pstats.Stats(pstats_path, stream=io.StringIO()))
+    if profiler_name == "cProfile":
+        _write_fallback_html(html_path, summary, label)
+    print(f"Profil run disimpan: {html_path} dan {pstats_path}")
+    return result, {"profiler": profiler_name, "html": html_path, "pstats": pstats_path, **summary}
+
+
+def profile_json_call(func, *args, label: str = 'run', **kwargs) -> str:
+    """
+    Seperti profile_call untuk fungsi yang mengembalikan ringkasan JSON (run_agent_process):
+    laporan profil disisipkan sebagai kunci "profile" pada ringkasan tersebut.
+    """
+    output, report = profile_call(func, *args, label=label, **kwargs)
+    summary = json.loads(output)
+    summary["profile"] = report
+    return json.dumps(summary)
@@ -0,0 +1,363 @@
+"""
+Pembatas laju (token bucket) dan backoff adaptif untuk semua panggilan Google API dan Gemini.
+
+Setiap API memiliki satu atau beberapa bucket kuota, misalnya ('gmail', 'send') terpisah dari
+('gmail', 'default') karena pengiriman email memakai kuota yang jauh lebih besar.
+Batas bawaan bisa diganti lewat environment: RATE_LIMIT_<API>_<BUCKET>=<per_detik>[:<burst>],
+contoh RATE_LIMIT_GEMINI_DEFAULT=1:5.
+"""
+import asyncio
+import collections
+import os
+import random
+import re
+import threading
+import time
+import datetime
+from email.utils import parsedate_to_datetime
+
+from googleapiclient.errors import HttpError
+
+import metrics
+
+try:
+    from google.api_core import exceptions as google_exceptions
+except ImportError:
+    google_exceptions = None
+
+
+# (permintaan per detik, kapasitas burst) per (api, bucket).
+DEFAULT_LIMITS = {
+    ('gmail', 'default'): (40.0, 40),
+    ('gmail', 'send'): (2.0, 5),
+    ('calendar', 'default'): (5.0, 10),
+    ('sheets', 'default'): (1.0, 5),
+    ('gemini', 'default'): (0.25, 1),
+}
+
+def _get_env_number(name: str, default: float) -> float:
+    try:
+        return float(os.getenv(name, default))
+    except (TypeError, ValueError):
+        return default
+
+MAX_RETRIES = int(_get_env_number("RATE_LIMIT_MAX_RETRIES", 5))
+BACKOFF_BASE_SECONDS = _get_env_number("RATE_LIMIT_BACKOFF_BASE_SECONDS", 1.0)
+BACKOFF_MAX_SECONDS = _get_env_number("RATE_LIMIT_BACKOFF_MAX_SECONDS", 60.0)
+
+# Laju tidak pernah diturunkan di bawah pecahan ini dari laju dasar saat terkena 429.
+_MIN_RATE_FRACTION = 0.1
+
+
+class RetryableError(Exception):
+    """
+    Kegagalan sementara (kuota habis, 429, 5xx) yang masih gagal setelah semua percobaan ulang.
+    Pemanggil harus menunda pekerjaan ini, bukan menggantinya dengan hasil palsu.
+    """
+    def __init__(self, api: str, message: str, retry_after: float = None):
+        super().__init__(f"[{api}] {message}")
+        self.api = api
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    """
+    Token bucket yang aman untuk banyak thread dengan laju adaptif:
+    laju dipotong setengah saat API membalas 429 dan pulih perlahan setelah panggilan berhasil.
+    """
+    def __init__(self, rate: float, burst: int):
+        self.base_rate = rate
+        self.rate = rate
+        self.capacity = max(1, burst)
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self) -> float:
+        """Memesan satu token dan mengembalikan berapa detik pemanggil harus menunggu."""
+        with self.lock:
+            self._refill(time.monotonic())
+            self.tokens -= 1
+            if self.tokens >= 0:
+                return 0.0
+            return -self.tokens / self.rate
+
+    def acquire(self) -> float:
+        """Menunggu hingga token tersedia. Mengembalikan lama menunggu dalam detik."""
+        wait = self.reserve()
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+    async def acquire_async(self) -> float:
+        """Seperti `acquire`, tetapi menunggu dengan asyncio.sleep agar event loop tidak terblokir."""
+        wait = self.reserve()
+        if wait > 0:
+            await asyncio.sleep(wait)
+        return wait
+
+    def throttle(self):
+        with self.lock:
+            self.rate = max(self.base_rate * _MIN_RATE_FRACTION, self.rate / 2)
+
+    def recover(self):
+        with self.lock:
+            self.rate = min(self.base_rate, self.rate + self.base_rate * 0.1)
+
+
+class FairShareQueue:
+    """
+    Membagi satu token bucket global secara round-robin di antara beberapa tenant.
+    Hanya satu pemanggil yang menunggu token pada satu waktu; pemanggil berikutnya dipilih dari
+    tenant lain yang sedang antre, sehingga tenant yang sibuk tidak bisa menghabiskan kuota bersama
+    dan membuat tenant lain kelaparan.
+    """
+    def __init__(self, api: str, bucket: str):
+        self.api = api
+        self.bucket = bucket
+        self._condition = threading.Condition()
+        self._rotation = collections.deque()
+        self._waiting = collections.Counter()
+        self._busy = False
+
+    def acquire(self, tenant: str) -> float:
+        """Menunggu giliran tenant lalu satu token bucket. Mengembalikan total lama menunggu."""
+        start = time.monotonic()
+        with self._condition:
+            self._waiting[tenant] += 1
+            if tenant not in self._rotation:
+                self._rotation.append(tenant)
+            while self._busy or self._rotation[0] != tenant:
+                self._condition.wait()
+            self._busy = True
+            self._rotation.popleft()
+            self._waiting[tenant] -= 1
+            if self._waiting[tenant]:
+                self._rotation.append(tenant)
+            else:
+                del self._waiting[tenant]
+        try:
+            get_bucket(self.api, self.bucket).acquire()
+        finally:
+            with self._condition:
+                self._busy = False
+                self._condition.notify_all()
+        return time.monotonic() - start
+
+
+_STAT_KEYS = ("calls", "wait_seconds", "backoff_seconds", "retries", "throttled", "failures")
+
+_buckets = {}
+_stats = {}
+_fair_queues = {}
+_tenant_stats = {}
+_registry_lock = threading.Lock()
+
+def _limit_from_env(api: str, bucket: str):
+    value = os.getenv(f"RATE_LIMIT_{api.upper()}_{bucket.upper()}")
+    if not value:
+        return None
+    try:
+        rate, _, burst = value.partition(':')
+        return float(rate), int(burst or max(1, float(rate)))
+    except ValueError:
+        print(f"Nilai RATE_LIMIT_{api.upper()}_{bucket.upper()} tidak valid: {value}")
+        return None
+
+def get_bucket(api: str, bucket: str = 'default') -> TokenBucket:
+    """Mengambil (atau membuat) token bucket untuk pasangan (api, bucket)."""
+    key = (api, bucket)
+    with _registry_lock:
+        if key not in _buckets:
+            rate, burst = _limit_from_env(api, bucket) or DEFAULT_LIMITS.get(key) or DEFAULT_LIMITS.get((api, 'default'), (10.0, 10))
+            _buckets[key] = TokenBucket(rate, burst)
+            _stats[key] = dict.fromkeys(_STAT_KEYS, 0)
+        return _buckets[key]
+
+def configure_limit(api: str, bucket: str, rate: float, burst: int):
+    """Mengganti batas laju untuk satu bucket (misalnya dari benchmark atau konfigurasi tenant)."""
+    get_bucket(api, bucket)
+    with _registry_lock:
+        _buckets[(api, bucket)] = TokenBucket(rate, burst)
+
+def get_fair_queue(api: str, bucket: str = 'default') -> FairShareQueue:
+    with _registry_lock:
+        if (api, bucket) not in _fair_queues:
+            _fair_queues[(api, bucket)] = FairShareQueue(api, bucket)
+        return _fair_queues[(api, bucket)]
+
+def acquire(api: str, bucket: str = 'default') -> float:
+    """
+    Mengambil satu token tanpa menjalankan fungsi (untuk pemanggil yang mengirim beberapa request
+    sekaligus, misalnya batch Gmail). Mengembalikan lama menunggu dalam detik.
+    """
+    token_bucket = get_bucket(api, bucket)
+    waited = token_bucket.acquire()
+    _record_wait((api, bucket), waited)
+    return waited
+
+def get_tenant_stats() -> dict:
+    """Jumlah panggilan dan waktu tunggu per tenant untuk bucket yang dibagi adil, {"api.bucket": {tenant: {...}}}."""
+    with _registry_lock:
+        result = {}
+        for (api, bucket, tenant), stats in _tenant_stats.items():
+            result.setdefault(f"{api}.{bucket}", {})[tenant] = dict(stats)
+        return result
+
+def get_limiter_stats() -> dict:
+    """
+    Statistik kumulatif per bucket sejak proses dimulai: jumlah panggilan, waktu tunggu limiter,
+    backoff, retry, dan kegagalan.
+    """
+    with _registry_lock:
+        return {
+            f"{api}.{bucket}": dict(stats, current_rate=round(_buckets[(api, bucket)].rate, 3))
+            for (api, bucket), stats in _stats.items()
+        }
+
+def get_run_limiter_stats(run_metrics: metrics.StageMetrics) -> dict:
+    """
+    Statistik per bucket yang hanya berisi panggilan milik satu run agen (lihat metrics.begin_run),
+    sehingga tenant yang berjalan paralel tidak saling menghitung panggilan tenant lain.
+    """
+    run_counts = run_metrics.counts_snapshot()
+    with _registry_lock:
+        return {
+            name: dict(dict.fromkeys(_STAT_KEYS, 0), **run_counts[name], current_rate=round(token_bucket.rate, 3))
+            for name, token_bucket in ((f"{api}.{bucket}", token_bucket) for (api, bucket), token_bucket in _buckets.items())
+            if name in run_counts
+        }
+
+def _parse_retry_after(value) -> float:
+    """Retry-After bisa berupa jumlah detik atau tanggal HTTP."""
+    if value is None:
+        return None
+    try:
+        return max(0.0, float(value))
+    except (TypeError, ValueError):
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+        return max(0.0, (retry_at - datetime.datetime.now(retry_at.tzinfo)).total_seconds())
+    except (TypeError, ValueError):
+        return None
+
+def classify_error(error: Exception) -> tuple:
+    """
+    Mengembalikan (bisa_diulang, kena_batas_laju, retry_after_detik) untuk sebuah exception.
+    """
+    if isinstance(error, HttpError):
+        status = int(getattr(error.resp, 'status', 0) or 0)
+        content = error.content.decode('utf-8', 'ignore') if isinstance(error.content, bytes) else str(error.content)
+        rate_limited = status == 429 or (status == 403 and re.search(r'[rR]ateLimitExceeded', content) is not None)
+        retry_after = _parse_retry_after(error.resp.get('retry-after')) if hasattr(error.resp, 'get') else None
+        return rate_limited or status >= 500, rate_limited, retry_after
+
+    if google_exceptions is not None:
+        if isinstance(error, (google_exceptions.TooManyRequests, google_exceptions.ResourceExhausted)):
+            return True, True, _retry_delay_from_message(str(error))
+        if isinstance(error, (google_exceptions.ServerError, google_exceptions.DeadlineExceeded)):
+            return True, False, None
+
+    if isinstance(error, (TimeoutError, ConnectionError)):
+        return True, False, None
+
+    # Error Gemini yang dibungkus LangChain hanya bisa dikenali dari pesannya.
+    message = str(error)
+    if re.search(r'\b429\b|RESOURCE_EXHAUSTED|quota|rate limit', message, re.IGNORECASE):
+        return True, True, _retry_delay_from_message(message)
+    if re.search(r'\b50[0234]\b|UNAVAILABLE|DEADLINE_EXCEEDED', message):
+        return True, False, None
+    return False, False, None
+
+def _retry_delay_from_message(message: str) -> float:
+    match = re.search(r'retry(?:_delay)?\D{0,20}?(\d+(?:\.\d+)?)\s*s', message, re.IGNORECASE)
+    return float(match.group(1)) if match else None
+
+def _record(key: tuple, **amounts):
+    """Menambah statistik kumulatif bucket dan statistik run agen yang aktif di konteks ini."""
+    with _registry_lock:
+        stats = _stats[key]
+        for name, value in amounts.items():
+            stats[name] += value
+    run_metrics = metrics.current_run()
+    if run_metrics is not None:
+        run_metrics.add_counts(f"{key[0]}.{key[1]}", amounts)
+
+def _record_wait(key: tuple, waited: float, tenant: str = None):
+    _record(key, calls=1, wait_seconds=waited)
+    if tenant is not None:
+        with _registry_lock:
+            tenant_stats = _tenant_stats.setdefault(key + (tenant,), {"calls": 0, "wait_seconds": 0.0})
+            tenant_stats["calls"] += 1
+            tenant_stats["wait_seconds"] += waited
+
+def _backoff_after_error(api: str, bucket: str, token_bucket: TokenBucket,
+                         error: Exception, attempt: int, max_retries: int) -> float:
+    """
+    Menentukan nasib percobaan yang gagal: melempar ulang error yang tidak bisa diulang,
+    melempar RetryableError pada percobaan terakhir, atau mengembalikan lama backoff.
+    Harus dipanggil dari dalam blok `except`.
+    """
+    retryable, rate_limited, retry_after = classify_error(error)
+    if not retryable:
+        raise
+    if rate_limited:
+        token_bucket.throttle()
+    if attempt == max_retries:
+        _record((api, bucket), failures=1)
+        raise RetryableError(api, f"Gagal setelah {max_retries + 1} percobaan: {error}", retry_after) from error
+
+    delay = retry_after
+    if delay is None:
+        delay = random.uniform(0.5, 1.0) * min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * (2 ** attempt))
+    delay = min(delay, BACKOFF_MAX_SECONDS)
+    _record((api, bucket), retries=1, throttled=1 if rate_limited else 0, backoff_seconds=delay)
+    print(f"[{api}.{bucket}] Error sementara, mencoba lagi dalam {delay:.1f} detik: {error}")
+    return delay
+
+def call_with_backoff(api: str, func, bucket: str = 'default', max_retries: int = None, tenant: str = None):
+    """
+    Menjalankan `func` setelah mendapat token dari bucket (api, bucket).
+    Error sementara diulang dengan backoff eksponensial (dengan jitter) yang menghormati Retry-After.
+    Jika tetap gagal, RetryableError dilempar; error lain diteruskan apa adanya.
+    Jika `tenant` diisi, token dibagi round-robin antar-tenant lewat FairShareQueue.
+    """
+    max_retries = MAX_RETRIES if max_retries is None else max_retries
+    token_bucket = get_bucket(api, bucket)
+    fair_queue = get_fair_queue(api, bucket) if tenant is not None else None
+
+    for attempt in range(max_retries + 1):
+        if fair_queue is not None:
+            _record_wait((api, bucket), fair_queue.acquire(tenant), tenant)
+        else:
+            _record_wait((api, bucket), token_bucket.acquire())
+        try:
+            result = func()
+        except Exception as e:
+            time.sleep(_backoff_after_error(api, bucket, token_bucket, e, attempt, max_retries))
+        else:
+            token_bucket.recover()
+            return result
+
+async def call_with_backoff_async(api: str, coroutine_factory, bucket: str = 'default', max_retries: int = None):
+    """
+    Versi asyncio dari `call_with_backoff` dengan bucket dan statistik yang sama.
+    `coroutine_factory` dipanggil ulang pada setiap percobaan dan harus mengembalikan coroutine baru.
+    """
+    max_retries = MAX_RETRIES if max_retries is None else max_retries
+    token_bucket = get_bucket(api, bucket)
+
+    for attempt in range(max_retries + 1):
+        _record_wait((api, bucket), await token_bucket.acquire_async())
+        try:
+            result = await coroutine_factory()
+        except Exception as e:
+            await asyncio.sleep(_backoff_after_error(api, bucket, token_bucket, e, attempt, max_retries))
+        else:
+            token_bucket.recover()
+            return result
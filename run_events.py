@@ -0,0 +1,112 @@
+"""
+Log event per run agen untuk dashboard (Server-Sent Events).
+
+Run dimulai dengan POST /run-hr-agent/stream dan mendapat `run_id`. Event run tersebut (started,
+screened, scheduled, ..., summary) ditambahkan sebagai satu baris JSON per event ke
+`<HR_AGENT_RUN_EVENTS_DIR>/<run_id>.jsonl`. GET /run-hr-agent/stream/<run_id> hanya membaca file
+itu, sehingga stream bisa dilayani worker gunicorn mana pun (bukan hanya worker yang menjalankan agen),
+dan klien yang tersambung ulang melanjutkan dari event terakhir yang diterimanya tanpa memulai run baru.
+"""
+import json
+import os
+import re
+import threading
+import time
+import uuid
+
+
+RUN_EVENTS_DIR = os.getenv("HR_AGENT_RUN_EVENTS_DIR", "run_events")
+RUN_EVENTS_RETENTION_HOURS = float(os.getenv("HR_AGENT_RUN_EVENTS_RETENTION_HOURS", 24))
+# Jika file run tidak bertambah selama ini (misalnya proses yang menjalankan agen mati), stream diakhiri.
+# Disamakan dengan batas waktu worker gunicorn.
+RUN_EVENTS_STALE_SECONDS = float(os.getenv("HR_AGENT_RUN_EVENTS_STALE_SECONDS", 900))
+POLL_INTERVAL_SECONDS = 0.25
+
+_RUN_ID_PATTERN = re.compile(r"^[0-9a-f]{32}$")
+
+
+class RunEventLog:
+    """File event per run. Penulisnya thread run agen; pembacanya stream SSE di worker mana pun."""
+
+    def __init__(self, directory: str = None):
+        self.directory = directory or RUN_EVENTS_DIR
+        self._lock = threading.Lock()
+
+    def _path(self, run_id: str) -> str:
+        return os.path.join(self.directory, f"{run_id}.jsonl")
+
+    def exists(self, run_id: str) -> bool:
+        return bool(_RUN_ID_PATTERN.match(run_id or "")) and os.path.exists(self._path(run_id))
+
+    def create(self) -> str:
+        """Membuat file event kosong untuk run baru dan mengembalikan `run_id`-nya."""
+        os.makedirs(self.directory, exist_ok=True)
+        self.prune()
+        run_id = uuid.uuid4().hex
+        with open(self._path(run_id), 'x', encoding='utf-8'):
+            pass
+        return run_id
+
+    def append(self, run_id: str, event_type: str, data: dict):
+        # Satu baris ditulis dalam satu write agar pembaca tidak melihat event setengah jadi.
+        line = json.dumps({"event": event_type, "data": data}) + "\n"
+        with self._lock:
+            with open(self._path(run_id), 'a', encoding='utf-8') as f:
+                f.write(line)
+
+    def follow(self, run_id: str, after: int = 0, idle_seconds: float = 15):
+        """
+        Menghasilkan (nomor_event, jenis_event, data) mulai dari event setelah nomor `after`
+        (nomor dimulai dari 1), sampai event 'summary'. Jika tidak ada event baru selama
+        `idle_seconds`, menghasilkan None (untuk komentar keep-alive SSE). File yang tidak bertambah
+        selama RUN_EVENTS_STALE_SECONDS diakhiri dengan 'summary' berstatus error.
+        """
+        index = 0
+        buffer = ""
+        last_yield = time.monotonic()
+        with open(self._path(run_id), 'r', encoding='utf-8') as f:
+            while True:
+                chunk = f.read()
+                if chunk:
+                    buffer += chunk
+                    # Baris terakhir tanpa "\n" mungkin masih ditulis; disimpan sampai lengkap.
+                    *lines, buffer = buffer.split("\n")
+                    for line in lines:
+                        if not line.strip():
+                            continue
+                        index += 1
+                        event = json.loads(line)
+                        if index > after:
+                            yield index, event["event"], event["data"]
+                            last_yield = time.monotonic()
+                        if event["event"] == 'summary':
+                            return
+                    continue
+
+                if time.time() - os.fstat(f.fileno()).st_mtime >= RUN_EVENTS_STALE_SECONDS:
+                    # Klien tetap menerima akhir stream agar tidak terus menyambung ulang.
+                    yield index + 1, 'summary', {
+                        "status": "error",
+                        "message": "Run berhenti tanpa ringkasan (proses agen kemungkinan mati)."
+                    }
+                    return
+                now = time.monotonic()
+                if now - last_yield >= idle_seconds:
+                    yield None
+                    last_yield = now
+                time.sleep(POLL_INTERVAL_SECONDS)
+
+    def prune(self):
+        """Menghapus file event run yang lebih lama dari masa simpan."""
+        cutoff = time.time() - RUN_EVENTS_RETENTION_HOURS * 3600
+        try:
+            names = os.listdir(self.directory)
+        except OSError:
+            return
+        for name in names:
+            path = os.path.join(self.directory, name)
+            try:
+                if name.endswith(".jsonl") and os.path.getmtime(path) < cutoff:
+                    os.remove(path)
+            except OSError:
+                pass
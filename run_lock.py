@@ -0,0 +1,86 @@
+"""
+Kunci "satu run agen aktif" yang berlaku lintas thread dan lintas proses worker (gunicorn).
+
+Di dalam satu proses dipakai threading.Lock; antarproses dipakai `fcntl.flock` pada file kunci,
+sehingga dua worker tidak memproses kotak masuk yang sama bersamaan (email ganda, jadwal bentrok).
+Di platform tanpa fcntl (Windows, biasanya waitress satu proses) hanya kunci thread yang dipakai.
+
+Di samping file kunci disimpan nomor generasi run (`<file kunci>.generation`) yang dinaikkan setiap
+kali sebuah run selesai; cache baca di setiap worker dikaitkan dengan nomor ini.
+"""
+import os
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+
+RUN_LOCK_FILE = os.getenv("HR_AGENT_RUN_LOCK_FILE", "hr_agent_run.lock")
+
+
+class RunLock:
+    def __init__(self, path: str = None):
+        self.path = path or RUN_LOCK_FILE
+        self._thread_lock = threading.Lock()
+        self._file = None
+        self._generation_path = f"{self.path}.generation"
+
+    def acquire(self, blocking: bool = False, timeout: float = None) -> bool:
+        """
+        Mengambil kunci. Tanpa `blocking`, langsung mengembalikan False jika run lain sedang aktif;
+        dengan `blocking`, menunggu (paling lama `timeout` detik jika diisi).
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        if not self._thread_lock.acquire(blocking, -1 if timeout is None or not blocking else timeout):
+            return False
+        if fcntl is None:
+            return True
+        try:
+            lock_file = open(self.path, 'a+')
+        except OSError as e:
+            print(f"Gagal membuka file kunci {self.path}, hanya memakai kunci thread: {e}")
+            return True
+        while True:
+            try:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+                self._file = lock_file
+                return True
+            except BlockingIOError:
+                if not blocking or (deadline is not None and time.monotonic() >= deadline):
+                    lock_file.close()
+                    self._thread_lock.release()
+                    return False
+                time.sleep(0.2)
+
+    def release(self):
+        if self._file is not None:
+            fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+            self._file.close()
+            self._file = None
+        self._thread_lock.release()
+
+    def is_locked(self) -> bool:
+        return self._thread_lock.locked()
+
+    def generation(self) -> int:
+        """Nomor generasi run terakhir yang selesai (0 jika belum ada), sama untuk semua worker."""
+        try:
+            with open(self._generation_path, 'r', encoding='utf-8') as f:
+                return int(f.read().strip() or 0)
+        except (OSError, ValueError):
+            return 0
+
+    def bump_generation(self) -> int:
+        """Menaikkan nomor generasi. Dipanggil saat kunci masih dipegang agar tidak ada kenaikan yang hilang."""
+        generation = self.generation() + 1
+        temp_path = f"{self._generation_path}.{os.getpid()}.tmp"
+        try:
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                f.write(str(generation))
+            os.replace(temp_path, self._generation_path)
+        except OSError as e:
+            print(f"Gagal menyimpan generasi run ke {self._generation_path}: {e}")
+        return generation
@@ -0,0 +1,109 @@
+"""
+Konfigurasi multi-tenant (beberapa unit bisnis, masing-masing dengan kotak surat dan sheet sendiri).
+
+Setiap tenant di `tenants.json` (atau path di TENANTS_FILE) bisa memiliki:
+    id, name, email_address, token_file, credentials_file, spreadsheet_id, calendar_id,
+    job_descriptions_file, gmail_watch_state_file
+Field yang tidak diisi memakai pengaturan global agen. Tanpa file tersebut, agen berjalan
+dengan satu tenant 'default' yang perilakunya sama seperti sebelumnya (token.json, SPREADSHEET_ID).
+
+Tenant yang sedang diproses disimpan di contextvar, sehingga setiap thread/run bisa melayani
+tenant yang berbeda tanpa mengoper konfigurasi ke setiap fungsi.
+"""
+import contextvars
+import json
+import os
+from contextlib import contextmanager
+
+
+TENANTS_FILE = os.getenv("TENANTS_FILE", "tenants.json")
+
+DEFAULT_TENANT = {
+    "id": "default",
+    "name": "Default",
+    "email_address": None,
+    "token_file": "token.json",
+    "credentials_file": "credentials.json",
+    "spreadsheet_id": os.getenv("SPREADSHEET_ID", "ID_SHEET_ANDA"),
+    "calendar_id": os.getenv("CALENDAR_ID", "primary"),
+    "job_descriptions_file": None,
+    "gmail_watch_state_file": None,
+}
+
+_current_tenant = contextvars.ContextVar("hr_agent_tenant", default=None)
+
+_cache = {"mtime": None, "tenants": None}
+
+
+def load_tenants() -> list:
+    """
+    Memuat daftar tenant (di-cache sampai file berubah). Tenant tanpa token_file memakai
+    'token_<id>.json' dan tanpa gmail_watch_state_file memakai 'gmail_watch_state_<id>.json',
+    agar tidak saling menimpa.
+    """
+    try:
+        mtime = os.path.getmtime(TENANTS_FILE)
+    except OSError:
+        return [DEFAULT_TENANT]
+    if _cache["mtime"] != mtime:
+        _cache["tenants"] = _read_tenants_file()
+        _cache["mtime"] = mtime
+    return _cache["tenants"]
+
+
+def _read_tenants_file() -> list:
+    try:
+        with open(TENANTS_FILE, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+    except (OSError, json.JSONDecodeError) as e:
+        print(f"Gagal membaca {TENANTS_FILE}, memakai tenant default: {e}")
+        return [DEFAULT_TENANT]
+
+    tenants = []
+    entries = data.get('tenants', []) if isinstance(data, dict) else data
+    for entry in entries if isinstance(entries, list) else []:
+        if not isinstance(entry, dict) or not entry.get('id'):
+            print(f"Tenant tidak valid diabaikan: {entry}")
+            continue
+        tenant_id = str(entry['id'])
+        tenant = dict(DEFAULT_TENANT, name=tenant_id,
+                      token_file=f"token_{tenant_id}.json",
+                      gmail_watch_state_file=f"gmail_watch_state_{tenant_id}.json")
+        tenant.update({key: value for key, value in entry.items() if value is not None})
+        tenant['id'] = tenant_id
+        if 'spreadsheet_id' not in entry:
+            print(f"Peringatan: tenant '{tenant_id}' tidak memiliki spreadsheet_id, memakai {tenant['spreadsheet_id']}.")
+        tenants.append(tenant)
+
+    return tenants or [DEFAULT_TENANT]
+
+
+def get_tenant(tenant_id: str) -> dict:
+    """Mencari tenant berdasarkan id; None jika tidak ada."""
+    return next((tenant for tenant in load_tenants() if tenant['id'] == tenant_id), None)
+
+
+def find_tenant_by_email(email_address: str) -> dict:
+    """Mencari tenant pemilik kotak surat (dipakai untuk notifikasi push Gmail)."""
+    tenants = load_tenants()
+    if email_address:
+        for tenant in tenants:
+            if (tenant.get('email_address') or '').lower() == email_address.lower():
+                return tenant
+    # Satu-satunya tenant dianggap pemilik semua notifikasi (konfigurasi satu kotak surat).
+    return tenants[0] if len(tenants) == 1 else None
+
+
+def get_current_tenant() -> dict:
+    """Tenant yang sedang aktif di konteks ini; tenant pertama jika belum diatur."""
+    return _current_tenant.get() or load_tenants()[0]
+
+
+@contextmanager
+def use_tenant(tenant: dict):
+    """Menjalankan blok kode atas nama `tenant`."""
+    token = _current_tenant.set(tenant)
+    try:
+        yield tenant
+    finally:
+        _current_tenant.reset(token)
@@ -0,0 +1,27 @@
+from email_progress import EmailProgress
+from tenants import get_current_tenant, use_tenant
+
+
+def test_progress_is_shared_through_the_file_and_cleared(tmp_path):
+    store_path = str(tmp_path / "email_progress.json")
+    writer = EmailProgress(store_path)
+    writer.update("msg-1", verdict="COCOK", event=True, interview_time="2024-01-01 09:00")
+
+    # Worker atau run lain membaca file yang sama.
+    reader = EmailProgress(store_path)
+    progress = reader.get("msg-1")
+    assert (progress["verdict"], progress["event"]) == ("COCOK", True)
+
+    reader.update("msg-1", sheet=True)
+    assert writer.get("msg-1")["sheet"] is True
+
+    writer.clear("msg-1")
+    assert reader.get("msg-1") == {}
+
+
+def test_progress_is_scoped_per_tenant(tmp_path):
+    progress = EmailProgress(str(tmp_path / "email_progress.json"))
+    progress.update("msg-1", event=True)
+    other_tenant = dict(get_current_tenant(), id="tenant-lain")
+    with use_tenant(other_tenant):
+        assert progress.get("msg-1") == {}
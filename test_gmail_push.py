@@ -0,0 +1,52 @@
+import base64
+import json
+
+import pytest
+
+from gmail_push import NotificationDebouncer, decode_pubsub_envelope
+
+
+def _envelope(history_id, message_id="m-1"):
+    data = base64.b64encode(json.dumps({"emailAddress": "hr@example.com", "historyId": history_id}).encode())
+    return {"message": {"data": data.decode(), "messageId": message_id}}
+
+
+def test_decode_pubsub_envelope():
+    assert decode_pubsub_envelope(_envelope(1234)) == {
+        "email_address": "hr@example.com", "history_id": "1234", "message_id": "m-1"}
+    with pytest.raises(ValueError):
+        decode_pubsub_envelope({"message": {"data": "bukan-base64-json"}})
+
+
+def test_batches_notifications_and_ignores_redelivery():
+    batches = []
+    debouncer = NotificationDebouncer(lambda history_id, count: batches.append((history_id, count)),
+                                      delay_seconds=60, max_delay_seconds=60)
+    assert debouncer.add("10", "m-1")
+    assert debouncer.add("12", "m-2")
+    assert not debouncer.add("10", "m-1")
+
+    debouncer.flush_now()
+
+    assert batches == [("12", 2)]
+    assert debouncer.pending() == 0
+
+
+def test_failed_batch_is_requeued_with_next_notification():
+    batches = []
+
+    def callback(history_id, count):
+        batches.append((history_id, count))
+        if len(batches) == 1:
+            raise RuntimeError("Gmail tidak tersedia")
+
+    debouncer = NotificationDebouncer(callback, delay_seconds=60, max_delay_seconds=60)
+    debouncer.add("10", "m-1")
+    debouncer.flush_now()
+    assert debouncer.pending() == 1
+
+    debouncer.add("15", "m-2")
+    debouncer.flush_now()
+
+    assert batches == [("10", 1), ("15", 2)]
+    assert debouncer.pending() == 0
@@ -0,0 +1,52 @@
+import time
+
+import pytest
+
+import ocr
+
+
+@pytest.fixture
+def ocr_workers(monkeypatch):
+    monkeypatch.setattr(ocr, "OCR_MAX_WORKERS", 2)
+    monkeypatch.setattr(ocr, "OCR_TIMEOUT_SECONDS", 1.5)
+    ocr.reset_after_fork()
+    # Proses pekerja disiapkan dulu agar waktu start proses tidak ikut diukur.
+    for future in [ocr._submit(time.sleep, 0) for _ in range(2)]:
+        future.result(timeout=60)
+    yield
+    ocr.shutdown()
+    ocr.reset_after_fork()
+
+
+def test_queue_time_does_not_count_toward_timeout(ocr_workers):
+    # Empat pekerjaan 1 detik di dua pekerja: dua terakhir antre ~1 detik, totalnya melebihi batas 1.5 detik.
+    futures = [ocr._submit(time.sleep, 1.0) for _ in range(4)]
+    assert [future.result(timeout=30) for future in futures] == [None] * 4
+
+
+def test_timeout_stops_only_that_job(ocr_workers):
+    slow = ocr._submit(time.sleep, 10)
+    other = ocr._submit(time.sleep, 1.0)
+
+    with pytest.raises(TimeoutError):
+        slow.result(timeout=30)
+    assert other.result(timeout=30) is None
+    # Pekerja yang dihentikan dibuat ulang untuk pekerjaan berikutnya.
+    assert ocr._submit(divmod, 7, 2).result(timeout=60) == (3, 1)
+
+
+def test_cancel_running_job_leaves_others_running(ocr_workers):
+    cancelled = ocr._submit(time.sleep, 10)
+    other = ocr._submit(time.sleep, 1.0)
+    time.sleep(0.3)
+
+    ocr.cancel(cancelled)
+
+    with pytest.raises(RuntimeError):
+        cancelled.result(timeout=30)
+    assert other.result(timeout=30) is None
+
+
+def test_worker_errors_are_reported(ocr_workers):
+    with pytest.raises(RuntimeError, match="ZeroDivisionError"):
+        ocr._submit(divmod, 1, 0).result(timeout=30)
@@ -0,0 +1,61 @@
+import json
+
+import fakes
+from outbox import Outbox, render_message
+from tenants import get_current_tenant
+
+
+def _outbox(backend, store_path):
+    return Outbox(backend.services, store_path=str(store_path), batch_wait_seconds=0)
+
+
+def test_same_idempotency_key_is_sent_once(tmp_path):
+    backend = fakes.FakeGoogleBackend()
+    outbox = _outbox(backend, tmp_path / "outbox_store.json")
+
+    first = outbox.enqueue("msg-1:rejection", "kandidat@example.com", "rejection", name="Kandidat")
+    outbox.flush(timeout=10)
+    second = outbox.enqueue("msg-1:rejection", "kandidat@example.com", "rejection", name="Kandidat")
+    outbox.flush(timeout=10)
+
+    assert "masuk antrean" in first
+    assert "dilewati" in second
+    assert len(backend.sent_messages) == 1
+    stats = outbox.stats(get_current_tenant()['id'])
+    assert (stats["sent"], stats["duplicates_skipped"]) == (1, 1)
+
+
+def test_dedup_survives_restart(tmp_path):
+    backend = fakes.FakeGoogleBackend()
+    store_path = tmp_path / "outbox_store.json"
+    first = _outbox(backend, store_path)
+    first.enqueue("msg-2:invitation", "kandidat@example.com", "rejection", name="Kandidat")
+    first.flush(timeout=10)
+
+    restarted = _outbox(backend, store_path)
+    restarted.resume()
+    status = restarted.enqueue("msg-2:invitation", "kandidat@example.com", "rejection", name="Kandidat")
+    restarted.flush(timeout=10)
+
+    assert "dilewati" in status
+    assert len(backend.sent_messages) == 1
+
+
+def test_leftover_queued_email_sent_once_by_two_workers(tmp_path):
+    # Dua worker gunicorn memuat file yang sama berisi satu email 'queued' dari run sebelumnya.
+    backend = fakes.FakeGoogleBackend()
+    tenant_id = get_current_tenant()['id']
+    key = f"{tenant_id}:leftover-1:rejection"
+    subject, raw = render_message('rejection', 'kandidat@example.com', name='Kandidat')
+    store_path = tmp_path / "outbox_store.json"
+    store_path.write_text(json.dumps({key: {
+        "status": "queued", "tenant": tenant_id, "recipient": "kandidat@example.com",
+        "subject": subject, "raw": raw, "updated_at": "2000-01-01T00:00:00+00:00"}}))
+
+    workers = [_outbox(backend, store_path) for _ in range(2)]
+    for worker in workers:
+        worker.resume()
+        worker.flush(timeout=10)
+
+    assert len(backend.sent_messages) == 1
+    assert json.loads(store_path.read_text())[key]["status"] == "sent"
@@ -0,0 +1,90 @@
+import httplib2
+import pytest
+from googleapiclient.errors import HttpError
+
+import metrics
+import rate_limiter
+from rate_limiter import RetryableError, call_with_backoff, classify_error
+
+
+def _http_error(status: int, content: bytes = b"", retry_after: str = None) -> HttpError:
+    headers = {"status": status}
+    if retry_after is not None:
+        headers["retry-after"] = retry_after
+    return HttpError(httplib2.Response(headers), content)
+
+
+@pytest.fixture(autouse=True)
+def fast_limits(monkeypatch):
+    monkeypatch.setattr(rate_limiter, "BACKOFF_BASE_SECONDS", 0.001)
+    monkeypatch.setattr(rate_limiter, "BACKOFF_MAX_SECONDS", 0.01)
+    rate_limiter.configure_limit("testapi", "default", 1e9, 10 ** 9)
+
+
+@pytest.mark.parametrize("error, expected", [
+    (_http_error(429, retry_after="3"), (True, True, 3.0)),
+    (_http_error(403, b'{"reason": "rateLimitExceeded"}'), (True, True, None)),
+    (_http_error(503), (True, False, None)),
+    (_http_error(404), (False, False, None)),
+    (RuntimeError("429 RESOURCE_EXHAUSTED, retry in 7s"), (True, True, 7.0)),
+    (ValueError("format salah"), (False, False, None)),
+])
+def test_classify_error(error, expected):
+    assert classify_error(error) == expected
+
+
+def test_retries_transient_errors_then_succeeds():
+    calls = []
+
+    def flaky():
+        calls.append(1)
+        if len(calls) < 3:
+            raise _http_error(503)
+        return "ok"
+
+    assert call_with_backoff("testapi", flaky, max_retries=5) == "ok"
+    assert len(calls) == 3
+
+
+def test_raises_retryable_error_after_last_attempt():
+    def always_429():
+        raise _http_error(429)
+
+    with pytest.raises(RetryableError) as excinfo:
+        call_with_backoff("testapi", always_429, max_retries=2)
+    assert excinfo.value.api == "testapi"
+
+
+def test_non_retryable_error_is_not_retried():
+    calls = []
+
+    def not_found():
+        calls.append(1)
+        raise _http_error(404)
+
+    with pytest.raises(HttpError):
+        call_with_backoff("testapi", not_found, max_retries=5)
+    assert len(calls) == 1
+
+
+def test_throttle_halves_rate_and_recover_restores_it():
+    bucket = rate_limiter.TokenBucket(rate=10, burst=1)
+    bucket.throttle()
+    assert bucket.rate == 5
+    for _ in range(10):
+        bucket.recover()
+    assert bucket.rate == 10
+
+
+def test_run_stats_only_count_calls_of_that_run():
+    call_with_backoff("testapi", lambda: None)
+    run_metrics = metrics.begin_run()
+    try:
+        for _ in range(3):
+            call_with_backoff("testapi", lambda: None)
+    finally:
+        metrics.end_run(run_metrics)
+
+    run_stats = rate_limiter.get_run_limiter_stats(run_metrics)
+    assert run_stats["testapi.default"]["calls"] == 3
+    assert rate_limiter.get_limiter_stats()["testapi.default"]["calls"] >= 4
@@ -0,0 +1,23 @@
+from run_events import RunEventLog
+
+
+def test_follow_returns_events_until_summary_and_resumes(tmp_path):
+    log = RunEventLog(str(tmp_path))
+    run_id = log.create()
+    log.append(run_id, "started", {"total": 2})
+    log.append(run_id, "scheduled", {"email_id": "msg-1"})
+    log.append(run_id, "summary", {"completed": True})
+
+    events = list(log.follow(run_id))
+    assert [(index, event_type) for index, event_type, _ in events] == [
+        (1, "started"), (2, "scheduled"), (3, "summary")]
+    # Klien yang tersambung ulang dengan Last-Event-ID 2 hanya menerima sisanya.
+    assert [event_type for _, event_type, _ in log.follow(run_id, after=2)] == ["summary"]
+
+
+def test_exists_rejects_unknown_and_malformed_ids(tmp_path):
+    log = RunEventLog(str(tmp_path))
+    run_id = log.create()
+    assert log.exists(run_id)
+    assert not log.exists("0" * 32)
+    assert not log.exists("../" + run_id)
@@ -0,0 +1,74 @@
+from types import SimpleNamespace
+
+import pytest
+
+import hr_agent_real
+
+
+@pytest.mark.parametrize("raw, expected", [
+    ("SANGAT_COCOK", "SANGAT COCOK"),
+    ("sangat cocok", "SANGAT COCOK"),
+    ("KURANG_COCOK", "KURANG COCOK"),
+    ("Penilaian: KURANG COCOK.", "KURANG COCOK"),
+    ("COCOK", "COCOK"),
+    ("", "TIDAK DIKETAHUI"),
+    ("Maaf, saya tidak bisa menilai resume ini.", "TIDAK DIKETAHUI"),
+])
+def test_parse_screening_verdict(raw, expected):
+    assert hr_agent_real._parse_screening_verdict(raw) == expected
+
+
+def test_llm_error_is_unknown_not_cocok(monkeypatch):
+    def failing_llm(*args, **kwargs):
+        raise ValueError("respons rusak")
+
+    monkeypatch.setattr(hr_agent_real, "_invoke_llm", failing_llm)
+    assert hr_agent_real._analyze_and_screen_resume_logic("Data Scientist", "Python") == "TIDAK DIKETAHUI"
+
+
+def test_multi_role_verdicts_match_whole_role_id(monkeypatch):
+    roles = [
+        {"id": "engineer", "title": "Engineer", "description": "Python"},
+        {"id": "senior-engineer", "title": "Senior Engineer", "description": "Python"},
+        {"id": "analyst", "title": "Analyst", "description": "SQL"},
+    ]
+    output = "- ID senior-engineer (Senior Engineer): SANGAT_COCOK\nID engineer: KURANG_COCOK"
+    monkeypatch.setattr(hr_agent_real, "_invoke_llm", lambda *args, **kwargs: SimpleNamespace(content=output))
+
+    verdicts = hr_agent_real._analyze_and_screen_resume_multi_role_logic(roles, "Python")
+
+    assert verdicts == {"engineer": "KURANG COCOK", "senior-engineer": "SANGAT COCOK",
+                        "analyst": "TIDAK DIKETAHUI"}
+
+
+def test_prescreen_counts_skill_phrase_once():
+    # "machine learning" adalah satu frasa keterampilan, bukan ditambah "machine" dan "learning".
+    score = hr_agent_real._prescreen_score("machine learning", "Berpengalaman di machine learning.")
+    assert score == 1.0
+    assert hr_agent_real._prescreen_score("machine learning", "Operator machine di pabrik.") == 0.0
+
+
+def test_prescreen_never_auto_passes():
+    job = "Data Scientist Python SQL machine learning"
+    verdict, score = hr_agent_real._prescreen_resume_logic(job, job)
+    assert score == 1.0
+    assert verdict is None
+
+    verdict, _ = hr_agent_real._prescreen_resume_logic(job, "Kepala dapur, masakan nusantara, pastry.")
+    assert verdict == "KURANG COCOK"
+
+
+def test_unscreened_role_goes_to_manual_review(monkeypatch):
+    roles = [
+        {"id": "ds", "title": "Data Scientist", "description": "Python SQL machine learning"},
+        {"id": "da", "title": "Data Analyst", "description": "SQL Excel Tableau"},
+    ]
+    monkeypatch.setattr(hr_agent_real, "_analyze_and_screen_resume_multi_role_logic",
+                        lambda roles, resume_text, usage=None: {"ds": "KURANG COCOK", "da": "TIDAK DIKETAHUI"})
+    stats = {"auto_rejected": 0, "sent_to_llm": 0, "llm_calls_saved": 0}
+
+    role, verdict, locally_rejected = hr_agent_real._screen_resume_for_roles(
+        roles, "Python SQL Excel Tableau machine learning", stats)
+
+    assert (role["id"], verdict, locally_rejected) == ("da", "TIDAK DIKETAHUI", False)
+    assert stats["sent_to_llm"] == 1
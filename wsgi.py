@@ -0,0 +1,20 @@
+"""
+Entry point WSGI untuk produksi (menggantikan server development `python api.py`).
+
+    gunicorn -c gunicorn.conf.py wsgi:application
+    python wsgi.py                    # waitress (juga jalan di Windows)
+
+Pengaturan waitress: HOST (default 0.0.0.0), PORT (default 5000), WAITRESS_THREADS (default 8).
+"""
+import os
+
+from api import app
+
+application = app
+
+if __name__ == "__main__":
+    from waitress import serve
+
+    # Waitress berjalan dalam satu proses dengan banyak thread; state modul cukup diinisialisasi sekali.
+    serve(application, host=os.getenv("HOST", "0.0.0.0"), port=int(os.getenv("PORT", 5000)),
+          threads=int(os.getenv("WAITRESS_THREADS", 8)))